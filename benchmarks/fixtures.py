@@ -0,0 +1,199 @@
+''' Offline fixtures for the benchmarks, shaped like the responses the MLB services return.
+
+    Each fixture is generated deterministically, so runs on different machines see the same input.
+    A capture of a real response can take its place: run.py --record DIR writes every generated
+    fixture to DIR, and run.py --fixtures DIR reads any file found there instead of generating it. '''
+
+from datetime import datetime, timedelta
+import json
+import os
+import random
+
+SEGMENT_DURATION = 6.006 # seconds, what MLB.tv encodes at
+BREAK_SEGMENTS = 20 # about two minutes of ads
+BREAK_INTERVAL = 90 # segments between breaks, about one half inning
+
+PLAYLIST_SIZES = { # media playlist fixtures by name, in segments
+    "short": 600, # an hour, e.g. a rain shortened game
+    "nine": 1800, # a typical nine innings
+    "extra": 3000, # a long extra inning game
+}
+
+GAME_SIZES = { # schedule fixtures by name, in games
+    "slate": 15, # a full day
+    "week": 100,
+}
+
+TEAMS = [
+    ("Arizona Diamondbacks", "AZ", "Arizona"), ("Atlanta Braves", "ATL", "Atlanta"),
+    ("Baltimore Orioles", "BAL", "Baltimore"), ("Boston Red Sox", "BOS", "Boston"),
+    ("Chicago Cubs", "CHC", "Chicago"), ("Chicago White Sox", "CWS", "Chicago"),
+    ("Cincinnati Reds", "CIN", "Cincinnati"), ("Cleveland Guardians", "CLE", "Cleveland"),
+    ("Colorado Rockies", "COL", "Denver"), ("Detroit Tigers", "DET", "Detroit"),
+    ("Houston Astros", "HOU", "Houston"), ("Kansas City Royals", "KC", "Kansas City"),
+    ("Los Angeles Angels", "LAA", "Anaheim"), ("Los Angeles Dodgers", "LAD", "Los Angeles"),
+    ("Miami Marlins", "MIA", "Miami"), ("Milwaukee Brewers", "MIL", "Milwaukee"),
+    ("Minnesota Twins", "MIN", "Minneapolis"), ("New York Mets", "NYM", "Flushing"),
+    ("New York Yankees", "NYY", "Bronx"), ("Athletics", "ATH", "Sacramento"),
+    ("Philadelphia Phillies", "PHI", "Philadelphia"), ("Pittsburgh Pirates", "PIT", "Pittsburgh"),
+    ("San Diego Padres", "SD", "San Diego"), ("San Francisco Giants", "SF", "San Francisco"),
+    ("Seattle Mariners", "SEA", "Seattle"), ("St. Louis Cardinals", "STL", "St. Louis"),
+    ("Tampa Bay Rays", "TB", "St. Petersburg"), ("Texas Rangers", "TEX", "Arlington"),
+    ("Toronto Blue Jays", "TOR", "Toronto"), ("Washington Nationals", "WSH", "Washington"),
+]
+
+GAME_START = datetime(2025, 7, 10, 23, 5)
+
+def master_playlist():
+    ''' A master playlist with the variants and audio renditions MLB.tv offers. '''
+    lines = ["#EXTM3U", "#EXT-X-INDEPENDENT-SEGMENTS",
+             '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aac",LANGUAGE="en",NAME="English",AUTOSELECT=YES,DEFAULT=YES,URI="audio/en.m3u8"',
+             '#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aac",LANGUAGE="es",NAME="Spanish",AUTOSELECT=YES,DEFAULT=NO,URI="audio/es.m3u8"']
+    variants = [(192, 108, 30), (416, 234, 30), (640, 360, 30), (960, 540, 30), (1280, 720, 30), (1280, 720, 60), (1920, 1080, 60)]
+    for i, (width, height, fps) in reversed(list(enumerate(variants))):
+        bandwidth = int(width * height * fps * .09)
+        lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},AVERAGE-BANDWIDTH={int(bandwidth * .8)},'
+                     f'CODECS="avc1.64001f,mp4a.40.2",RESOLUTION={width}x{height},FRAME-RATE={fps}.000,AUDIO="aac"')
+        lines.append(f"{height}p{fps}/playlist.m3u8?token=st=1752188700~exp=1752275100~acl=*~hmac={i:064x}")
+    return "\n".join(lines) + "\n"
+
+def media_playlist(segments):
+    ''' A finished game's media playlist: encrypted segments, a program date time on each, and cue tags
+        around a break every half inning. '''
+    rnd = random.Random(segments)
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:7", "#EXT-X-MEDIA-SEQUENCE:1",
+             "#EXT-X-PLAYLIST-TYPE:EVENT"]
+    t = GAME_START
+    key = 0
+    for i in range(segments):
+        if i % 300 == 0:
+            key += 1
+            lines.append(f'#EXT-X-KEY:METHOD=AES-128,URI="https://playback.svcs.mlb.com/silk/keys/{key:032x}",IV=0x{key:032x}')
+        position = i % BREAK_INTERVAL
+        if position == BREAK_INTERVAL - BREAK_SEGMENTS:
+            lines.append(f"#EXT-X-CUE-OUT:{BREAK_SEGMENTS * SEGMENT_DURATION:.3f}")
+        elif position > BREAK_INTERVAL - BREAK_SEGMENTS:
+            lines.append(f"#EXT-X-CUE-OUT-CONT:{(position - BREAK_INTERVAL + BREAK_SEGMENTS) * SEGMENT_DURATION:.3f}/{BREAK_SEGMENTS * SEGMENT_DURATION:.3f}")
+        elif position == 0 and i:
+            lines.append("#EXT-X-CUE-IN")
+
+        duration = SEGMENT_DURATION if rnd.random() > .02 else round(rnd.uniform(1, SEGMENT_DURATION), 3)
+        lines.append(f"#EXT-X-PROGRAM-DATE-TIME:{t.isoformat(timespec='milliseconds')}Z")
+        lines.append(f"#EXTINF:{duration:.3f},")
+        lines.append(f"{GAME_START:%Y%m%d}/{i // 600:02d}/segment_{i:05d}.ts")
+        t += timedelta(seconds=duration)
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+def media_info(innings=9):
+    ''' The mediaInfo graphql response, with a milestone at each edge of every half inning. '''
+    milestones = [{"milestoneType": "BROADCAST_START", "relativeTime": 0, "absoluteTime": "2025-07-10T23:00:00Z",
+                   "title": "Broadcast Start", "keywords": []},
+                  {"milestoneType": "STREAM_START", "relativeTime": 30, "absoluteTime": "2025-07-10T23:00:30Z",
+                   "title": "Stream Start", "keywords": []}]
+    t = 300
+    for inning in range(1, innings + 1):
+        for top in ("true", "false"):
+            for edge in ("Start", "End"):
+                milestones.append({
+                    "milestoneType": "INNING_START" if edge == "Start" else "INNING_END",
+                    "relativeTime": t,
+                    "absoluteTime": (GAME_START + timedelta(seconds=t)).isoformat() + "Z",
+                    "title": f"{'Top' if top == 'true' else 'Bottom'} {inning} {edge}",
+                    "keywords": [{"name": "inning", "value": str(inning)}, {"name": "top", "value": top},
+                                 {"name": "gamePk", "value": "776543"}]
+                })
+                t += 540 if edge == "Start" else 120
+    milestones.append({"milestoneType": "STREAM_STOP", "relativeTime": t + 600, "absoluteTime": None,
+                       "title": "Stream Stop", "keywords": []})
+    return json.dumps({"data": {"mediaInfo": [{"contentId": "c0", "mediaId": "m0", "milestones": milestones}]}})
+
+def _broadcast(rnd, game_pk, i, side, kind, availability):
+    return {
+        "id": game_pk * 10 + i,
+        "name": f"{rnd.choice(['MLB.TV', 'Bally Sports', 'NBC Sports', 'MASN', 'SportsNet'])} Presented by Sponsor",
+        "type": kind,
+        "language": "en" if i < 4 else "es",
+        "isNational": availability == "National",
+        "homeAway": side,
+        "freeGame": False,
+        "availableForStreaming": kind != "AM" or i % 2 == 0,
+        "mediaId": f"{game_pk:08x}-{i:04x}-4000-8000-{game_pk * 7 + i:012x}",
+        "mediaState": {"mediaStateCode": "MEDIA_ARCHIVE", "mediaStateText": "Media Archive"},
+        "availability": {"availabilityId": 1, "availabilityCode": "inMarket", "availabilityText": availability},
+        "callSign": "MLB",
+    }
+
+def schedule(games, days=1):
+    ''' A hydrated statsapi schedule response for the given number of games spread over days. '''
+    rnd = random.Random(games)
+    dates = []
+    game_pk = 776000
+    per_day = -(-games // days)
+    for day in range(days):
+        date = GAME_START + timedelta(days=day)
+        entries = []
+        for n in range(min(per_day, games - day * per_day)):
+            game_pk += 1
+            home, away = rnd.sample(range(len(TEAMS)), 2)
+            teams = {}
+            for side, t in (("home", home), ("away", away)):
+                name, abbreviation, location = TEAMS[t]
+                wins = rnd.randint(30, 60)
+                teams[side] = {
+                    "leagueRecord": {"wins": wins, "losses": 90 - wins, "pct": f"{wins / 90:.3f}"},
+                    "score": rnd.randint(0, 9),
+                    "team": {"id": 108 + t, "name": name, "abbreviation": abbreviation, "locationName": location,
+                             "teamName": name.split()[-1], "venue": {"id": 1 + t, "name": f"{location} Park"}},
+                    "probablePitcher": {"id": 600000 + t, "fullName": f"Pitcher {abbreviation}"}
+                }
+            broadcasts = [_broadcast(rnd, game_pk, 0, "home", "TV", "Local (In Market)"),
+                          _broadcast(rnd, game_pk, 1, "away", "TV", "Local (Out of Market)"),
+                          _broadcast(rnd, game_pk, 2, "home", "AM", "Local (In Market)"),
+                          _broadcast(rnd, game_pk, 3, "away", "FM", "Local (In Market)"),
+                          _broadcast(rnd, game_pk, 4, "home", "TV", "National")]
+            entries.append({
+                "gamePk": game_pk,
+                "gameGuid": f"{game_pk:08x}-0000-4000-8000-000000000000",
+                "gameType": "R",
+                "season": "2025",
+                "gameDate": (date + timedelta(minutes=15 * n)).isoformat() + "Z",
+                "officialDate": f"{date:%Y-%m-%d}",
+                "status": {"abstractGameState": "Final", "detailedState": rnd.choice(["Final", "In Progress", "Scheduled: 7:05"]),
+                           "statusCode": "F"},
+                "teams": teams,
+                "linescore": {"currentInning": 5, "currentInningOrdinal": "5th", "inningHalf": "Bottom",
+                              "innings": [{"num": i, "home": {"runs": rnd.randint(0, 2)}, "away": {"runs": rnd.randint(0, 2)}}
+                                          for i in range(1, 10)]},
+                "venue": {"id": 1 + home, "name": f"{TEAMS[home][2]} Park"},
+                "broadcasts": broadcasts,
+                "content": {"media": {"epg": [{"title": "MLBTV", "items": [{"mediaId": b["mediaId"]} for b in broadcasts]}]}},
+            })
+        dates.append({"date": f"{date:%Y-%m-%d}", "totalGames": len(entries), "games": entries})
+    return json.dumps({"totalGames": games, "dates": dates})
+
+def generate():
+    ''' Returns {file name: text} for every fixture. '''
+    fixtures = {"master.m3u8": master_playlist(), "media_info.json": media_info(), "media_info_extra.json": media_info(15)}
+    for name, segments in PLAYLIST_SIZES.items():
+        fixtures[f"media_{name}.m3u8"] = media_playlist(segments)
+    for name, games in GAME_SIZES.items():
+        fixtures[f"schedule_{name}.json"] = schedule(games, days=max(1, games // 15))
+    return fixtures
+
+def load(directory=None):
+    ''' Returns the fixtures, using a captured file from directory in place of each generated one found there. '''
+    fixtures = generate()
+    if directory:
+        for name in fixtures:
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    fixtures[name] = f.read()
+    return fixtures
+
+def record(directory):
+    os.makedirs(directory, exist_ok=True)
+    for name, text in generate().items():
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            f.write(text)
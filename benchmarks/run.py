@@ -0,0 +1,270 @@
+''' Offline benchmarks for the hot paths, run against the fixtures in fixtures.py.
+
+    python benchmarks/run.py                          run everything, print a table
+    python benchmarks/run.py -o before.json           also write the results as json
+    python benchmarks/run.py --compare before.json    print the change against an earlier run
+    python benchmarks/run.py -k schedule              only benchmarks whose name contains "schedule"
+    python benchmarks/run.py --record DIR             write the fixtures to DIR, to swap in captures
+    python benchmarks/run.py --fixtures DIR           use the fixture files found in DIR '''
+
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import cycle
+import argparse
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path[:0] = [ROOT, HERE]
+
+import fixtures
+
+PACKAGE = "mlbtv-pipe"
+
+def mod(name):
+    return importlib.import_module(f"{PACKAGE}.{name}")
+
+m3u8 = mod("m3u8")
+transport = mod("transport")
+mlb_stats = mod("mlb_stats")
+mlbtv_stream = mod("mlbtv_stream")
+milestones = mod("milestones")
+timeline = mod("timeline")
+skip_scheduler = mod("skip_scheduler")
+schedule_index = mod("schedule_index")
+playlist_tailer = mod("playlist_tailer")
+device_store = mod("device_store")
+
+MASTER_URL = "https://example.invalid/hls/master.m3u8"
+
+class Response:
+    ''' Enough of requests.Response to stand in for a recorded reply. '''
+
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.reason = "OK" if self.ok else "Error"
+        self.encoding = "utf-8"
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_lines(self, decode_unicode=True):
+        return iter(self.text.splitlines())
+
+    def close(self):
+        pass
+
+def drive(flow, *responses):
+    ''' Runs an I/O-free request flow, answering its requests with the given responses in order. '''
+    responses = iter(responses)
+    try:
+        flow.send(None)
+        while True:
+            flow.send(next(responses))
+    except StopIteration as done:
+        return done.value
+
+@contextmanager
+def patched(obj, name, value):
+    original = getattr(obj, name)
+    setattr(obj, name, value)
+    try:
+        yield
+    finally:
+        setattr(obj, name, original)
+
+def make_stream(devices):
+    stream = mlbtv_stream.Stream(None, "776543", "m0", devices)
+    stream._master_playlist = MASTER_URL
+    stream._playlist_prefix = MASTER_URL[:MASTER_URL.rfind("/") + 1]
+    return stream
+
+BENCHMARKS = {} # name -> setup(fixtures, devices) returning the callable to time
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+@benchmark("stream.media_playlists")
+def bench_media_playlists(fx, devices):
+    response = Response(fx["master.m3u8"])
+    def run():
+        drive(make_stream(devices)._gen_media_playlists(), response)
+    return run
+
+def bench_commercial_breaks(size):
+    def setup(fx, devices):
+        response = Response(fx[f"media_{size}.m3u8"])
+        def run():
+            stream = make_stream(devices)
+            stream._media_playlists = [{mlbtv_stream.URI: "playlist.m3u8"}]
+            drive(stream._gen_commercial_breaks(), response)
+        return run
+    return setup
+
+def bench_tailer_parse(size):
+    def setup(fx, devices):
+        response = Response(fx[f"media_{size}.m3u8"])
+        def run():
+            stream = make_stream(devices)
+            stream._media_playlists = [{mlbtv_stream.URI: "playlist.m3u8"}]
+            with patched(transport, "get", lambda *args, **kwargs: response):
+                playlist_tailer.MediaPlaylistTailer(stream).reload()
+        return run
+    return setup
+
+for size in fixtures.PLAYLIST_SIZES:
+    benchmark(f"stream.commercial_breaks[{size}]")(bench_commercial_breaks(size))
+    benchmark(f"tailer.parse[{size}]")(bench_tailer_parse(size))
+
+def bench_milestones(name):
+    def setup(fx, devices):
+        data = json.loads(fx[name])["data"]["mediaInfo"][0]["milestones"]
+        def run():
+            milestones.Milestones(data)
+        return run
+    return setup
+
+benchmark("milestones.init[nine]")(bench_milestones("media_info.json"))
+benchmark("milestones.init[extra]")(bench_milestones("media_info_extra.json"))
+
+@benchmark("schedule.games_on_date[slate]")
+def bench_games_on_date(fx, devices):
+    text = fx["schedule_slate.json"]
+    def run():
+        with patched(mlb_stats, "get_json", lambda url: json.loads(text)):
+            mlb_stats.fetch_games_on_date("2025-07-10")
+    return run
+
+@benchmark("schedule.index_load[week]")
+def bench_index_load(fx, devices):
+    text = fx["schedule_week.json"]
+    def run():
+        with patched(mlb_stats, "get_json", lambda url: json.loads(text)):
+            schedule_index.ScheduleIndex().load("2025-07-10", "2025-07-16")
+    return run
+
+def slate(fx):
+    return json.loads(fx["schedule_slate.json"])["dates"][0]["games"]
+
+@benchmark("menus.games_table[slate]")
+def bench_games_table(fx, devices):
+    games = slate(fx)
+    def run():
+        mlb_stats.build_games_table(games)
+    return run
+
+@benchmark("menus.streams_table[slate]")
+def bench_streams_table(fx, devices):
+    games = slate(fx)
+    def run():
+        for game in games:
+            mlb_stats.build_streams_table(game)
+    return run
+
+LOOKUPS = 1000 # positions looked up per timed call
+
+def game_timeline(fx, devices):
+    stream = make_stream(devices)
+    stream._media_playlists = [{mlbtv_stream.URI: "playlist.m3u8"}]
+    drive(stream._gen_commercial_breaks(), Response(fx["media_nine.m3u8"]))
+    return timeline.Timeline(stream._commercial_breaks), stream._segment_table.end()
+
+@benchmark("monitor.break_at[nine]")
+def bench_break_at(fx, devices):
+    line, end = game_timeline(fx, devices)
+    positions = [end * i / LOOKUPS for i in range(LOOKUPS)]
+    def run():
+        for t in positions:
+            line.break_at(t)
+    return run
+
+@benchmark("monitor.poll[nine]")
+def bench_poll(fx, devices):
+    line, end = game_timeline(fx, devices)
+    samples = cycle([(end * i / LOOKUPS, 1.0, True) for i in range(LOOKUPS)])
+    scheduler = skip_scheduler.AdSkipScheduler(line, lambda ms: None, lambda: next(samples), resync_interval=0)
+    def run():
+        for _ in range(LOOKUPS):
+            scheduler.poll()
+    return run
+
+def measure(run, repeat):
+    timer = timeit.Timer(run)
+    number, _ = timer.autorange()
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {"min": min(times), "median": statistics.median(times), "number": number, "repeat": repeat}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:8.2f} {unit}"
+    return f"{seconds / 1e-9:8.2f} ns"
+
+def main():
+    parser = argparse.ArgumentParser(description="mlbtv-pipe benchmarks")
+    parser.add_argument("-k", dest="keyword", help="only run benchmarks whose name contains this")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("-o", "--output", help="write the results to this json file")
+    parser.add_argument("--compare", help="json results of an earlier run to compare against")
+    parser.add_argument("--fixtures", help="directory of captured fixtures to use in place of the generated ones")
+    parser.add_argument("--record", help="write the generated fixtures to this directory and exit")
+    args = parser.parse_args()
+
+    if args.record:
+        fixtures.record(args.record)
+        return
+
+    fx = fixtures.load(args.fixtures)
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        devices = device_store.DeviceStore(tmp)
+        for name, setup in BENCHMARKS.items():
+            if args.keyword and args.keyword not in name:
+                continue
+            results[name] = result = measure(setup(fx, devices), args.repeat)
+
+            line = f"{name:<40}{format_time(result['median'])}  (min {format_time(result['min']).strip()})"
+            if name in baseline:
+                line += f"  {baseline[name]['median'] / result['median']:6.2f}x"
+            print(line)
+
+    if args.output:
+        report = {
+            "meta": {
+                "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "fixtures": args.fixtures,
+            },
+            "results": results
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,313 @@
-from .mlbtv_account import Account
-from .mlbtv_stream import Stream
-from . import mlb_stats
+from datetime import datetime
+import argparse
+import json
 import logging
+import platform
 import os
-from .vlc_driver import VLC_Handler
-import pychromecast
+import sys
+import time
+
+# only the standard library is imported up front; the package modules, and requests, pytz and the
+# player backends behind them, load once the arguments say they are needed, so --help stays instant
 
 APP = "mlbtv-pipe"
 
-def main():
+logger = logging.getLogger(__name__)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog=f"python -m {APP}",
+                                     description="Pipe MLB.tv streams into a player. Without a team, gamePk or media ID it shows the interactive menus.")
+    parser.add_argument("-t", "--team", help="team name or abbreviation, e.g. SEA")
+    parser.add_argument("-d", "--date", type=lambda d: datetime.strptime(d, "%Y-%m-%d"), help="game date as YYYY-MM-DD, today by default")
+    parser.add_argument("--days-ago", type=int, help="game date as a number of days before today")
+    parser.add_argument("-g", "--game-pk", help="statsapi gamePk")
+    parser.add_argument("-m", "--media-id", help="broadcast media ID; resolved from the schedule when left out")
+    parser.add_argument("-o", "--output", choices=sorted(OUTPUTS), default="vlc",
+                        help="resolve: print gamePk and media ID; url: print the master playlist; "
+                             "proxy: serve an ad-free playlist; record: save the game to a file; "
+                             "chromecast: cast to a Chromecast; mpv: play in mpv; vlc: play in VLC (default)")
+    parser.add_argument("--cast", action="append", metavar="NAME",
+                        help="with -o chromecast, the device to cast to; repeat to cast to several, any found by default")
+    parser.add_argument("--file", help="with -o record, where to save the game; <gamePk>.ts by default")
+    parser.add_argument("--variant", type=int, help="with -o record, variant number from lowest bandwidth up; the highest by default")
+    parser.add_argument("--skip-breaks", action="store_true", help="with -o record, leave out the commercial breaks")
+    parser.add_argument("--condensed", action="store_true",
+                        help="with -o record, keep only the half innings, leaving out breaks and the time between them")
+    parser.add_argument("--username", default=os.getenv("MLBTV_USERNAME"), help="defaults to $MLBTV_USERNAME")
+    parser.add_argument("--password", default=os.getenv("MLBTV_PASSWORD"), help="defaults to $MLBTV_PASSWORD")
+    parser.add_argument("--log-file", help="defaults to mlbtv-pipe.log in the cache directory")
+    parser.add_argument("-v", "--verbose", action="store_true", help="also log to stderr")
+    parser.add_argument("--cache-dir", help="with -o proxy, serve segments from a disk cache here, reading ahead of the player; "
+                                            "segments in the cache directory by default when only --cache-size is given")
+    parser.add_argument("--cache-size", type=int, metavar="MB", help="with -o proxy, the most the segment cache may hold, 4096 MB by default")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="with -o proxy, offer only the variants the measured throughput can carry, re-checked during play; "
+                             "with -o record, record the variant it picks")
+    parser.add_argument("--timings", action="store_true", help="print how long each startup step took and the critical path")
+    parser.add_argument("--timings-file", help="append each launch's startup timings to this file as a json line")
+    return parser.parse_args(argv)
+
+def configure_logging(args):
+    from . import utilities as u
 
-    # CONFIGURE LOGGING
-    appdata_local = os.getenv("LOCALAPPDATA")
-    log_file_path = os.path.join(appdata_local, APP, f"{APP}.log")
-    os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+    log_file_path = args.log_file or os.path.join(u.get_cache_dir(), f"{APP}.log")
+    os.makedirs(os.path.dirname(os.path.abspath(log_file_path)), exist_ok=True)
 
-    logger = logging.getLogger(__name__)
-    logging.basicConfig(filename=log_file_path, 
+    logging.basicConfig(filename=log_file_path,
                         encoding='utf-8',
                         format='%(levelname)s:%(message)s',
                         level=logging.DEBUG)
-    logger.debug(f"{APP} started")
+    if args.verbose:
+        console = logging.StreamHandler()
+        console.setLevel(logging.INFO)
+        logging.getLogger().addHandler(console)
+    logger.debug(f"{APP} started with {sys.argv[1:]}")
+
+def is_interactive(args):
+    return not (args.team or args.game_pk or args.media_id)
+
+def resolve(args):
+    ''' Returns (gamePk, media ID) from the arguments, reading the schedule only for what was left out. '''
+    if args.game_pk and args.media_id:
+        return args.game_pk, args.media_id
+
+    from . import mlb_stats
 
-    account = Account()
-    game = mlb_stats.prompt_games()
+    games = mlb_stats.get_games_on_date(date=args.date, days_ago=args.days_ago)
+    if args.game_pk or args.media_id:
+        game = mlb_stats.get_game_from_games(games, args.game_pk, args.media_id)
+    else:
+        game = mlb_stats.get_team_game_from_games(games, args.team)
+
+    media_id = args.media_id or mlb_stats.get_stream_from_game(game, args.team)
+    return game["gamePk"], media_id
+
+def prompt(args):
+    from . import mlb_stats
+
+    game = mlb_stats.prompt_games(date=args.date, days_ago=args.days_ago or 0)
     stream_choice = mlb_stats.prompt_streams(game)
-    stream = Stream(account.get_token(), stream_choice["GamePK"], stream_choice["MediaID"])
+    return stream_choice["GamePK"], stream_choice["MediaID"]
+
+def login(args):
+    from .mlbtv_account import Account
+
+    credentials = {k: v for k, v in (("username", args.username), ("password", args.password)) if v}
+    account = Account(**credentials)
+    # the token is renewed in place ahead of expiry, so long games keep a valid one for playback renewals
+    account.start_refresher()
+    return account.get_token()
+
+def start_session(stream, token):
+    stream.token = token
+    stream.init_session()
+
+def add_stream_steps(startup, milestones=False, breaks=False, adaptive=False):
+    ''' Registers the steps from the resolved ids to the master playlist, plus milestones, a variant selection
+        and breaks if asked. Breaks are read from the selected variant when there is one.
+        The Stream is created before login finishes, so mediaInfo, which needs no token, can start at once. '''
+    from .mlbtv_stream import Stream
+
+    startup.add("stream", lambda ids: Stream(None, *ids), "resolve")
+    startup.add("session", start_session, "stream", "login")
+    startup.add("playback", lambda stream, _: stream.get_master_playlist(), "stream", "session")
+    startup.add("heartbeat", lambda stream, _: stream.start_heartbeat(), "stream", "playback")
+    if milestones:
+        startup.add("milestones", lambda stream: stream.get_milestones(), "stream")
+    if breaks or adaptive:
+        startup.add("variants", lambda stream, _: stream.get_media_playlists(), "stream", "playback")
+    if adaptive:
+        startup.add("select", lambda stream, _: stream.select_variant(), "stream", "variants")
+    if breaks:
+        startup.add("breaks", lambda stream, _: stream.tail_commercial_breaks(), "stream", "select" if adaptive else "variants")
+
+def add_player_steps(startup, make_player):
+    ''' Registers player, launch, ready and first_frame for a handler with launch(), wait_ready() and wait_first_frame().
+        The player starts as soon as there is a playlist to open; the breaks are only needed once it plays. '''
+    startup.add("player", lambda stream, _: make_player(stream), "stream", "playback")
+    startup.add("launch", lambda player: player.launch(), "player")
+    startup.add("ready", lambda player, _: player.wait_ready(), "player", "launch")
+    startup.add("first_frame", lambda player, _: player.wait_first_frame(), "player", "ready")
+
+def output_resolve(args, startup):
+    game_pk, media_id = startup.result("resolve")
+    print(f"{game_pk} {media_id}")
+    return "resolve"
+
+def output_url(args, startup):
+    add_stream_steps(startup)
+    print(startup.result("playback"))
+    return "playback"
+
+def output_proxy(args, startup):
+    from . import hls_proxy
+    import threading
+
+    cache = None
+    if args.cache_dir or args.cache_size:
+        from .segment_cache import SegmentCache
+        options = {"max_bytes": args.cache_size * 1024 ** 2} if args.cache_size else {}
+        cache = SegmentCache(args.cache_dir, **options)
+
+    add_stream_steps(startup, adaptive=args.adaptive)
+    target = "select" if args.adaptive else "playback"
+    startup.result(target)
+    print(hls_proxy.serve(startup.result("stream"), cache), flush=True)
+    report_startup(args, startup, target)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    return target
+
+def output_record(args, startup):
+    from .recorder import Recorder, CondensedRecorder
 
-    stream._gen_commercial_breaks()
+    # the milestones a condensed recording is cut by load alongside login and the playback session
+    add_stream_steps(startup, milestones=args.condensed, adaptive=args.adaptive)
+    target = "select" if args.adaptive else "playback"
+    startup.result(target)
+    stream = startup.result("stream")
+    number = args.variant
+    if number is None and not args.adaptive:
+        number = len(stream.get_media_playlists()) - 1
+    path = args.file or f"{stream.game_pk}.ts"
+    report_startup(args, startup, target)
 
-    vh = VLC_Handler(stream)
-    vh.start()
+    # an interrupted recording resumes from its manifest when run again with the same file
+    if args.condensed:
+        startup.result("milestones")
+        recorder = CondensedRecorder(stream, path, number)
+    else:
+        recorder = Recorder(stream, path, number, skip_breaks=args.skip_breaks)
+    try:
+        recorder.record(lambda done, total: print(f"\r{done}/{total} segments", end="", file=sys.stderr, flush=True))
+    finally:
+        print(file=sys.stderr)
+    print(path)
+    return target
+
+def output_vlc(args, startup):
+    from .vlc_driver import VLC_Handler
+
+    add_stream_steps(startup, breaks=True)
+    add_player_steps(startup, lambda stream: VLC_Handler(stream))
+
+    vh = startup.result("player")
+    startup.result("first_frame")
+    startup.result("breaks")
+    report_startup(args, startup, "first_frame")
+    vh.monitor()
+    return "first_frame"
+
+def output_chromecast(args, startup):
+    from . import chromecast_driver as cc
+
+    # discovery takes seconds, so it runs alongside the session and playback steps
+    startup.add("devices", lambda: cc.discover(args.cast))
+    add_stream_steps(startup, breaks=True)
+    casts = startup.result("devices")
+    if not casts:
+        raise Exception("no Chromecast found")
+    for cast in casts:
+        name = f"cast {cast.cast_info.friendly_name}"
+        startup.add(name, lambda stream, _, cast=cast: cc.Chromecast_Handler(stream, cast), "stream", "playback")
+        startup.add(f"launch {cast.cast_info.friendly_name}", lambda ch: ch.launch(), name)
+
+    target = f"launch {casts[-1].cast_info.friendly_name}"
+    controller = cc.CastController()
+    try:
+        startup.result("breaks")
+        for cast in casts:
+            startup.result(f"launch {cast.cast_info.friendly_name}")
+            controller.add(startup.result(f"cast {cast.cast_info.friendly_name}"))
+        report_startup(args, startup, target)
+        controller.run()
+    finally:
+        controller.stop()
+    return target
+
+def output_mpv(args, startup):
+    from .mpv_driver import MPV_Handler
+
+    add_stream_steps(startup, breaks=True)
+    add_player_steps(startup, lambda stream: MPV_Handler(stream))
+
+    mh = startup.result("player")
+    startup.result("first_frame")
+    startup.result("breaks")
+    report_startup(args, startup, "first_frame")
+    mh.monitor()
+    return "first_frame"
+
+OUTPUTS = {
+    "chromecast": output_chromecast,
+    "resolve": output_resolve,
+    "url": output_url,
+    "mpv": output_mpv,
+    "proxy": output_proxy,
+    "record": output_record,
+    "vlc": output_vlc
+}
+
+def report_startup(args, startup, target):
+    if getattr(startup, "reported", False):
+        return
+    startup.reported = True
+    for line in startup.report(target):
+        logger.info(line)
+        if args.timings:
+            print(line, file=sys.stderr)
+
+    timings = startup.timings(target)
+    timings.update({"time": datetime.now().astimezone().isoformat(timespec="seconds"), "output": args.output,
+                    "python": platform.python_version(), "platform": platform.platform()})
+    logger.debug(f"startup timings {json.dumps(timings)}")
+    if args.timings_file:
+        with open(args.timings_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps(timings) + "\n")
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(args)
+
+    from .startup import Startup
+    startup = Startup()
+
+    try:
+        if args.output != "resolve":
+            # log in while the menus are up or the schedule loads
+            startup.add("login", lambda: login(args))
+
+        if is_interactive(args):
+            started = time.monotonic()
+            startup.done("resolve", prompt(args), started)
+        else:
+            startup.add("resolve", lambda: resolve(args))
+
+        game_pk, media_id = startup.result("resolve")
+        logger.info(f"resolved gamePk {game_pk}, media ID {media_id}")
+
+        target = OUTPUTS[args.output](args, startup)
+        report_startup(args, startup, target)
+    except KeyboardInterrupt:
+        return 130
+    except Exception as err:
+        logger.exception(err)
+        print(f"{APP}: {err}", file=sys.stderr)
+        return 1
+    finally:
+        startup.shutdown()
 
     logger.info("end of file")
+    return 0
 
 def test():
+    import pychromecast
+
     chromecast, browser = pychromecast.get_listed_chromecasts()
     print(chromecast)
     print(browser)
 
 if __name__ == '__main__':
-    test()
-
+    sys.exit(main())
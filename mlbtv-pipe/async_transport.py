@@ -0,0 +1,101 @@
+import asyncio
+import json
+import logging
+import aiohttp
+from . import transport
+
+logger = logging.getLogger(__name__)
+
+class Response:
+    ''' The parts of a requests.Response that the request flows read, filled from an aiohttp response. '''
+
+    __slots__ = ("status_code", "reason", "text", "url", "encoding")
+
+    def __init__(self, status_code, reason, text, url):
+        self.status_code = status_code
+        self.reason = reason
+        self.text = text
+        self.url = url
+        self.encoding = "utf-8" # text is already decoded
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_lines(self, decode_unicode=True):
+        return iter(self.text.splitlines())
+
+    def close(self):
+        pass
+
+class AsyncClient:
+    ''' asyncio counterpart of transport: one aiohttp session with keep-alive pools per host,
+        using the same header profiles and timeouts. The session belongs to the event loop that
+        opened it, so close() the client before that loop ends, e.g. with async with AsyncClient(). '''
+
+    def __init__(self, pool_maxsize=None):
+        self.pool_maxsize = pool_maxsize or transport.POOL_MAXSIZE
+        self._session = None
+        self._loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _get_session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._loop is not loop:
+            # its pool is tied to a loop that has ended, and can no longer be closed from here
+            logger.warning("AsyncClient was not closed before its event loop ended, opening a new session")
+            self._session = None
+        if self._session is None or self._session.closed:
+            self._loop = loop
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=self.pool_maxsize)
+            timeout = aiohttp.ClientTimeout(sock_connect=transport.CONNECT_TIMEOUT, sock_read=transport.READ_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    async def request(self, method, url, profile=transport.LOCAL, headers=None, verify=True, **kwargs):
+        if headers:
+            profile = profile | headers
+
+        kwargs.pop("stream", None) # the body is always read whole here
+        async with self._get_session().request(method, url, headers=profile, ssl=None if verify else False, **kwargs) as r:
+            text = await r.text()
+            return Response(r.status, r.reason, text, str(r.url))
+
+    async def get(self, url, profile=transport.LOCAL, **kwargs):
+        return await self.request("GET", url, profile, **kwargs)
+
+    async def post(self, url, profile=transport.LOCAL, **kwargs):
+        return await self.request("POST", url, profile, **kwargs)
+
+    async def run(self, flow):
+        ''' Drives a generator of transport.Requests, like transport.run, without blocking the loop. '''
+        try:
+            req = next(flow)
+            while True:
+                req = flow.send(await self.request(req.method, req.url, req.profile, **req.kwargs))
+        except StopIteration as done:
+            return done.value
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+            self._loop = None
+
+_default_client = None
+
+def get_client():
+    ''' Returns the AsyncClient shared by every AsyncAccount and AsyncStream created without one.
+        Await its close() before the event loop ends, or pass them a client of your own. '''
+    global _default_client
+    if _default_client is None:
+        _default_client = AsyncClient()
+    return _default_client
@@ -0,0 +1,157 @@
+import heapq
+import logging
+import threading
+import time
+import pychromecast
+from .skip_scheduler import AdSkipScheduler
+
+CONTENT_TYPE = "application/x-mpegURL"
+STREAM_TYPE = "BUFFERED" # LIVE would disable seeking, which skipping breaks relies on
+DISCOVERY_TIMEOUT = 10 # seconds
+PLAYING = "PLAYING"
+PAUSED = "PAUSED"
+BUFFERING = "BUFFERING"
+IDLE = "IDLE"
+
+logger = logging.getLogger(__name__)
+
+def discover(names=None, timeout=DISCOVERY_TIMEOUT):
+    ''' Returns the Chromecasts on the network, only those with the given friendly names if any are given. '''
+    if names:
+        casts, browser = pychromecast.get_listed_chromecasts(friendly_names=names, timeout=timeout)
+        missing = set(names) - {cast.cast_info.friendly_name for cast in casts}
+        if missing:
+            raise Exception(f"Chromecast not found: {', '.join(sorted(missing))}")
+    else:
+        casts, browser = pychromecast.get_chromecasts(timeout=timeout)
+    browser.stop_discovery()
+    return casts
+
+class Chromecast_Handler():
+    ''' Casts a Stream's master playlist to one Chromecast. The device pushes media status changes to
+        new_media_status on pychromecast's socket thread, and those feed an AdSkipScheduler, so the
+        position is never polled. A CastController runs the schedulers of any number of handlers. '''
+
+    def __init__(self, stream, cast, url=None):
+        self.stream = stream
+        self.cast = cast
+        self.source = url
+        self.name = cast.cast_info.friendly_name
+
+        self.scheduler = None
+        self.controller = None
+        self.finished = threading.Event()
+
+    def launch(self):
+        self.cast.wait()
+        media = self.cast.media_controller
+        media.register_status_listener(self)
+        media.play_media(self.source or self.stream.get_master_playlist(), CONTENT_TYPE, stream_type=STREAM_TYPE,
+                         title=f"{self.stream.game_pk}")
+        media.block_until_active()
+        logger.info(f"casting {self.stream.media_id} to {self.name}")
+
+    def playback_renewed(self, url):
+        ''' Loads a renewed playback session's playlist on the device at the position it had reached. '''
+        media = self.cast.media_controller
+        position = media.status.adjusted_current_time or media.status.current_time or 0
+        media.play_media(url, CONTENT_TYPE, stream_type=STREAM_TYPE, title=f"{self.stream.game_pk}", current_time=position)
+
+    def attach(self, controller):
+        ''' Hands this handler's break skipping to a CastController. '''
+        self.controller = controller
+        self.scheduler = AdSkipScheduler.for_player(self.stream, self.source, self.cast.media_controller.seek)
+        if self.scheduler:
+            self.stream.add_playback_listener(self.playback_renewed)
+
+    # pychromecast MediaStatusListener
+
+    def new_media_status(self, status):
+        if status.player_state == IDLE and status.idle_reason:
+            logger.info(f"{self.name} stopped: {status.idle_reason}")
+            self.finished.set()
+        elif self.scheduler and status.player_state in (PLAYING, PAUSED, BUFFERING):
+            position = getattr(status, "adjusted_current_time", None) or status.current_time or 0
+            self.scheduler.update(position * 1000, status.playback_rate or 1.0, status.player_state == PLAYING)
+        if self.controller:
+            self.controller.wake(self)
+
+    def load_media_failed(self, queue_item_id, error_code):
+        logger.error(f"{self.name} could not load the stream: error {error_code}")
+        self.finished.set()
+        if self.controller:
+            self.controller.wake(self)
+
+    def stop(self):
+        self.finished.set()
+        try:
+            self.cast.media_controller.stop()
+        finally:
+            self.cast.disconnect()
+
+class CastController:
+    ''' Runs the break skipping of several Chromecast_Handlers on one thread. Each scheduler's poll()
+        says how long until it next needs to act; the controller sleeps until the earliest of those,
+        or until a status pushed by a device wakes it for that device alone. '''
+
+    def __init__(self):
+        self.handlers = []
+        self._heap = [] # (due, generation, index)
+        self._generation = {} # handler index -> generation of its live heap entry
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def add(self, handler):
+        with self._lock:
+            self.handlers.append(handler)
+        handler.attach(self)
+        self.wake(handler)
+
+    def wake(self, handler):
+        ''' Schedules handler to be polled now. Called from pychromecast's threads. '''
+        with self._lock:
+            index = self.handlers.index(handler)
+            generation = self._generation.get(index, 0) + 1
+            self._generation[index] = generation
+            heapq.heappush(self._heap, (time.monotonic(), generation, index))
+        self._wake.set()
+
+    def _next(self):
+        ''' Pops the due handlers, dropping entries a later wake() superseded. Returns them and the next due time. '''
+        due = []
+        now = time.monotonic()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, generation, index = heapq.heappop(self._heap)
+                if self._generation.get(index) == generation:
+                    due.append((index, generation))
+            while self._heap and self._generation.get(self._heap[0][2]) != self._heap[0][1]:
+                heapq.heappop(self._heap)
+            return due, self._heap[0][0] if self._heap else None
+
+    def run(self):
+        ''' Skips breaks on every device until all of them have stopped playing. '''
+        while not all(h.finished.is_set() for h in self.handlers):
+            due, until = self._next()
+            for index, generation in due:
+                handler = self.handlers[index]
+                if handler.finished.is_set() or not handler.scheduler:
+                    continue
+                wait = handler.scheduler.poll()
+                with self._lock:
+                    # a status that arrived during poll() already queued the handler for now
+                    if self._generation[index] == generation:
+                        self._generation[index] = generation + 1
+                        heapq.heappush(self._heap, (time.monotonic() + wait, generation + 1, index))
+            if due:
+                continue
+            self._wake.wait(None if until is None else max(until - time.monotonic(), 0))
+            self._wake.clear()
+
+    def stop(self):
+        for handler in self.handlers:
+            try:
+                handler.stop()
+            except Exception as err:
+                logger.warning(f"stopping {handler.name} failed: {err}")
+        self._wake.set()
@@ -0,0 +1,64 @@
+import hashlib
+import logging
+import os
+import threading
+from . import utilities as u
+
+logger = logging.getLogger(__name__)
+
+DEVICE_DIR = "devices"
+DEVICE_ID = "deviceId"
+SESSION_ID = "sessionId"
+
+class DeviceStore:
+    ''' Keeps the initSession deviceId/sessionId pair per account, in memory and on disk,
+        so every Stream for that account can skip initSession. '''
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(u.get_cache_dir(), DEVICE_DIR)
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _path(self, account_key):
+        key = hashlib.sha256(account_key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, account_key):
+        ''' Returns (device_id, session_id) for the account, or None if nothing is cached. '''
+        with self._lock:
+            if account_key not in self._sessions:
+                stored = u.read_json(self._path(account_key))
+                if stored and stored.get(DEVICE_ID) and stored.get(SESSION_ID):
+                    self._sessions[account_key] = (stored[DEVICE_ID], stored[SESSION_ID])
+            return self._sessions.get(account_key)
+
+    def put(self, account_key, device_id, session_id):
+        with self._lock:
+            self._sessions[account_key] = (device_id, session_id)
+            u.write_private_json(self._path(account_key), {DEVICE_ID: device_id, SESSION_ID: session_id})
+
+    def invalidate(self, account_key, session_id=None):
+        ''' Forgets the account's session. When session_id is given the entry is only dropped if it still
+            holds that session, so a stream cannot discard a replacement another stream just stored. '''
+        with self._lock:
+            cached = self._sessions.get(account_key)
+            if session_id and cached and cached[1] != session_id:
+                return
+
+            self._sessions.pop(account_key, None)
+            try:
+                os.remove(self._path(account_key))
+            except FileNotFoundError:
+                pass
+            logger.info("discarded cached device session")
+
+_default_store = None
+_default_lock = threading.Lock()
+
+def get_default_store():
+    ''' Returns the process-wide DeviceStore shared by every Stream. '''
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = DeviceStore()
+        return _default_store
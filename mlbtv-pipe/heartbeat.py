@@ -0,0 +1,88 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+RETRY_INTERVAL = 10 # seconds before retrying a failed heartbeat, if the stream's own interval is longer
+
+logger = logging.getLogger(__name__)
+
+class HeartbeatScheduler:
+    ''' Sends the playback heartbeats of any number of Streams from one thread. Each stream is due again
+        after the interval initPlaybackSession gave it, so the thread sleeps until the earliest heartbeat
+        of them all instead of running a timer per stream. '''
+
+    def __init__(self):
+        self._heap = [] # (due, order, stream)
+        self._order = itertools.count() # breaks ties between streams due at the same moment
+        self._active = {} # stream -> order of its live heap entry
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, stream):
+        ''' Starts sending stream.heartbeat() every stream.heartbeat_interval seconds, the first one interval from now. '''
+        with self._lock:
+            self._push(stream, time.monotonic() + stream.heartbeat_interval)
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, name="heartbeat", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def remove(self, stream):
+        with self._lock:
+            self._active.pop(stream, None)
+
+    def __contains__(self, stream):
+        return stream in self._active
+
+    def _push(self, stream, due):
+        order = next(self._order)
+        self._active[stream] = order
+        heapq.heappush(self._heap, (due, order, stream))
+
+    def _pop_due(self):
+        ''' Returns the streams due now and seconds until the next one, skipping removed or rescheduled entries. '''
+        due = []
+        now = time.monotonic()
+        with self._lock:
+            while self._heap:
+                at, order, stream = self._heap[0]
+                if self._active.get(stream) != order:
+                    heapq.heappop(self._heap)
+                elif at <= now:
+                    heapq.heappop(self._heap)
+                    due.append((stream, order))
+                else:
+                    return due, at - now
+        return due, None
+
+    def _run(self):
+        while True:
+            due, wait = self._pop_due()
+            for stream, order in due:
+                interval = stream.heartbeat_interval
+                try:
+                    stream.heartbeat()
+                except Exception as err:
+                    logger.warning(f"heartbeat for {stream.media_id} failed: {err}")
+                    interval = min(interval, RETRY_INTERVAL)
+                with self._lock:
+                    if self._active.get(stream) == order:
+                        self._push(stream, time.monotonic() + interval)
+            if due:
+                continue
+            self._wake.wait(wait)
+            self._wake.clear()
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+def get_scheduler():
+    ''' The scheduler shared by every Stream in the process, created on first use. '''
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = HeartbeatScheduler()
+    return _default_scheduler
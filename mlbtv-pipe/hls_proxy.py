@@ -0,0 +1,336 @@
+from bisect import bisect_left, insort
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urljoin, urlsplit, parse_qs, quote
+import logging
+import os
+import re
+import threading
+from . import transport
+from . import m3u8
+from .variant_selector import variant_bandwidth
+
+HOSTNAME = "localhost"
+PORT = 8081
+CHUNK_SIZE = 16 * 1024 # bytes of playlist gathered before each chunked write
+
+MEDIA_SEQUENCE = "#EXT-X-MEDIA-SEQUENCE:"
+DISCONTINUITY_SEQUENCE = "#EXT-X-DISCONTINUITY-SEQUENCE:"
+DISCONTINUITY = "#EXT-X-DISCONTINUITY"
+CUE_OUT = "#EXT-X-CUE-OUT"
+CUE_OUT_CONT = "#EXT-X-CUE-OUT-CONT"
+CUE_IN = "#EXT-X-CUE-IN"
+# tags that describe the next segment only, and are dropped along with it
+SEGMENT_TAGS = ("#EXTINF", "#EXT-X-PROGRAM-DATE-TIME", "#EXT-X-BYTERANGE", "#EXT-X-DISCONTINUITY",
+                "#EXT-X-GAP", "#EXT-X-BITRATE", "#EXT-X-DATERANGE")
+URI_ATTR = re.compile(r'URI="([^"]*)"')
+M3U8_TYPE = "application/vnd.apple.mpegurl"
+TS_TYPE = "video/mp2t"
+
+logger = logging.getLogger(__name__)
+
+def add_sorted(seqs, seq):
+    i = bisect_left(seqs, seq)
+    if i == len(seqs) or seqs[i] != seq:
+        insort(seqs, seq)
+
+def contains_sorted(seqs, seq):
+    i = bisect_left(seqs, seq)
+    return i < len(seqs) and seqs[i] == seq
+
+class PlaylistState:
+    ''' What has been cut from one live media playlist so far, so that every reload numbers the
+        remaining segments and discontinuities the same way the player saw them last time. '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.dropped = [] # upstream sequence numbers of removed segments
+        self.inserted = [] # sequence numbers of kept segments we put a discontinuity before
+        self.removed_discontinuities = [] # sequence numbers of removed segments that carried one
+
+    def media_sequence(self, upstream):
+        return upstream - bisect_left(self.dropped, upstream)
+
+    def discontinuity_sequence(self, upstream, media_sequence):
+        return (upstream
+                - bisect_left(self.removed_discontinuities, media_sequence)
+                + bisect_left(self.inserted, media_sequence))
+
+    def is_dropped(self, seq):
+        return contains_sorted(self.dropped, seq)
+
+class HLSProxy:
+    ''' Local HTTP server that relays MLB.tv playlists with the commercial breaks cut out, so any
+        player can be pointed at it. Without a cache, segments and keys are fetched by the player
+        directly from the CDN; with a SegmentCache, segments are served from disk. '''
+
+    def __init__(self, host=HOSTNAME, port=PORT, cache=None):
+        self.host = host
+        self.port = port
+        self.cache = cache
+        self.streams = {} # key -> Stream
+        self.allowed = {} # key -> upstream playlist urls listed in that stream's master playlist
+        self.states = {} # (key, upstream url) -> PlaylistState
+        self.bandwidths = {} # (key, upstream variant playlist url) -> its bandwidth from the master playlist
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self):
+        if self._server:
+            return
+        self._server = ThreadingHTTPServer((self.host, self.port), ProxyHandler)
+        self._server.daemon_threads = True
+        self._server.proxy = self
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="hls-proxy", daemon=True).start()
+        logger.info(f"hls proxy listening on {self.host}:{self.port}")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def add_stream(self, stream):
+        ''' Registers a Stream and returns the local url of its ad-free master playlist. '''
+        key = stream.media_id
+        with self._lock:
+            self.streams[key] = stream
+            self.allowed.setdefault(key, set())
+        return f"http://{self.host}:{self.port}/{key}/master.m3u8"
+
+    def remove_stream(self, stream):
+        key = stream.media_id
+        with self._lock:
+            self.streams.pop(key, None)
+            self.allowed.pop(key, None)
+            for state_key in [k for k in self.states if k[0] == key]:
+                del self.states[state_key]
+            for bandwidth_key in [k for k in self.bandwidths if k[0] == key]:
+                del self.bandwidths[bandwidth_key]
+
+    def get_state(self, key, url):
+        with self._lock:
+            return self.states.setdefault((key, url), PlaylistState())
+
+    def media_path(self, key, url):
+        with self._lock:
+            # the stream may have been removed while its master playlist was being relayed
+            if key in self.allowed:
+                self.allowed[key].add(url)
+        return f"/{key}/media?u={quote(url, safe='')}"
+
+    def segment_path(self, key, url, previous):
+        if not self.cache:
+            return url
+        self.cache.link(url, previous)
+        return f"/{key}/segment?u={quote(url, safe='')}"
+
+    def rewrite_master(self, key, base, lines, cap=None):
+        ''' Points every variant and rendition playlist of a master playlist back at the proxy.
+            With a cap in bits per second, variants above it are left out, so the player cannot
+            pick more than a VariantSelector found the link can carry. '''
+        bandwidth = None # of the variant whose uri is the next line
+        skip = False
+        for line in lines:
+            if not line:
+                yield line
+            elif line.startswith(m3u8.STREAM_INF):
+                bandwidth = variant_bandwidth(m3u8.parse_attributes(line[len(m3u8.STREAM_INF):]))
+                skip = cap is not None and bandwidth > cap
+                if not skip:
+                    yield line
+            elif line.startswith("#"):
+                yield URI_ATTR.sub(lambda m: f'URI="{self.media_path(key, urljoin(base, m.group(1)))}"', line)
+            else:
+                url = urljoin(base, line.strip())
+                if bandwidth is not None:
+                    with self._lock:
+                        if key in self.allowed:
+                            self.bandwidths[key, url] = bandwidth
+                    bandwidth = None
+                if not skip:
+                    yield self.media_path(key, url)
+                skip = False
+
+    def upstream_url(self, stream, url):
+        ''' The playlist to read for a requested variant: the selected one instead, if a player holding an
+            older master playlist asks for a variant above what the link can carry now, and the current
+            playback session's url for one the player got before the session was renewed. '''
+        selector = stream.variant_selector
+        if selector and self.bandwidths.get((stream.media_id, url), 0) > selector.bandwidth:
+            return stream.media_playlist_url(selector.number)
+        return stream.resolve_media_url(url)
+
+    def rewrite_media(self, key, state, base, lines):
+        ''' Removes the segments between CUE-OUT and CUE-IN from a media playlist, one line at a time.
+            A discontinuity is placed before the first segment after each break, and the media and
+            discontinuity sequence numbers are shifted to account for everything removed so far. '''
+        media_sequence = 0
+        discontinuity_sequence = None
+        seq = None # upstream sequence number of the next segment
+        in_break = False
+        after_break = False
+        pending = [] # segment tags waiting for their uri
+        previous = None # last segment kept, for the cache's read ahead
+
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            if not line.startswith("#"):
+                if seq is None:
+                    seq = media_sequence
+                    in_break = in_break or state.is_dropped(seq)
+                    if discontinuity_sequence is None:
+                        # upstream omits the tag while it is 0, but our count may not be
+                        shifted = state.discontinuity_sequence(0, media_sequence)
+                        if shifted:
+                            yield f"{DISCONTINUITY_SEQUENCE}{shifted}"
+
+                if in_break:
+                    add_sorted(state.dropped, seq)
+                    if DISCONTINUITY in pending:
+                        add_sorted(state.removed_discontinuities, seq)
+                else:
+                    if after_break or contains_sorted(state.inserted, seq):
+                        if DISCONTINUITY not in pending:
+                            add_sorted(state.inserted, seq)
+                            yield DISCONTINUITY
+                        after_break = False
+                    yield from pending
+                    url = urljoin(base, line)
+                    yield self.segment_path(key, url, previous)
+                    previous = url
+
+                pending.clear()
+                seq += 1
+
+            elif line.startswith(MEDIA_SEQUENCE):
+                media_sequence = int(line[len(MEDIA_SEQUENCE):])
+                yield f"{MEDIA_SEQUENCE}{state.media_sequence(media_sequence)}"
+
+            elif line.startswith(DISCONTINUITY_SEQUENCE):
+                # media sequence always precedes it in practice, both are header tags
+                discontinuity_sequence = int(line[len(DISCONTINUITY_SEQUENCE):])
+                yield f"{DISCONTINUITY_SEQUENCE}{state.discontinuity_sequence(discontinuity_sequence, media_sequence)}"
+
+            elif line.startswith(CUE_OUT_CONT):
+                # a break that started before this window
+                if seq is None:
+                    in_break = True
+
+            elif line.startswith(CUE_OUT):
+                in_break = True
+
+            elif line.startswith(CUE_IN):
+                in_break = False
+                after_break = True
+
+            elif line.startswith(SEGMENT_TAGS):
+                pending.append(line)
+
+            else:
+                yield URI_ATTR.sub(lambda m: f'URI="{urljoin(base, m.group(1))}"', line)
+
+class ProxyHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def do_GET(self):
+        proxy = self.server.proxy
+        parts = urlsplit(self.path)
+        key, _, route = parts.path.lstrip("/").partition("/")
+
+        stream = proxy.streams.get(key)
+        if not stream:
+            return self.send_error(404, "unknown stream")
+
+        try:
+            if route == "master.m3u8":
+                url = stream.get_master_playlist()
+                cap = stream.variant_selector.bandwidth if stream.variant_selector else None
+                self.relay(url, lambda lines: proxy.rewrite_master(key, url, lines, cap))
+
+            elif route == "media":
+                url = parse_qs(parts.query).get("u", [None])[0]
+                if url not in proxy.allowed.get(key, ()):
+                    return self.send_error(403, "playlist not listed in the master playlist")
+                # the state stays with the requested url, so cuts carry over when the variant read switches
+                state = proxy.get_state(key, url)
+                upstream = proxy.upstream_url(stream, url)
+                with state.lock:
+                    self.relay(upstream, lambda lines: proxy.rewrite_media(key, state, upstream, lines))
+
+            elif route == "segment" and proxy.cache:
+                url = parse_qs(parts.query).get("u", [None])[0]
+                if not proxy.cache.knows(url):
+                    return self.send_error(403, "segment not listed in a relayed playlist")
+                # pinned, so eviction cannot remove the file between looking it up and sending it
+                with proxy.cache.pinned(url) as path:
+                    self.send_segment(path)
+
+            else:
+                self.send_error(404)
+
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("player closed the connection")
+
+    def relay(self, url, rewrite):
+        ''' Streams the upstream playlist through rewrite to the player using chunked encoding. '''
+        r = transport.get(url, transport.PLAYLIST, stream=True)
+        if not r.ok:
+            r.close()
+            return self.send_error(502, f"upstream returned {r.status_code}")
+
+        self.send_response(200)
+        self.send_header("Content-Type", M3U8_TYPE)
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        with r:
+            r.encoding = r.encoding or "utf-8"
+            buffer = []
+            size = 0
+            for line in rewrite(r.iter_lines(decode_unicode=True)):
+                buffer.append(line)
+                size += len(line) + 1
+                if size >= CHUNK_SIZE:
+                    self.write_chunk(buffer)
+                    buffer = []
+                    size = 0
+            if buffer:
+                self.write_chunk(buffer)
+            self.wfile.write(b"0\r\n\r\n")
+
+    def send_segment(self, path):
+        ''' Sends a cached segment with sendfile, so its bytes never pass through Python. '''
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.send_response(200)
+            self.send_header("Content-Type", TS_TYPE)
+            self.send_header("Content-Length", str(size))
+            self.end_headers()
+            self.wfile.flush()
+            self.connection.sendfile(f)
+
+    def write_chunk(self, lines):
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+_default_proxy = None
+_default_lock = threading.Lock()
+
+def serve(stream, cache=None):
+    ''' Registers stream with the shared proxy, starting it if needed, and returns its local master playlist url.
+        cache only takes effect when the shared proxy is first started. '''
+    global _default_proxy
+    with _default_lock:
+        if _default_proxy is None:
+            _default_proxy = HLSProxy(cache=cache)
+            _default_proxy.start()
+    return _default_proxy.add_stream(stream)
@@ -0,0 +1,209 @@
+import re
+
+EXTM3U = "#EXTM3U"
+STREAM_INF = "#EXT-X-STREAM-INF:"
+MEDIA = "#EXT-X-MEDIA:"
+INF = "#EXTINF:"
+DATE_TIME = "#EXT-X-PROGRAM-DATE-TIME:"
+KEY = "#EXT-X-KEY:"
+MAP = "#EXT-X-MAP:"
+BYTERANGE = "#EXT-X-BYTERANGE:"
+DISCONTINUITY = "#EXT-X-DISCONTINUITY"
+DISCONTINUITY_SEQUENCE = "#EXT-X-DISCONTINUITY-SEQUENCE:"
+DATERANGE = "#EXT-X-DATERANGE:"
+MEDIA_SEQUENCE = "#EXT-X-MEDIA-SEQUENCE:"
+TARGET_DURATION = "#EXT-X-TARGETDURATION:"
+ENDLIST = "#EXT-X-ENDLIST"
+CUE_OUT_CONT = "#EXT-X-CUE-OUT-CONT"
+CUE_OUT = "#EXT-X-CUE-OUT"
+CUE_IN = "#EXT-X-CUE-IN"
+
+OUT = "OUT"
+OUT_CONT = "OUT_CONT"
+IN = "IN"
+
+ATTRIBUTE_SPLIT = re.compile(r'(?:[^,"]|"(?:\\.|[^"])*")+') # commas not inside quotes
+
+def parse_attributes(raw):
+    ''' Parses an attribute list like BANDWIDTH=1,CODECS="a,b" into a dict of strings. '''
+    attributes = {}
+    for param in ATTRIBUTE_SPLIT.findall(raw):
+        if "=" not in param:
+            continue
+        key, value = param.split("=", 1)
+        attributes[key.strip()] = value.strip().strip('"')
+    return attributes
+
+class Variant:
+    ''' A variant stream of a master playlist. '''
+
+    __slots__ = ("attributes", "uri")
+
+    def __init__(self, attributes, uri):
+        self.attributes = attributes
+        self.uri = uri
+
+    @property
+    def bandwidth(self):
+        return int(self.attributes.get("AVERAGE-BANDWIDTH", self.attributes.get("BANDWIDTH", 0)))
+
+class Rendition:
+    ''' An EXT-X-MEDIA alternative rendition, e.g. an audio track. '''
+
+    __slots__ = ("attributes",)
+
+    def __init__(self, attributes):
+        self.attributes = attributes
+
+class Segment:
+
+    __slots__ = ("sequence", "duration", "uri", "title", "program_date_time", "byterange")
+
+    def __init__(self, sequence, duration, uri, title=None, program_date_time=None, byterange=None):
+        self.sequence = sequence
+        self.duration = duration # seconds
+        self.uri = uri
+        self.title = title
+        self.program_date_time = program_date_time # as written in the playlist
+        self.byterange = byterange
+
+class Key:
+    ''' EXT-X-KEY or EXT-X-MAP; applies to every segment after it. '''
+
+    __slots__ = ("tag", "attributes")
+
+    def __init__(self, tag, attributes):
+        self.tag = tag
+        self.attributes = attributes
+
+    @property
+    def method(self):
+        return self.attributes.get("METHOD", "NONE")
+
+    @property
+    def uri(self):
+        return self.attributes.get("URI")
+
+class Discontinuity:
+
+    __slots__ = ("sequence",)
+
+    def __init__(self, sequence):
+        self.sequence = sequence # sequence number of the segment it precedes
+
+class DateRange:
+
+    __slots__ = ("attributes",)
+
+    def __init__(self, attributes):
+        self.attributes = attributes
+
+class Cue:
+    ''' Ad marker: OUT starts a break, OUT_CONT is inside one, IN ends it. '''
+
+    __slots__ = ("kind", "value", "sequence")
+
+    def __init__(self, kind, value, sequence):
+        self.kind = kind
+        self.value = value # the tag's argument, e.g. the break duration
+        self.sequence = sequence # sequence number of the segment it precedes
+
+class Header:
+    ''' Playlist-level tags: target duration, media sequence, endlist and the like. '''
+
+    __slots__ = ("tag", "value")
+
+    def __init__(self, tag, value):
+        self.tag = tag
+        self.value = value
+
+def parse(lines, media_sequence=0):
+    ''' Yields typed records from playlist lines as they arrive, without holding the playlist.
+        Segment numbering follows EXT-X-MEDIA-SEQUENCE, or starts at media_sequence when the
+        lines begin part way through a playlist. '''
+    sequence = media_sequence
+    duration = None
+    title = None
+    program_date_time = None
+    byterange = None
+    stream_inf = None
+
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.strip()
+        if not line:
+            continue
+
+        if line[0] != "#":
+            if stream_inf is not None:
+                yield Variant(stream_inf, line)
+                stream_inf = None
+            else:
+                yield Segment(sequence, duration, line, title, program_date_time, byterange)
+                sequence += 1
+                duration = title = program_date_time = byterange = None
+
+        elif line.startswith(INF):
+            value, _, title = line[len(INF):].partition(",")
+            duration = float(value)
+            title = title or None
+
+        elif line.startswith(DATE_TIME):
+            program_date_time = line[len(DATE_TIME):]
+
+        elif line.startswith(CUE_OUT_CONT):
+            yield Cue(OUT_CONT, line[len(CUE_OUT_CONT) + 1:], sequence)
+
+        elif line.startswith(CUE_OUT):
+            yield Cue(OUT, line[len(CUE_OUT) + 1:], sequence)
+
+        elif line.startswith(CUE_IN):
+            yield Cue(IN, None, sequence)
+
+        elif line.startswith(BYTERANGE):
+            byterange = line[len(BYTERANGE):]
+
+        elif line.startswith(STREAM_INF):
+            stream_inf = parse_attributes(line[len(STREAM_INF):])
+
+        elif line.startswith(MEDIA):
+            yield Rendition(parse_attributes(line[len(MEDIA):]))
+
+        elif line.startswith(KEY):
+            yield Key(KEY, parse_attributes(line[len(KEY):]))
+
+        elif line.startswith(MAP):
+            yield Key(MAP, parse_attributes(line[len(MAP):]))
+
+        elif line.startswith(DISCONTINUITY_SEQUENCE):
+            yield Header(DISCONTINUITY_SEQUENCE, int(line[len(DISCONTINUITY_SEQUENCE):]))
+
+        elif line.startswith(DISCONTINUITY):
+            yield Discontinuity(sequence)
+
+        elif line.startswith(DATERANGE):
+            yield DateRange(parse_attributes(line[len(DATERANGE):]))
+
+        elif line.startswith(MEDIA_SEQUENCE):
+            sequence = int(line[len(MEDIA_SEQUENCE):])
+            yield Header(MEDIA_SEQUENCE, sequence)
+
+        elif line.startswith(TARGET_DURATION):
+            yield Header(TARGET_DURATION, int(float(line[len(TARGET_DURATION):])))
+
+        elif line.startswith(ENDLIST):
+            yield Header(ENDLIST, None)
+
+def iter_lines(r):
+    ''' Lines of a response body, read incrementally when the request was made with stream=True. '''
+    if r.encoding is None:
+        r.encoding = "utf-8"
+    return r.iter_lines(decode_unicode=True)
+
+def parse_response(r, media_sequence=0):
+    ''' parse() over a response, closing it once the records are consumed or abandoned. '''
+    try:
+        yield from parse(iter_lines(r), media_sequence)
+    finally:
+        r.close()
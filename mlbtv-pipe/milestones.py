@@ -17,45 +17,66 @@ LAST = "LAST"
 
 logger = logging.getLogger(__name__)
 
+class Milestone:
+    ''' One entry of the mediaInfo milestone list, without the raw json it came from. '''
+
+    __slots__ = ("type", "relative_time", "absolute_time", "title")
+
+    def __init__(self, milestone_type, milestone):
+        self.type = milestone_type
+        self.relative_time = milestone.get(RELATIVE_TIME)
+        self.absolute_time = milestone.get(ABSOLUTE_TIME)
+        self.title = milestone.get(TITLE)
+
+    def __repr__(self):
+        return f"Milestone({self.type}, {self.relative_time})"
+
 class Milestones:
-    
-    def __init__(self, json):
 
-        self._json = json
+    __slots__ = ("INNINGS", "LAST_INNING", "_types")
+
+    def __init__(self, json):
 
-        self.INNINGS = {}
+        self.INNINGS = {} # {inning: {TOP|BOT: {START|END: Milestone}}}
+        self.LAST_INNING = None
+        self._types = {}
 
-        for ms in self._json:
+        for ms in json:
             self.add_milestone(ms)
 
+    def __getattr__(self, name):
+        # non-inning milestones are reachable as attributes, e.g. self.STREAM_START
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self._types[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
     def add_milestone(self, milestone):
 
         try:
-            mt = milestone.pop(MILESTONE_TYPE)
+            mt = milestone[MILESTONE_TYPE]
         except Exception as err:
             logger.error(f"no valid milestone type in {milestone}")
             raise err
 
         if INNING in mt:
             try:
-                keywords = milestone.pop(KEYWORDS)
-                kws = {}
-                for k in keywords:
-                    kws[k[NAME]] = k[VALUE]
+                kws = {k[NAME]: k[VALUE] for k in milestone[KEYWORDS]}
 
-                if kws["inning"] not in self.INNINGS:
-                    self.INNINGS[kws["inning"]] = {}
+                inning = int(kws["inning"])
+                if inning not in self.INNINGS:
+                    self.INNINGS[inning] = {}
 
-                half = "TOP" if kws["top"] == "true" else "BOT"
-                if half not in self.INNINGS[kws["inning"]]:
-                    self.INNINGS[kws["inning"]][half] = {}
+                half = TOP if kws["top"] == "true" else BOT
+                if half not in self.INNINGS[inning]:
+                    self.INNINGS[inning][half] = {}
 
                 se = START if START in milestone[TITLE] else END
-                # if se not in self.innings[kws["inning"]][half]:
-                #     self.innings[kws["inning"]][half][se] = {}
 
-                self.LAST_INNING = (kws["inning"], half)
-                self.INNINGS[kws["inning"]][half][se] = milestone
+                self.LAST_INNING = (inning, half)
+                self.INNINGS[inning][half][se] = Milestone(mt, milestone)
 
             except Exception as err:
                 logger.error(f"failed to process inning {milestone}")
@@ -63,17 +84,19 @@ class Milestones:
 
             return
 
-        if hasattr(self, mt):
+        if mt in self._types:
             raise ValueError(f"duplicate milestone type: {mt}")
 
-        try:
-            setattr(self, mt, milestone)
-        except Exception as err:
-            logger.error(f"failed to create attribute for: {milestone}")
-            raise err
-        
+        self._types[mt] = Milestone(mt, milestone)
+
+    def get(self, milestone_type):
+        return self._types.get(milestone_type)
+
+    def types(self):
+        return self._types.values()
+
     def get_stream_duration(self, pretty=True):
-        time = self.STREAM_STOP[RELATIVE_TIME] - self.STREAM_START[RELATIVE_TIME]
+        time = self.STREAM_STOP.relative_time - self.STREAM_START.relative_time
         if pretty:
             time = str(timedelta(seconds=time))
         return time
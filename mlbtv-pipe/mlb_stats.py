@@ -1,18 +1,21 @@
+import json
 import logging
 import sys
-import requests
-requests.packages.urllib3.disable_warnings()
+import urllib.error
+import urllib.request
+from . import transport
 from datetime import datetime, timedelta
 from . import utilities as u
+from .schedule_cache import ScheduleCache
 import os
-import keyboard
 
 logger = logging.getLogger(__name__)
 
 AT = " at "
 COL = " | "
 
-SCHEDULE_URL_PREFIX = "https://statsapi.mlb.com/api/v1/schedule?"
+STATSAPI_URL = os.getenv("MLBTV_STATSAPI_URL", "https://statsapi.mlb.com")
+SCHEDULE_URL_PREFIX = f"{STATSAPI_URL}/api/v1/schedule?"
 SCHEDULE_URL_SUFFIX = ",game(content(media(epg)),editorial(preview,recap)),linescore,team,probablePitcher(note)"
 
 IN_MARKET = "Local (In Market)"
@@ -32,12 +35,8 @@ def get_date(days_ago=None):
 
     return date
 
-def get_games_on_date(date=None, days_ago=None):
-    ''' Fetches the MLB schedule for a given date or days ago.
-        Returns a list of games for that date.'''
-    if not date:
-        date = get_date(days_ago=days_ago)
-
+def format_date(date):
+    ''' Returns date as the YYYY-MM-DD string statsapi expects. '''
     if isinstance(date, datetime):
         date = date.strftime("%Y-%m-%d")
 
@@ -46,32 +45,59 @@ def get_games_on_date(date=None, days_ago=None):
     if date.isdigit() and len(date) == 10:
         date = f"{date[:4]}-{date[5:7]}-{date[8:10]}"
 
+    return date
+
+def get_games_on_date(date=None, days_ago=None):
+    ''' Returns the list of games for a given date or days ago, from the schedule cache when it is fresh. '''
+    if not date:
+        date = get_date(days_ago=days_ago)
+
+    return SCHEDULE.get(format_date(date))
+
+def prefetch_games_on_date(date):
+    ''' Starts loading a date's schedule in the background. '''
+    SCHEDULE.prefetch(format_date(date))
+
+def get_json(url):
+    ''' GETs a statsapi url with the standard library instead of transport, so a resolve-only run never loads requests. '''
+    request = urllib.request.Request(url, headers=transport.STATSAPI)
+    with urllib.request.urlopen(request, timeout=transport.READ_TIMEOUT) as r:
+        return json.load(r)
+
+def fetch_schedule(start_date, end_date):
+    ''' Fetches the hydrated MLB schedule for every date from start_date to end_date in one request.
+        Returns the statsapi list of {"date": ..., "games": [...]} entries. '''
     schedule_url_options = [
         "sportId=1",
-        f"startDate={date}",
-        f"endDate={date}",
+        f"startDate={format_date(start_date)}",
+        f"endDate={format_date(end_date)}",
         "hydrate=broadcasts(all)"
     ]
 
     schedule_url = SCHEDULE_URL_PREFIX + "&".join(schedule_url_options) + SCHEDULE_URL_SUFFIX
 
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36",
-            "Connection": "close"}
+    try:
+        return get_json(schedule_url)["dates"]
+    except urllib.error.HTTPError as err:
+        raise Exception(f"Failed to fetch schedule for {start_date} to {end_date}: {err.code} {err.reason}")
+
+def fetch_games_on_date(date):
+    ''' Fetches the MLB schedule for a YYYY-MM-DD date.
+        Returns a list of games for that date.'''
+    dates = fetch_schedule(date, date)
 
-    r = requests.get(schedule_url, headers=headers, verify=False)
-    if not r.ok:
-        raise Exception(f"Failed to fetch schedule for {date}: {r.status_code} {r.reason}")
-    
     try:
-        games = r.json()["dates"][0]["games"]
+        games = dates[0]["games"]
         assert len(games) > 0
         logger.debug(f"found {len(games)} games on date {date}")
     except (IndexError, AssertionError) as err:
-        logger.warning(f"No games found on {date}. Response: {r.text}\n{err}")
+        logger.warning(f"No games found on {date}. Response: {dates}\n{err}")
         return []
         
     return games
 
+SCHEDULE = ScheduleCache(fetch_games_on_date)
+
 def process_status(game):
     '''Process the game status string to a more readable format.
        Returns a string representing the game status.'''
@@ -86,30 +112,38 @@ def process_status(game):
 
     return status
 
-def prompt_games(date=None, days_ago=0):
-
-    if not date:
-        date = get_date(days_ago=days_ago)
-    
-    NUM = "#" #printed column headers
-    MATCH = u.pretty_print_date(date)
-    TZ = u.pretty_print_timezone()
-    STATE = "State"
-
-    AWAY = 0 #enums
-    HOME = 1
-    GAME = 2
-
+NUM = "#" # menu column headers
+STATE = "State"
+NAME = "Stream"
+MEDIA_ID = "MediaID"
+TYPE = "Type"
+AVAILABILE = "Availability"
+FREE = "Free"
+MEDIA = "Media"
+LANGUAGE = "Language"
+TEAM = "Team"
+
+TIME = 0 # menu columns without a fixed header
+AWAY_TEAM = 1
+HOME_TEAM = 2
+GAME = 3
+
+LANGUAGES = {
+    "en": "English",
+    "es": "Spanish",
+    "fr": "French"
+}
+
+def build_games_table(games):
+    ''' Returns the rows of the games menu and the widest value of each column. '''
     ml = { # max lengths
         NUM: len(NUM), #initial min lengths
         AT: len(AT),
-        TZ: len(TZ),
         STATE: len(STATE)
     }
 
-    games = []
-    json = get_games_on_date(date=date)
-    for i, game in enumerate(json):
+    rows = []
+    for i, game in enumerate(games):
 
         hn = game["teams"]["home"]["team"]["name"]
         hw = game["teams"]["home"]["leagueRecord"]["wins"]
@@ -120,9 +154,9 @@ def prompt_games(date=None, days_ago=0):
 
         entry = {
             NUM: u.pesudo_hex(i),
-            AWAY: f"({aw}/{al}) {an}",
-            HOME: f"{hn} ({hw}/{hl})",
-            TZ: u.pretty_print_time_in_timezone(game["gameDate"]),
+            AWAY_TEAM: f"({aw}/{al}) {an}",
+            HOME_TEAM: f"{hn} ({hw}/{hl})",
+            TIME: u.pretty_print_time_in_timezone(game["gameDate"]),
             STATE: process_status(game)
         }
 
@@ -131,21 +165,34 @@ def prompt_games(date=None, days_ago=0):
             ml[key] = max(ml.get(key, 0), value_length)
 
         entry[GAME] = game
-        games.append(entry)
+        rows.append(entry)
+
+    return rows, ml
+
+def prompt_games(date=None, days_ago=0):
+
+    if not date:
+        date = get_date(days_ago=days_ago)
+    
+    MATCH = u.pretty_print_date(date) #printed column headers
+    TZ = u.pretty_print_timezone()
+
+    games, ml = build_games_table(get_games_on_date(date=date))
+    ml[TIME] = max(ml.get(TIME, 0), len(TZ))
 
     menu_width = sum(ml.values()) + ((len(ml)-3) * len(COL))
     hex_chars = ""
-    ml[MATCH] = max(len(MATCH), (ml[AWAY] + ml[AT] + ml[HOME]))
+    ml[MATCH] = max(len(MATCH), (ml.get(AWAY_TEAM, 0) + ml[AT] + ml.get(HOME_TEAM, 0)))
 
     u.clear_terminal()
     print("-" * menu_width)
-    print(f"{NUM:>{ml[NUM]}}{COL}{MATCH:^{ml[MATCH]}}{COL}{TZ:<{ml[TZ]}}{COL}{STATE:<{ml[STATE]}}")
+    print(f"{NUM:>{ml[NUM]}}{COL}{MATCH:^{ml[MATCH]}}{COL}{TZ:<{ml[TIME]}}{COL}{STATE:<{ml[STATE]}}")
     print("-" * menu_width)
 
     if not games:
         print(f"{'':>{ml[NUM] + len(COL)}}{'No games':^{menu_width}}")
     for g in games:
-        print(f"{g[NUM]:>{ml[NUM]}}{COL}{g[AWAY]:>{ml[AWAY]}}{AT:^{ml[AT]}}{g[HOME]:<{ml[HOME]}}{COL}{g[TZ]:<{ml[TZ]}}{COL}{g[STATE]}")
+        print(f"{g[NUM]:>{ml[NUM]}}{COL}{g[AWAY_TEAM]:>{ml[AWAY_TEAM]}}{AT:^{ml[AT]}}{g[HOME_TEAM]:<{ml[HOME_TEAM]}}{COL}{g[TIME]:<{ml[TIME]}}{COL}{g[STATE]}")
         hex_chars += str(g[NUM])
 
     print("-" * menu_width)
@@ -158,6 +205,13 @@ def prompt_games(date=None, days_ago=0):
         hc = f"inspect game: [{hex_chars[0]}-{hex_chars[-1]}],"
 
     print(f"previous: z, quit: q, {hc} next: x")
+
+    # load the days z and x open while the user reads the menu
+    previous_day, next_day = date - timedelta(days=1), date + timedelta(days=1)
+    prefetch_games_on_date(previous_day)
+    prefetch_games_on_date(next_day)
+
+    import keyboard # needs root on Linux, so only the interactive menus load it
     while True:
         event = keyboard.read_event(suppress=True)
         if event.event_type == keyboard.KEY_DOWN:
@@ -171,16 +225,12 @@ def prompt_games(date=None, days_ago=0):
                     print("Exiting...")
                     sys.exit()
                 case 'z': #recursive
-                    return prompt_games(days_ago=days_ago + 1)
+                    return prompt_games(date=previous_day)
                 case 'x':
-                    return prompt_games(days_ago=days_ago - 1)
-
+                    return prompt_games(date=next_day)
 
-def prompt_streams(game):
-    """
-    Prompt the user to select a stream for the given game.
-    Returns a media_id
-    """
+def build_streams_table(game):
+    ''' Returns the game's display info, the rows of its streams menu and the widest value of each column. '''
     game_info = { #useful game info for display
         "gamePk": game["gamePk"],
         "datetime": u.pretty_print_datetime_in_timezone(game["gameDate"]),
@@ -204,22 +254,6 @@ def prompt_streams(game):
         }
     }
 
-    NUM = "#" #printed column headers
-    NAME = "Stream"
-    MEDIA_ID = "MediaID"
-    TYPE = "Type"
-    AVAILABILE = "Availability"
-    FREE = "Free"
-    STATE = "Media"
-    LANGUAGE = "Language"
-    TEAM = "Team"
-
-    languages = {
-        "en": "English",
-        "es": "Spanish",
-        "fr": "French"
-    }
-
     broadcasts = []
     ml = { # max lengths
         NUM: len(NUM),
@@ -227,7 +261,7 @@ def prompt_streams(game):
         TYPE: len(TYPE),
         AVAILABILE: len(AVAILABILE),
         FREE: len(FREE),
-        STATE: len(STATE),
+        MEDIA: len(MEDIA),
         LANGUAGE: len(LANGUAGE),
         TEAM: len(TEAM)
     }
@@ -244,13 +278,13 @@ def prompt_streams(game):
             TYPE: broadcast["type"],
             AVAILABILE: broadcast.get("availability", {}).get("availabilityText", "N/A"),
             FREE: str(broadcast["freeGame"]),
-            STATE: broadcast["mediaState"]["mediaStateText"],
-            LANGUAGE: languages.get(broadcast["language"], broadcast["language"]),
+            MEDIA: broadcast["mediaState"]["mediaStateText"],
+            LANGUAGE: LANGUAGES.get(broadcast["language"], broadcast["language"]),
             TEAM: game_info["teams"][broadcast["homeAway"]]["abbr"]
         }
 
-        if "Media " in entry[STATE]:
-            entry[STATE] = entry[STATE].replace("Media ", "").strip()
+        if "Media " in entry[MEDIA]:
+            entry[MEDIA] = entry[MEDIA].replace("Media ", "").strip()
             
         if "Local (" in entry[AVAILABILE]:
             entry[AVAILABILE] = entry[AVAILABILE][:-1].replace("Local (", "").strip()
@@ -266,6 +300,15 @@ def prompt_streams(game):
         broadcasts.append(entry)
         i += 1
 
+    return game_info, broadcasts, ml
+
+def prompt_streams(game):
+    """
+    Prompt the user to select a stream for the given game.
+    Returns a media_id
+    """
+    game_info, broadcasts, ml = build_streams_table(game)
+
     menu_width = sum(ml.values()) + ((len(ml)-1) * len(COL))
     hex_chars = ""
 
@@ -274,13 +317,13 @@ def prompt_streams(game):
     print(f"{game_info['teams']['away']['name']}{AT}{game_info['teams']['home']['name']}".center(menu_width))
     print(f"{game_info['datetime'].center(menu_width)}")
     print("-" * menu_width)
-    print(f"{NUM:^{ml[NUM]}}{COL}{NAME:^{ml[NAME]}}{COL}{TYPE:^{ml[TYPE]}}{COL}{AVAILABILE:^{ml[AVAILABILE]}}{COL}{FREE:^{ml[FREE]}}{COL}{STATE:^{ml[STATE]}}{COL}{LANGUAGE:^{ml[LANGUAGE]}}{COL}{TEAM:^{ml[TEAM]}}")
+    print(f"{NUM:^{ml[NUM]}}{COL}{NAME:^{ml[NAME]}}{COL}{TYPE:^{ml[TYPE]}}{COL}{AVAILABILE:^{ml[AVAILABILE]}}{COL}{FREE:^{ml[FREE]}}{COL}{MEDIA:^{ml[MEDIA]}}{COL}{LANGUAGE:^{ml[LANGUAGE]}}{COL}{TEAM:^{ml[TEAM]}}")
     print("-" * menu_width)
     
     if not broadcasts:
         print(f"{'No broadcasts':^{menu_width}}")
     for b in broadcasts:
-        print(f"{b[NUM]:>{ml[NUM]}}{COL}{b[NAME]:>{ml[NAME]}}{COL}{b[TYPE]:<{ml[TYPE]}}{COL}{b[AVAILABILE]:<{ml[AVAILABILE]}}{COL}{b[FREE]:<{ml[FREE]}}{COL}{b[STATE]:<{ml[STATE]}}{COL}{b[LANGUAGE]:<{ml[LANGUAGE]}}{COL}{b[TEAM]:<{ml[TEAM]}}")
+        print(f"{b[NUM]:>{ml[NUM]}}{COL}{b[NAME]:>{ml[NAME]}}{COL}{b[TYPE]:<{ml[TYPE]}}{COL}{b[AVAILABILE]:<{ml[AVAILABILE]}}{COL}{b[FREE]:<{ml[FREE]}}{COL}{b[MEDIA]:<{ml[MEDIA]}}{COL}{b[LANGUAGE]:<{ml[LANGUAGE]}}{COL}{b[TEAM]:<{ml[TEAM]}}")
         hex_chars += str(b[NUM])
 
     print("-" * menu_width)
@@ -293,6 +336,7 @@ def prompt_streams(game):
         hc = f"select stream: [{hex_chars[0]}-{hex_chars[-1]}],"
 
     print(f"{hc} quit: q")
+    import keyboard # needs root on Linux, so only the interactive menus load it
     while True:
         event = keyboard.read_event(suppress=True)
         if event.event_type == keyboard.KEY_DOWN:
@@ -307,45 +351,70 @@ def prompt_streams(game):
                     print("Exiting...")
                     sys.exit()
 
+def is_team(team, team_name):
+    ''' Whether a statsapi team matches a full name or abbreviation, ignoring case. '''
+    team_name = team_name.lower()
+    return team_name in (team["name"].lower(), team.get("abbreviation", "").lower())
+
 def get_team_game_from_games(games, team_name):
     for game in games:
         gamepk = game["gamePk"]
         home_team = game["teams"]["home"]["team"]["name"]
         away_team = game["teams"]["away"]["team"]["name"]
 
-        if team_name in [home_team, away_team]:
+        if is_team(game["teams"]["home"]["team"], team_name) or is_team(game["teams"]["away"]["team"], team_name):
             logger.info(f"found game: {away_team} at {home_team}")
             logger.info(f"    {u.pretty_print_datetime_in_timezone(game['gameDate'])}")
             logger.info(f"    game PK: {gamepk}")
             return game
         
-    raise Exception(f"No game found for {team_name} on {games['dates'][0]['date']}")
+    raise Exception(f"No game found for {team_name}")
+
+def get_game_from_games(games, game_pk=None, media_id=None):
+    ''' Returns the game with the given gamePk, or the one carrying the given broadcast media id. '''
+    for game in games:
+        if game_pk and str(game["gamePk"]) == str(game_pk):
+            return game
+        if media_id and any(b.get("mediaId") == media_id for b in game.get("broadcasts", [])):
+            return game
 
-def get_stream_from_game(game, team_name):
+    raise Exception(f"No game found for gamePk {game_pk} / media ID {media_id}")
+
+def is_preferred_broadcast(broadcast, home_away):
+    ''' Whether broadcast is an English TV stream we can watch for the home or away side. '''
+    # statsapi leaves fields such as availability out of some broadcasts
+    availability = broadcast.get("availability", {}).get("availabilityText")
+    tv = ("TV" in broadcast.get("type", ""))
+    availabile = (availability in [IN_MARKET, NATIONAL, EXCLUSIVE])
+    special = (availability in [NATIONAL, EXCLUSIVE])
+    free = ("true" in str(broadcast.get("freeGame")).lower())
+    streaming = ("true" in str(broadcast.get("availableForStreaming")).lower())
+    #media_on = (broadcast["mediaState"]["mediaStateText"] == MEDIA_ON)
+    english = (broadcast.get("language") == "en")
+    our_side = (home_away in broadcast.get("homeAway", ""))
+
+    return tv and (availabile or free) and streaming and english and (our_side or special)
+
+def get_stream_from_game(game, team_name=None):
+    ''' Returns the media id of the team's preferred broadcast, or of the home then away side's without a team. '''
     home_team = game["teams"]["home"]["team"]["name"]
     away_team = game["teams"]["away"]["team"]["name"]
 
-    if team_name == home_team:
-        home_away = "home"
-    elif team_name == away_team:
-        home_away = "away"
+    if team_name is None:
+        sides = ["home", "away"]
+    elif is_team(game["teams"]["home"]["team"], team_name):
+        sides = ["home"]
+    elif is_team(game["teams"]["away"]["team"], team_name):
+        sides = ["away"]
     else:
         raise Exception(f"Team {team_name} not found in gamepk {game['gamePk']} between {away_team} and {home_team}")
 
-    for broadcast in game["broadcasts"]:
-        tv = ("TV" in broadcast["type"])
-        availabile = (broadcast["availability"]["availabilityText"]  in [IN_MARKET, NATIONAL, EXCLUSIVE])
-        special = (broadcast["availability"]["availabilityText"]  in [NATIONAL, EXCLUSIVE])
-        free = ("true" in str(broadcast["freeGame"]).lower())
-        streaming = ("true" in str(broadcast["availableForStreaming"]).lower())
-        #media_on = (broadcast["mediaState"]["mediaStateText"] == MEDIA_ON)
-        english = (broadcast["language"] == "en")
-        our_side = (home_away in broadcast["homeAway"])
-
-        if tv and (availabile or free) and streaming and english and (our_side or special):
-            media_id = broadcast["mediaId"]
-            logger.info(f"found broadcast: {broadcast['name']}")
-            logger.info(f"    media ID: {media_id}")
-            return media_id
+    for home_away in sides:
+        for broadcast in game["broadcasts"]:
+            if is_preferred_broadcast(broadcast, home_away):
+                media_id = broadcast["mediaId"]
+                logger.info(f"found broadcast: {broadcast['name']}")
+                logger.info(f"    media ID: {media_id}")
+                return media_id
         
     raise Exception(f"No valid broadcast found for {team_name} in gamepk {game['gamePk']} between {away_team} and {home_team}")
\ No newline at end of file
@@ -1,20 +1,24 @@
 from datetime import datetime
+import logging
+import threading
 import time
 import os
-import requests
 import random
 import string
 import base64
 import hashlib
 
 from .mlbtv_token import Token
+from .token_store import TokenStore
+from . import transport
 
-INTERACT_URL = "https://ids.mlb.com/oauth2/aus1m088yK07noBfh356/v1/interact"
-INTROSPECT_URL = "https://ids.mlb.com/idp/idx/introspect"
-IDENTITY_URL = "https://ids.mlb.com/idp/idx/identify"
-CHALLENGE_URL = "https://ids.mlb.com/idp/idx/challenge"
-ANSWER_URL = "https://ids.mlb.com/idp/idx/challenge/answer"
-TOKEN_URL = "https://ids.mlb.com/oauth2/aus1m088yK07noBfh356/v1/token"
+IDS_URL = os.getenv("MLBTV_IDS_URL", "https://ids.mlb.com")
+INTERACT_URL = f"{IDS_URL}/oauth2/aus1m088yK07noBfh356/v1/interact"
+INTROSPECT_URL = f"{IDS_URL}/idp/idx/introspect"
+IDENTITY_URL = f"{IDS_URL}/idp/idx/identify"
+CHALLENGE_URL = f"{IDS_URL}/idp/idx/challenge"
+ANSWER_URL = f"{IDS_URL}/idp/idx/challenge/answer"
+TOKEN_URL = f"{IDS_URL}/oauth2/aus1m088yK07noBfh356/v1/token"
 
 USERNAME = "erik.rad@gmail.com"
 PASSWORD = "#a7ZB8b!X53CjLC"
@@ -31,6 +35,12 @@ The network request merely sends the client_id as part of the payload.
 It doesn't reveal the logic used to generate or retrieve that value on the client side.
 '''
 CLIENT_ID = "0oap7wa857jcvPlZ5355"
+SCOPE = "openid%20email%20offline_access" # offline_access gets a refresh token, so renewals skip the login flow
+
+REFRESH_MARGIN = 300 # renew tokens this many seconds before they expire, or halfway through shorter lived ones
+RETRY_INTERVAL = 30 # seconds between attempts when a background renewal fails
+
+logger = logging.getLogger(__name__)
 
 def gen_random_string(n):
     """Generate a random string of uppercase letters and digits of length n."""
@@ -38,10 +48,16 @@ def gen_random_string(n):
 
 class Account:
 
-    def __init__(self, username=USERNAME, password=PASSWORD):
+    def __init__(self, username=USERNAME, password=PASSWORD, store=None):
         self.username = username
         self.password = password
         self.__token__ = None
+        self.__lock__ = threading.RLock()
+        self.__refresher__ = None
+        self.__stop_refresher__ = threading.Event()
+
+        # pass store=False to keep tokens in memory only
+        self.store = TokenStore() if store is None else store
 
         self.code_verifier = None
         self.code_challenge = None
@@ -64,11 +80,103 @@ class Account:
         self.code_challenge = code_challenge
 
     def get_token(self):
+        with self.__lock__:
+            return transport.run(self.__get_token__())
+
+    def renew_token(self):
+        ''' Renews the token with its refresh token, or runs the login flow from the start when that fails, and saves it.
+            An existing Token object is updated in place, so streams holding it pick up the renewal. '''
+        with self.__lock__:
+            transport.run(self.__renew_token__())
+
+    def refresh(self):
+        ''' Renews the token with a refresh_token grant, one request instead of the six of the login flow. '''
+        with self.__lock__:
+            transport.run(self.__refresh__())
+            if self.store:
+                self.store.save(self.username, self.__token__)
+
+    def __get_token__(self):
         if not self.__token__:
-            self.__gen_token__()
-            
+            self.__load_token__()
+
+        if not self.__token__ or self.__token__.secs_until_expired() < self.__renew_margin__(self.__token__):
+            yield from self.__renew_token__()
+
         return self.__token__
 
+    def __renew_token__(self):
+        if self.__token__ and self.__token__.refresh_token:
+            try:
+                yield from self.__refresh__()
+            except Exception as err:
+                logger.info(f"token refresh failed, logging in again: {err}")
+            else:
+                if self.store:
+                    self.store.save(self.username, self.__token__)
+                logger.info(f"token refreshed, expires in {self.__token__.secs_until_expired()}s")
+                return
+
+        self.__reset_flow__()
+        yield from self.__gen_token__()
+        if self.store:
+            self.store.save(self.username, self.__token__)
+        logger.info(f"token renewed, expires in {self.__token__.secs_until_expired()}s")
+
+    def start_refresher(self):
+        ''' Starts a daemon thread that renews the token REFRESH_MARGIN seconds before it expires. '''
+        if self.__refresher__ and self.__refresher__.is_alive():
+            return
+
+        self.get_token()
+        self.__stop_refresher__.clear()
+        self.__refresher__ = threading.Thread(target=self.__refresh_loop__, name="token-refresher", daemon=True)
+        self.__refresher__.start()
+
+    def stop_refresher(self):
+        self.__stop_refresher__.set()
+
+    def __refresh_loop__(self):
+        wait = self.__refresh_wait__()
+        while not self.__stop_refresher__.wait(wait):
+            try:
+                self.renew_token()
+                wait = self.__refresh_wait__()
+            except Exception as err:
+                logger.error(f"background token renewal failed: {err}")
+                wait = RETRY_INTERVAL
+
+    def __renew_margin__(self, token):
+        ''' Seconds ahead of expiry to renew token: REFRESH_MARGIN, or half the lifetime of a token that lives less than twice that. '''
+        return min(REFRESH_MARGIN, token.expires_secs / 2)
+
+    def __refresh_wait__(self):
+        token = self.__token__
+        wait = token.secs_until_expired() - self.__renew_margin__(token)
+        # a floor, so a server handing out tokens that are about to expire is not asked again in a loop
+        return max(wait, min(RETRY_INTERVAL, token.expires_secs / 2))
+
+    def __load_token__(self):
+        if not self.store:
+            return
+
+        token = self.store.load(self.username)
+        # an expired token is still worth loading for its refresh token
+        if token and (token.secs_until_expired() > self.__renew_margin__(token) or token.refresh_token):
+            self.__token__ = token
+
+    def __reset_flow__(self):
+        self.code_verifier = None
+        self.code_challenge = None
+        self.interaction_handle = None
+        self.introspect_state_handle = None
+        self.identity_state_handle = None
+        self.id_email = None
+        self.id_password = None
+        self.challenge_state_handle = None
+        self.answer_state_handle = None
+        self.interaction_code = None
+
     def __interact__(self):
         #begin INTERACT
         state_param = gen_random_string(64)
@@ -78,7 +186,7 @@ class Account:
         self.__gen_challenge__()
 
         payload = [f"client_id={CLIENT_ID}",
-                "scope=openid%20email",
+                f"scope={SCOPE}",
                 "redirect_uri=https%3A%2F%2Fwww.mlb.com%2Flogin",
                 f"code_challenge={self.code_challenge}",
                 "code_challenge_method=S256",
@@ -87,23 +195,7 @@ class Account:
         ]
         payload = '&'.join(payload)
 
-        headers = {"Accept": "application/json",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Accept-Language": "en",
-                "Content-Type": "application/x-www-form-urlencoded",
-                "Origin": "https://www.mlb.com",
-                "Priority": "u=1, i",
-                "Referer": "https://www.mlb.com/login?redirectUri=/",
-                "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-                "Sec-Ch-Ua-Mobile": "?0",
-                "sec-Ch-Ua-Platform": '"Windows"',
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-site",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
-        }
-
-        r = requests.post(INTERACT_URL, headers=headers, data=payload, verify=False)
+        r = yield transport.Request("POST", INTERACT_URL, transport.OKTA_FORM, data=payload, verify=False)
 
         if not r.ok:
             raise Exception(f"INTERACT failed: {r.text}")
@@ -114,27 +206,11 @@ class Account:
         #begin INTROSPECT
 
         if not self.interaction_handle:
-            self.__interact__() 
+            yield from self.__interact__()
 
         payload = '{"interactionHandle":"%s"}' % self.interaction_handle
 
-        headers = {"Accept": "application/ion+json; okta-version=1.0.0",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Accept-Language": "en",
-                "Content-Type": "application/ion+json; okta-version=1.0.0",
-                "Origin": "https://www.mlb.com",
-                "Priority": "u=1, i",
-                "Referer": "https://www.mlb.com/login?redirectUri=/",
-                "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-                "Sec-Ch-Ua-Mobile": "?0",
-                "sec-Ch-Ua-Platform": '"Windows"',
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-site",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
-        }
-
-        r = requests.post(INTROSPECT_URL, headers=headers, data=payload, verify=False)
+        r = yield transport.Request("POST", INTROSPECT_URL, transport.OKTA_ION, data=payload, verify=False)
 
         if not r.ok:
             raise Exception(f"INTROSPECT failed: {r.text}")
@@ -145,27 +221,11 @@ class Account:
         # begin IDENTITY
 
         if not self.introspect_state_handle:
-            self.__introspect__()
+            yield from self.__introspect__()
 
         payload = '{"identifier":"%s","stateHandle":"%s"}' % (self.username, self.introspect_state_handle)
 
-        headers = {"Accept": "application/json; okta-version=1.0.0",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Accept-Language": "en",
-                "Content-Type": "application/json",
-                "Origin": "https://www.mlb.com",
-                "Priority": "u=1, i",
-                "Referer": "https://www.mlb.com/login?redirectUri=/",
-                "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-                "Sec-Ch-Ua-Mobile": "?0",
-                "sec-Ch-Ua-Platform": '"Windows"',
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-site",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
-        }
-
-        r = requests.post(IDENTITY_URL, headers=headers, data=payload, verify=False)
+        r = yield transport.Request("POST", IDENTITY_URL, transport.OKTA_JSON, data=payload, verify=False)
 
         if not r.ok:
             raise Exception(f"IDENTITY failed: {r.text}")
@@ -189,27 +249,11 @@ class Account:
         # begin CHALLENGE
 
         if not self.id_password or not self.identity_state_handle:
-            self.__identity__()
+            yield from self.__identity__()
 
         payload = '{"authenticator":{"id":"%s"},"stateHandle":"%s"}' % (self.id_password, self.identity_state_handle)
 
-        headers = {"Accept": "application/json; okta-version=1.0.0",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Accept-Language": "en",
-                "Content-Type": "application/json",
-                "Origin": "https://www.mlb.com",
-                "Priority": "u=1, i",
-                "Referer": "https://www.mlb.com/login?redirectUri=/",
-                "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-                "Sec-Ch-Ua-Mobile": "?0",
-                "sec-Ch-Ua-Platform": '"Windows"',
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-site",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
-        }
-
-        r = requests.post(CHALLENGE_URL, headers=headers, data=payload, verify=False)
+        r = yield transport.Request("POST", CHALLENGE_URL, transport.OKTA_JSON, data=payload, verify=False)
 
         if not r.ok:
             raise Exception(f"CHALLENGE failed: {r.text}")
@@ -220,27 +264,11 @@ class Account:
         # begin ANSWER
 
         if not self.challenge_state_handle:
-            self.__challenge__()
+            yield from self.__challenge__()
 
         payload = '{"credentials":{"passcode":"%s"},"stateHandle":"%s"}' % (self.password, self.challenge_state_handle)
 
-        headers = {"Accept": "application/json; okta-version=1.0.0",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Accept-Language": "en",
-                "Content-Type": "application/json",
-                "Origin": "https://www.mlb.com",
-                "Priority": "u=1, i",
-                "Referer": "https://www.mlb.com/login?redirectUri=/",
-                "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-                "Sec-Ch-Ua-Mobile": "?0",
-                "sec-Ch-Ua-Platform": '"Windows"',
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-site",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
-        }
-
-        r = requests.post(ANSWER_URL, headers=headers, data=payload, verify=False)
+        r = yield transport.Request("POST", ANSWER_URL, transport.OKTA_JSON, data=payload, verify=False)
 
         if not r.ok:
             raise Exception(f"ANSWER failed: {r.text}")
@@ -260,7 +288,7 @@ class Account:
         #begin TOKEN
 
         if not self.interaction_code:
-            self.__answer__()
+            yield from self.__answer__()
 
         if not self.code_verifier:
             raise ValueError("Code verifier is not set. Authentication is occuring out of order.")
@@ -273,28 +301,32 @@ class Account:
         ]
         payload = '&'.join(payload)
 
-        headers = {"Accept": "application/json",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Accept-Language": "en",
-                "Content-Type": "application/x-www-form-urlencoded",
-                "Origin": "https://www.mlb.com",
-                "Priority": "u=1, i",
-                "Referer": "https://www.mlb.com/login?redirectUri=/",
-                "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-                "Sec-Ch-Ua-Mobile": "?0",
-                "sec-Ch-Ua-Platform": '"Windows"',
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-site",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
-        }
-
-        r = requests.post(TOKEN_URL, headers=headers, data=payload, verify=False)
+        r = yield transport.Request("POST", TOKEN_URL, transport.OKTA_FORM, data=payload, verify=False)
 
         if not r.ok:
             raise Exception(f"TOKEN failed: {r.text}")
 
-        self.__token__ = Token(r.json()) 
+        if self.__token__:
+            self.__token__.update(r.json())
+        else:
+            self.__token__ = Token(r.json())
 
         #print(f"Access token generated: {self.__token__}")
 
+
+    def __refresh__(self):
+        #begin REFRESH
+
+        payload = [f"client_id={CLIENT_ID}",
+                "grant_type=refresh_token",
+                f"scope={SCOPE}",
+                f"refresh_token={self.__token__.refresh_token}"
+        ]
+        payload = '&'.join(payload)
+
+        r = yield transport.Request("POST", TOKEN_URL, transport.OKTA_FORM, data=payload, verify=False)
+
+        if not r.ok:
+            raise Exception(f"REFRESH failed: {r.text}")
+
+        self.__token__.update(r.json())
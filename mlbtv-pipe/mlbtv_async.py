@@ -0,0 +1,62 @@
+import asyncio
+from .mlbtv_account import Account, USERNAME, PASSWORD
+from .mlbtv_stream import Stream
+from . import async_transport
+
+class AsyncAccount:
+    ''' Account whose login runs on the event loop. The flow itself is the same one Account uses. '''
+
+    def __init__(self, username=USERNAME, password=PASSWORD, store=None, client=None):
+        self.account = Account(username, password, store)
+        self.client = client or async_transport.get_client()
+        self._lock = asyncio.Lock()
+
+    async def get_token(self):
+        async with self._lock:
+            return await self.client.run(self.account.__get_token__())
+
+    async def renew_token(self):
+        async with self._lock:
+            await self.client.run(self.account.__renew_token__())
+
+class AsyncStream:
+    ''' Stream whose requests run on the event loop, so one process can drive many games at once.
+        The wrapped Stream holds the state, so the sync helpers built on it (timeline, tailer) still work. '''
+
+    def __init__(self, token, game_pk, media_id, devices=None, client=None):
+        self.stream = Stream(token, game_pk, media_id, devices)
+        self.client = client or async_transport.get_client()
+        self._lock = asyncio.Lock() # concurrent getters share one initPlaybackSession
+        self._milestones_lock = asyncio.Lock() # mediaInfo needs no session, so it need not wait for one
+
+    async def get_master_playlist(self):
+        async with self._lock:
+            if not self.stream._master_playlist:
+                await self.client.run(self.stream._gen_master_playlist())
+        return self.stream._master_playlist
+
+    async def get_media_playlists(self):
+        async with self._lock:
+            if not self.stream._media_playlists:
+                await self.client.run(self.stream._gen_media_playlists())
+        return self.stream._media_playlists
+
+    async def get_milestones(self):
+        async with self._milestones_lock:
+            if not self.stream._milestones:
+                await self.client.run(self.stream._gen_milestones())
+        return self.stream._milestones
+
+    async def get_commercial_breaks(self):
+        async with self._lock:
+            if self.stream._commercial_breaks is None:
+                await self.client.run(self.stream._gen_commercial_breaks())
+        return self.stream._commercial_breaks
+
+    async def fetch_media_playlist(self, number=None):
+        async with self._lock:
+            return await self.client.run(self.stream._fetch_media_playlist(number))
+
+    async def fetch_media_records(self, number=None, consume=list):
+        async with self._lock:
+            return await self.client.run(self.stream._fetch_media_records(number, consume))
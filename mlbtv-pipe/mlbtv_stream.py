@@ -1,22 +1,28 @@
 
-from datetime import datetime
+from datetime import datetime, timezone
 import logging
-import re
+import os
 import sys
-import keyboard
-import requests
-requests.packages.urllib3.disable_warnings()
+import threading
 from .mlbtv_token import Token
 from .milestones import Milestones
+from .segment_table import SegmentTable
+from .playlist_tailer import MediaPlaylistTailer
+from .timeline import Timeline
+from . import device_store
+from . import transport
+from . import m3u8
 import csv
 import io
 from enum import Enum, auto
 from . import utilities as u
 
-GRAPHQL_URL = "https://media-gateway.mlb.com/graphql"
-STREAM_INF = "#EXT-X-STREAM-INF:"
+MEDIA_GATEWAY_URL = os.getenv("MLBTV_MEDIA_GATEWAY_URL", "https://media-gateway.mlb.com")
+GRAPHQL_URL = f"{MEDIA_GATEWAY_URL}/graphql"
 URI = "URI"
 BW = "BANDWIDTH"
+RENEW_MARGIN = 600 # renew the playback session this many seconds before it expires
+RENEW_CHECK_INTERVAL = 60 # seconds between expiration checks when the server asks for no heartbeat
 AT = " at "
 COL = " | "
 
@@ -40,50 +46,165 @@ def format_bandwidth(bps):
     else:
         return f"{bps} bps"
 
+def is_graphql_ok(r, operation):
+    ''' GraphQL reports most failures with a 200 and an errors list, so check the operation returned data. '''
+    if not r.ok:
+        return False
+    try:
+        return bool((r.json().get("data") or {}).get(operation))
+    except ValueError:
+        return False
+
 #get games
 #GAME_PK = "777218"
 #MEDIA_ID = "408db4cb-41de-4805-80ea-62700421f33b"
 
 class Stream():
 
-    def __init__(self, token: Token, game_pk: str, media_id: str):
+    def __init__(self, token: Token, game_pk: str, media_id: str, devices=None):
         self.token = token
+        self.devices = devices or device_store.get_default_store()
         self.game_pk = game_pk
         self.media_id = media_id
         self.url = "https://www.mlb.com/tv/g%s/v%s" % (self.game_pk, self.media_id)
 
         self._device_id = ""
         self._session_id = None
+        self._session_cached = False
         self._master_playlist = None
         self._playlist_prefix = None
         self._playback_session_id = None
+        self.heartbeat_url = None
+        self.heartbeat_interval = None # seconds
+        self.playback_expiration = None # aware datetime
+        self._playback_listeners = []
+        self._superseded = {} # media playlist url from an earlier playback session -> variant number
+        self._renew_lock = threading.Lock()
         self._media_playlists = None
         self._milestones = None
         self._commercial_breaks = None
+        self._segment_table = None
+        self._tailer = None
+        self._timeline = None
+        self.variant_selector = None
+
+    def init_session(self):
+        ''' Runs initSession, or picks up the cached device session, ahead of get_master_playlist. '''
+        if not self._session_id:
+            transport.run(self._gen_session())
 
     def get_master_playlist(self):
         if not self._master_playlist:
-            self._gen_master_playlist()
+            transport.run(self._gen_master_playlist())
         return self._master_playlist
     
+    def start_heartbeat(self):
+        ''' Keeps the playback session alive from the process-wide heartbeat.HeartbeatScheduler: heartbeats at the
+            interval the server asked for, and a renewal RENEW_MARGIN seconds before the session expires.
+            Returns False if the server asked for neither. '''
+        from . import heartbeat
+
+        self.get_master_playlist()
+        if not self.heartbeat_url and not self.playback_expiration:
+            logger.debug("initPlaybackSession asked for no heartbeat and gave no expiration")
+            return False
+        if not self.heartbeat_url or not self.heartbeat_interval:
+            self.heartbeat_interval = RENEW_CHECK_INTERVAL
+        heartbeat.get_scheduler().add(self)
+        return True
+
+    def stop_heartbeat(self):
+        from . import heartbeat
+        heartbeat.get_scheduler().remove(self)
+
+    def heartbeat(self):
+        expires_in = self.playback_expires_in()
+        if expires_in is not None and expires_in < RENEW_MARGIN:
+            self.renew_playback()
+        if self.heartbeat_url:
+            transport.run(self._gen_heartbeat())
+
+    def playback_expires_in(self):
+        ''' Seconds until the playback session expires, or None if the server gave no expiration. '''
+        if not self.playback_expiration:
+            return None
+        return (self.playback_expiration - datetime.now(timezone.utc)).total_seconds()
+
+    def add_playback_listener(self, callback):
+        ''' callback(master_playlist_url) is called after renew_playback() replaces the playback session. '''
+        self._playback_listeners.append(callback)
+
+    def renew_playback(self):
+        ''' Starts a new playback session for the same game, without a new initSession, and hands its
+            master playlist to the listeners, e.g. a running player. Media playlist urls of the old session
+            still resolve to the same variant of the new one through resolve_media_url(). '''
+        with self._renew_lock:
+            if self._master_playlist and not self._media_playlists:
+                # a player may hold variant urls of the old session that nothing here read, e.g. through hls_proxy
+                try:
+                    self.get_media_playlists()
+                except Exception as err:
+                    logger.warning(f"could not read the variants of the old playback session: {err}")
+            old = [self.media_playlist_url(n) for n in range(len(self._media_playlists or ()))]
+            transport.run(self._gen_master_playlist())
+            if old:
+                self._superseded.update((url, number) for number, url in enumerate(old))
+                transport.run(self._gen_media_playlists())
+            if self._tailer:
+                self._tailer.url = self.media_playlist_url(self._tailer.number)
+        logger.info(f"playback session renewed, expires in {self.playback_expires_in()}s")
+
+        for callback in self._playback_listeners:
+            try:
+                callback(self._master_playlist)
+            except Exception as err:
+                logger.warning(f"playback renewal listener failed: {err}")
+        return self._master_playlist
+
+    def resolve_media_url(self, url):
+        ''' The current url of a media playlist url that may come from an earlier playback session. '''
+        number = self._superseded.get(url)
+        return url if number is None else self.media_playlist_url(number)
+
     def get_media_playlists(self):
         if not self._media_playlists:
-            self._gen_media_playlists()
+            transport.run(self._gen_media_playlists())
         return self._media_playlists
     
     def get_milestones(self):
         if not self._milestones:
-            self._gen_milestones()
+            transport.run(self._gen_milestones())
         return self._milestones
     
     def get_commercial_breaks(self):
-        if not self._commercial_breaks:
-            self._gen_commercial_breaks()
+        if self._commercial_breaks is None:
+            transport.run(self._gen_commercial_breaks())
         return self._commercial_breaks
 
-    def _gen_session(self):
+    def get_segment_table(self):
+        ''' Returns the columnar SegmentTable of the variant being read, read once and kept for later queries. '''
+        if self._segment_table is None:
+            transport.run(self._gen_commercial_breaks())
+        return self._segment_table
+
+    def get_timeline(self, milestones=False):
+        ''' Returns the Timeline over this stream's commercial breaks, with milestones indexed if asked. '''
+        if not self._timeline:
+            self._timeline = Timeline(self.get_commercial_breaks())
+        if milestones and not self._timeline.half_innings_indexed():
+            self._timeline.set_milestones(self.get_milestones())
+        return self._timeline
+
+    def _gen_session(self, use_cache=True):
         #begin INIT_SESSION
 
+        cached = self.devices.get(self.token.subject) if use_cache and self.token.subject else None
+        if cached:
+            self._device_id, self._session_id = cached
+            self._session_cached = True
+            logger.debug("reusing cached device session")
+            return
+
         payload = {
             "operationName": "initSession",
             "query": '''mutation initSession($device: InitSessionInput!, $clientType: ClientType!) {
@@ -119,36 +240,26 @@ class Stream():
             }
         }
 
-        headers = {"Accept": "application/json, text/plain, */*",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Authorization": f"{self.token.token_type} {self.token.access_token}",
-                "Content-Type": "application/json",
-                "Origin": "https://www.mlb.com",
-                "Priority": "u=1, i",
-                "Referer": "https://www.mlb.com/tv/g%s" % self.game_pk,
-                "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-                "Sec-Ch-Ua-Mobile": "?0",
-                "sec-Ch-Ua-Platform": '"Windows"',
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-site",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
-        }
+        headers = {"Authorization": f"{self.token.token_type} {self.token.access_token}",
+                   "Referer": "https://www.mlb.com/tv/g%s" % self.game_pk}
 
-        r = requests.post(GRAPHQL_URL, headers=headers, json=payload, verify=False)
+        r = yield transport.Request("POST", GRAPHQL_URL, transport.GRAPHQL, headers=headers, json=payload, verify=False)
 
         if not r.ok:
             raise Exception(f"INIT_SESSION failed: {r.text}")
 
         self._device_id = r.json()["data"]["initSession"]["deviceId"]
         self._session_id = r.json()["data"]["initSession"]["sessionId"]
+        self._session_cached = False
+
+        if self.token.subject:
+            self.devices.put(self.token.subject, self._device_id, self._session_id)
 
     def _gen_master_playlist(self):
         #begin INIT_PLAYBACK_SESSION
 
         if not self._session_id:
-            self._gen_session()
+            yield from self._gen_session()
 
         payload = {
             "operationName":"initPlaybackSession",
@@ -204,32 +315,44 @@ class Stream():
                 "sessionId":"%s" % self._session_id}
             }
 
-        headers = {"Accept": "application/json, text/plain, */*",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Authorization": f"{self.token.token_type} {self.token.access_token}",
-                "Content-Type": "application/json",
-                "Origin": "https://www.mlb.com",
-                "Priority": "u=1, i",
-                "Referer": self.url,
-                "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-                "Sec-Ch-Ua-Mobile": "?0",
-                "sec-Ch-Ua-Platform": '"Windows"',
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-site",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
-        }
+        headers = {"Authorization": f"{self.token.token_type} {self.token.access_token}",
+                   "Referer": self.url}
 
-        r = requests.post(GRAPHQL_URL, headers=headers, json=payload, verify=False)
+        r = yield transport.Request("POST", GRAPHQL_URL, transport.GRAPHQL, headers=headers, json=payload, verify=False)
 
-        if not r.ok:
+        if self._session_cached and not is_graphql_ok(r, "initPlaybackSession"):
+            # the server no longer accepts the cached session, so start a fresh one and retry once
+            self.devices.invalidate(self.token.subject, self._session_id)
+            yield from self._gen_session(use_cache=False)
+            payload["variables"]["deviceId"] = self._device_id
+            payload["variables"]["sessionId"] = self._session_id
+            r = yield transport.Request("POST", GRAPHQL_URL, transport.GRAPHQL, headers=headers, json=payload, verify=False)
+
+        if not is_graphql_ok(r, "initPlaybackSession"):
             raise Exception(f"INIT_PLAYBACK_SESSION failed: {r.text}")
 
         self._master_playlist = r.json()["data"]["initPlaybackSession"]["playback"]["url"]
         self._playlist_prefix = self._master_playlist[:self._master_playlist.rfind("/")] + "/"
         self._playback_session_id = r.json()["data"]["initPlaybackSession"]["playbackSessionId"]
 
+        expiration = r.json()["data"]["initPlaybackSession"]["playback"].get("expiration")
+        if expiration:
+            self.playback_expiration = datetime.fromisoformat(expiration.replace("Z", "+00:00"))
+
+        heartbeat_info = r.json()["data"]["initPlaybackSession"].get("heartbeatInfo") or {}
+        self.heartbeat_url = heartbeat_info.get("url")
+        self.heartbeat_interval = heartbeat_info.get("interval")
+
+    def _gen_heartbeat(self):
+        headers = {"Authorization": f"{self.token.token_type} {self.token.access_token}",
+                   "Referer": self.url}
+
+        r = yield transport.Request("GET", self.heartbeat_url, transport.GRAPHQL, headers=headers)
+
+        if not r.ok:
+            raise Exception(f"HEARTBEAT failed: {r.status_code} {r.text}")
+        logger.debug(f"heartbeat sent for playback session {self._playback_session_id}")
+
     def _gen_milestones(self):
         #begin MEDIA_INFO
 
@@ -253,23 +376,7 @@ class Stream():
             }''',"variables":{"ids":[self.media_id]}
         }
 
-        headers = {"Accept": "application/json, text/plain, */*",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Content-Type": "application/json",
-                "Origin": "https://www.mlb.com",
-                "Priority": "u=1, i",
-                "Referer": self.url,
-                "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-                "Sec-Ch-Ua-Mobile": "?0",
-                "sec-Ch-Ua-Platform": '"Windows"',
-                "Sec-Fetch-Dest": "empty",
-                "Sec-Fetch-Mode": "cors",
-                "Sec-Fetch-Site": "same-site",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
-        }
-
-        r = requests.post(GRAPHQL_URL, headers=headers, json=payload, verify=False)
+        r = yield transport.Request("POST", GRAPHQL_URL, transport.GRAPHQL, headers={"Referer": self.url}, json=payload, verify=False)
 
         if not r.ok:
             raise Exception(f"INIT_MILESTONES failed: {r.text}")
@@ -278,118 +385,93 @@ class Stream():
 
     def _gen_media_playlists(self):
 
-        if not self._master_playlist or self._playlist_prefix:
-            self._gen_master_playlist()
-
-        headers = {
-                    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-                    "Accept-Encoding": "gzip, deflate, br, zstd",
-                    "Accept-Language": "en-US,en;q=0.9",
-                    "Priority": "u=1, i",
-                    "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-                    "Sec-Ch-Ua-Mobile": "?0",
-                    "sec-Ch-Ua-Platform": '"Windows"',
-                    "Sec-Fetch-Dest": "document",
-                    "Sec-Fetch-Mode": "navigate",
-                    "Sec-Fetch-Site": "none",
-                    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36",
-                }
+        if not self._master_playlist or not self._playlist_prefix:
+            yield from self._gen_master_playlist()
 
-        r = requests.get(self._master_playlist, headers=headers)
+        r = yield transport.Request("GET", self._master_playlist, transport.MASTER_PLAYLIST, stream=True)
 
         if not r.ok:
             raise Exception(f"gen_playlist failed: {r.text}")
 
-        raw_playlist = r.text.split("\n")
         self._media_playlists = []
-
-        for i, line in enumerate(raw_playlist):
-            if line.startswith(STREAM_INF):
-                raw_stream_params = line[len(STREAM_INF):]
-            else:
-                continue
-
-            params = re.findall(r'(?:[^,"]|"(?:\\.|[^"])*")+', raw_stream_params) # Split the string at commas not inside quotes
-            param_dict = {}
-            for param in params:
-                key, value = param.split('=', 1)
-                key = key.strip()
-                value = value.strip().strip('"')
-
-                # if BW in key:
-                #     value = format_bandwidth(value)
-
-                param_dict[key] = value
-
-            next_line = raw_playlist[i + 1]
-            param_dict[URI] = next_line.strip()
-            self._media_playlists.append(param_dict)
+        for record in m3u8.parse_response(r):
+            if isinstance(record, m3u8.Variant):
+                self._media_playlists.append(record.attributes | {URI: record.uri})
 
         self._media_playlists.sort(key=lambda x: int(x.get("AVERAGE-BANDWIDTH", x.get(BW, 0))))
             
         if len(self._media_playlists) == 0:
             raise Exception("No streams found in playlist")
 
-    def fetch_media_playlist(self, number=0):
+    def media_playlist_url(self, number=None):
+        if number is None:
+            number = self.get_variant()
+        return self._playlist_prefix + self.get_media_playlists()[number][URI]
 
-        if not self._media_playlists:
-            self._gen_media_playlists()
-
-        headers = {
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-            "Accept-Encoding": "gzip, deflate, br, zstd",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Priority": "u=0, i",
-            "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-            "Sec-Ch-Ua-Mobile": "?0",
-            "sec-Ch-Ua-Platform": '"Windows"',
-            "Sec-Fetch-Dest": "document",
-            "Sec-Fetch-Mode": "navigate",
-            "Sec-Fetch-Site": "none",
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36",
-        }
+    def get_variant(self):
+        ''' The variant to read: the selector's pick when one is running, otherwise the lowest. '''
+        return self.variant_selector.number if self.variant_selector else 0
 
-        r = requests.get(self._playlist_prefix + self._media_playlists[number][URI], headers=headers)
+    def select_variant(self, **kwargs):
+        ''' Starts a VariantSelector, which from then on decides the variant read and offered through hls_proxy. '''
+        from .variant_selector import VariantSelector
 
-        if not r.ok:
-            raise Exception(f"fetch_media_playlist failed: {r.text}")
-        
-        return(r.text.split('\n'))
-        
-    def _gen_commercial_breaks(self):
+        if not self.variant_selector:
+            selector = VariantSelector(self, **kwargs)
+            selector.select()
+            self.variant_selector = selector
+            selector.start_reevaluating()
+        return self.variant_selector
 
-        DATE_TIME = "#EXT-X-PROGRAM-DATE-TIME:"
-        INF = "#EXTINF:"
-        CUE_OUT = "#EXT-X-CUE-OUT:"
-        CUE_IN = "#EXT-X-CUE-IN"
-        IN_COMMERCIAL = False
-        self._commercial_breaks = []
+    def fetch_media_playlist(self, number=None):
+        ''' Returns the lines of a variant's media playlist. '''
+        return transport.run(self._fetch_media_playlist(number))
 
-        def parse_time(time_str):
-            return datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%S.%fZ")        
+    def fetch_media_records(self, number=None, consume=list):
+        ''' Returns consume() of the m3u8 records of a variant's media playlist, parsed as it streams in.
+            consume reads them before it returns, e.g. SegmentTable.from_records, so no list is built. '''
+        return transport.run(self._fetch_media_records(number, consume))
 
-        media = self.fetch_media_playlist()
-        start = None
-        current = 0
+    def _request_media_playlist(self, number=None, stream=False):
 
-        for i, line in enumerate(media):
-            if line.startswith(DATE_TIME):
-                if not start:
-                    start = parse_time(line[len(DATE_TIME):])       
-            
-                current = (parse_time(line[len(DATE_TIME):]) - start).total_seconds() * 1000
+        if not self._media_playlists:
+            yield from self._gen_media_playlists()
+
+        if number is None:
+            number = self.get_variant()
+
+        r = yield transport.Request("GET", self._playlist_prefix + self._media_playlists[number][URI], transport.PLAYLIST, stream=stream)
 
-            elif line.startswith(INF):
-                duration_f = float(line[len(INF):].split(",")[0])
-                duration = round(duration_f * 1000)
-                current += duration
+        if not r.ok:
+            r.close()
+            raise Exception(f"fetch_media_playlist failed: {r.text}")
+
+        return r
 
-            elif line.startswith(CUE_OUT):
-                IN_COMMERCIAL = True
-                self._commercial_breaks.append([current, 0])
+    def _fetch_media_playlist(self, number=None):
+        r = yield from self._request_media_playlist(number)
+        return r.text.split('\n')
 
-            elif line.startswith(CUE_IN):
-                IN_COMMERCIAL = False
-                self._commercial_breaks[-1][1] = current
+    def _fetch_media_records(self, number=None, consume=list):
+        r = yield from self._request_media_playlist(number, stream=True)
+        # consumed here, so the response is closed before the flow returns
+        return consume(m3u8.parse_response(r))
 
+    def _gen_commercial_breaks(self):
+        self._segment_table = yield from self._fetch_media_records(consume=SegmentTable.from_records)
+        self._commercial_breaks = self._segment_table.breaks()
+
+    def tail_commercial_breaks(self, number=None):
+        ''' Like get_commercial_breaks, but for a live game the returned list keeps growing in place
+            as a background tailer picks up new breaks. VOD playlists are read once. '''
+        if not self._tailer:
+            tailer = MediaPlaylistTailer(self, number)
+            tailer.start() # raises on a failed first load, leaving the stream free to try again
+            self._tailer = tailer
+            self._commercial_breaks = tailer.breaks
+            self._timeline = None
+        return self._commercial_breaks
 
+    def stop_tailing(self):
+        if self._tailer:
+            self._tailer.stop()
@@ -1,21 +1,53 @@
 from datetime import datetime, timedelta
+import base64
+import json
 import pytz
 
+EXPIRES_AT = "expires_at"
+REFRESH_TOKEN = "refresh_token"
+ID_TOKEN = "id_token"
+
 def get_current_datetime():
     return datetime.now(tz=pytz.UTC)
 
+def get_jwt_claims(jwt):
+    ''' Returns the claims of a JWT without verifying its signature, or {} if it cannot be decoded. '''
+    try:
+        payload = jwt.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except (AttributeError, IndexError, ValueError):
+        return {}
+
 class Token:
 
     def __init__(self, token_json):
+        self.update(token_json)
+
+    def update(self, token_json):
+        ''' Replaces the token's values in place so every holder of this object sees a renewed token.
+            A refresh response may leave out the refresh and id tokens, in which case the current ones are kept. '''
+        if hasattr(self, "_json"):
+            token_json = {k: self._json[k] for k in (REFRESH_TOKEN, ID_TOKEN) if k in self._json} | token_json
+        self._json = token_json
         self.token_type = token_json["token_type"]
         self.expires_secs = token_json["expires_in"]
-        self.expires_datetime = datetime.now(tz=pytz.UTC) + timedelta(seconds=self.expires_secs)
+        if EXPIRES_AT in token_json:
+            self.expires_datetime = datetime.fromisoformat(token_json[EXPIRES_AT])
+        else:
+            self.expires_datetime = datetime.now(tz=pytz.UTC) + timedelta(seconds=self.expires_secs)
         self.access_token = token_json["access_token"]
         self.scope = token_json["scope"]
-        self.id_token = token_json["id_token"]
+        self.id_token = token_json[ID_TOKEN]
+        self.refresh_token = token_json.get(REFRESH_TOKEN)
+        self.subject = get_jwt_claims(self.id_token).get("sub")
 
     def __str__(self):
         return self.access_token
 
+    def to_json(self):
+        ''' Returns the token response with its absolute expiry, suitable for Token(json) later. '''
+        return self._json | {EXPIRES_AT: self.expires_datetime.isoformat()}
+
     def secs_until_expired(self):
-        return round((self.expires_datetime - get_current_datetime()).total_seconds(), 2)
\ No newline at end of file
+        return round((self.expires_datetime - get_current_datetime()).total_seconds(), 2)
@@ -0,0 +1,2 @@
+from .game import MockConfig
+from .server import MockMLB
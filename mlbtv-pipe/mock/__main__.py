@@ -0,0 +1,49 @@
+import argparse
+import logging
+import threading
+from .game import MockConfig
+from .server import MockMLB, HOSTNAME, PORT
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m mlbtv-pipe.mock", description="local stand-in for the MLB services")
+    parser.add_argument("--host", default=HOSTNAME)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--live", action="store_true", help="serve live playlists that grow in real time")
+    parser.add_argument("--segments", type=int, default=MockConfig.segments, help="segments per game")
+    parser.add_argument("--segment-duration", type=float, default=MockConfig.segment_duration)
+    parser.add_argument("--break-interval", type=int, default=MockConfig.break_interval, help="segments between ad breaks")
+    parser.add_argument("--break-segments", type=int, default=MockConfig.break_segments, help="segments per ad break")
+    parser.add_argument("--games-per-day", type=int, default=MockConfig.games_per_day)
+    parser.add_argument("--latency", type=float, default=0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0, help="up to this many more seconds, at random")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=MockConfig.error_status)
+    parser.add_argument("--error-routes", help="comma separated routes to inject errors on, e.g. segment,graphql")
+    parser.add_argument("--password", help="the only password accepted, any by default")
+    parser.add_argument("--token-lifetime", type=int, default=MockConfig.token_lifetime, help="seconds an access token is valid")
+    parser.add_argument("--playback-lifetime", type=int, default=MockConfig.playback_lifetime,
+                        help="seconds a playback session's playlists are served, to exercise renewal")
+    args = parser.parse_args()
+
+    config = MockConfig(live=args.live, segments=args.segments, segment_duration=args.segment_duration,
+                        break_interval=args.break_interval, break_segments=args.break_segments,
+                        games_per_day=args.games_per_day, latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate, error_status=args.error_status, password=args.password,
+                        token_lifetime=args.token_lifetime, playback_lifetime=args.playback_lifetime,
+                        error_routes=set(args.error_routes.split(",")) if args.error_routes else None)
+
+    logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.INFO)
+    mock = MockMLB(args.host, args.port, config)
+    mock.start()
+
+    print("point mlbtv-pipe at the mock with:")
+    for key, value in mock.env().items():
+        print(f"  export {key}={value}")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        mock.stop()
+
+if __name__ == '__main__':
+    main()
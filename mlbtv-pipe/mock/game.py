@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta, timezone
+import time
+from .. import m3u8
+
+TS_PACKET = b"\x47" + bytes(187) # an empty MPEG-TS packet
+
+TEAMS = [
+    (108, "Los Angeles Angels", "LAA", "Anaheim"), (109, "Arizona Diamondbacks", "AZ", "Arizona"),
+    (110, "Baltimore Orioles", "BAL", "Baltimore"), (111, "Boston Red Sox", "BOS", "Boston"),
+    (112, "Chicago Cubs", "CHC", "Chicago"), (113, "Cincinnati Reds", "CIN", "Cincinnati"),
+    (114, "Cleveland Guardians", "CLE", "Cleveland"), (115, "Colorado Rockies", "COL", "Denver"),
+    (116, "Detroit Tigers", "DET", "Detroit"), (117, "Houston Astros", "HOU", "Houston"),
+    (118, "Kansas City Royals", "KC", "Kansas City"), (119, "Los Angeles Dodgers", "LAD", "Los Angeles"),
+    (120, "Washington Nationals", "WSH", "Washington"), (121, "New York Mets", "NYM", "Flushing"),
+    (133, "Athletics", "ATH", "Sacramento"), (134, "Pittsburgh Pirates", "PIT", "Pittsburgh"),
+    (135, "San Diego Padres", "SD", "San Diego"), (136, "Seattle Mariners", "SEA", "Seattle"),
+    (137, "San Francisco Giants", "SF", "San Francisco"), (138, "St. Louis Cardinals", "STL", "St. Louis"),
+    (139, "Tampa Bay Rays", "TB", "St. Petersburg"), (140, "Texas Rangers", "TEX", "Arlington"),
+    (141, "Toronto Blue Jays", "TOR", "Toronto"), (142, "Minnesota Twins", "MIN", "Minneapolis"),
+    (143, "Philadelphia Phillies", "PHI", "Philadelphia"), (144, "Atlanta Braves", "ATL", "Atlanta"),
+    (145, "Chicago White Sox", "CWS", "Chicago"), (146, "Miami Marlins", "MIA", "Miami"),
+    (147, "New York Yankees", "NYY", "Bronx"), (158, "Milwaukee Brewers", "MIL", "Milwaukee"),
+]
+
+class MockConfig:
+    ''' How the mock services behave. Any attribute can be overridden by keyword. '''
+
+    segment_duration = 6.0 # seconds
+    segments = 1800 # length of a game, three hours at the default duration
+    first_break = 70 # segment the first commercial break starts at
+    break_interval = 90 # segments from one break to the next, about a half inning
+    break_segments = 20 # length of each break
+    variants = ((416, 234, 30), (640, 360, 30), (1280, 720, 30), (1280, 720, 60), (1920, 1080, 60))
+    segment_size = 64 * 1024 # bytes served per segment, whatever the variant
+
+    live = False # serve games as live EVENT playlists that grow in real time
+    live_preroll = 60 # segments already available when a live game is first requested
+
+    games_per_day = 15
+    token_lifetime = 3600 # seconds
+    playback_lifetime = 6 * 3600 # seconds before a playback session's playlists stop being served
+    password = None # accept any password when None
+
+    latency = 0.0 # seconds added to every response
+    jitter = 0.0 # up to this many more seconds, at random
+    error_rate = 0.0 # share of requests answered with error_status
+    error_status = 503
+    error_routes = None # route names errors are injected on, e.g. {"segment", "graphql"}; all when None
+
+    def __init__(self, **overrides):
+        for key, value in overrides.items():
+            if not hasattr(MockConfig, key):
+                raise ValueError(f"unknown mock setting: {key}")
+            setattr(self, key, value)
+
+def media_id(game_pk, n):
+    return f"{game_pk:08x}-0000-4000-8000-{n:012x}"
+
+class Game:
+    ''' One synthetic broadcast: fixed length segments with a commercial break every break_interval segments.
+        A live game starts live_preroll segments in when first requested and grows one segment per segment_duration. '''
+
+    def __init__(self, media, config):
+        self.media_id = media
+        self.config = config
+        self.started = time.monotonic()
+        self.start_time = datetime(2025, 7, 10, 23, 5, tzinfo=timezone.utc)
+
+    def available(self):
+        ''' Segments published so far. '''
+        if not self.config.live:
+            return self.config.segments
+        elapsed = int((time.monotonic() - self.started) / self.config.segment_duration)
+        return min(self.config.segments, self.config.live_preroll + elapsed)
+
+    def breaks(self):
+        ''' (first segment, first segment after) of each break. '''
+        c = self.config
+        return [(start, min(start + c.break_segments, c.segments))
+                for start in range(c.first_break, c.segments, c.break_interval)]
+
+    def bandwidth(self, variant):
+        width, height, fps = self.config.variants[variant]
+        return int(width * height * fps * .09)
+
+    def master_playlist(self, token):
+        lines = [m3u8.EXTM3U, "#EXT-X-INDEPENDENT-SEGMENTS"]
+        for i in range(len(self.config.variants)):
+            width, height, fps = self.config.variants[i]
+            bandwidth = self.bandwidth(i)
+            lines.append(f'{m3u8.STREAM_INF}BANDWIDTH={bandwidth},AVERAGE-BANDWIDTH={int(bandwidth * .8)},'
+                         f'CODECS="avc1.64001f,mp4a.40.2",RESOLUTION={width}x{height},FRAME-RATE={fps}.000')
+            lines.append(f"{i}/playlist.m3u8?token={token}")
+        return "\n".join(lines) + "\n"
+
+    def media_playlist(self, variant):
+        c = self.config
+        available = self.available()
+        starts = {start for start, _ in self.breaks()}
+        ends = {end for _, end in self.breaks()}
+
+        lines = [m3u8.EXTM3U, "#EXT-X-VERSION:3", f"{m3u8.TARGET_DURATION}{int(c.segment_duration + .999)}",
+                 f"{m3u8.MEDIA_SEQUENCE}0", "#EXT-X-PLAYLIST-TYPE:" + ("EVENT" if c.live else "VOD")]
+        for n in range(available):
+            if n in starts:
+                lines.append(f"{m3u8.CUE_OUT}:{c.break_segments * c.segment_duration:.3f}")
+            elif n in ends:
+                lines.append(m3u8.CUE_IN)
+            pdt = self.start_time + timedelta(seconds=n * c.segment_duration)
+            lines.append(f"{m3u8.DATE_TIME}{pdt.strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3]}Z")
+            lines.append(f"{m3u8.INF}{c.segment_duration:.3f},")
+            lines.append(f"{n}.ts")
+        if available == c.segments:
+            lines.append(m3u8.ENDLIST)
+        return "\n".join(lines) + "\n"
+
+    def milestones(self):
+        ''' mediaInfo milestones: each half inning runs from the end of one break to the start of the next. '''
+        c = self.config
+        edges = [0] + [edge for pair in self.breaks() for edge in pair] + [c.segments]
+        milestones = [self._milestone("BROADCAST_START", 0, "Broadcast Start"),
+                      self._milestone("STREAM_START", 0, "Stream Start")]
+        for i in range(0, len(edges) - 1, 2):
+            inning, top = i // 4 + 1, (i // 2) % 2 == 0
+            name = f"{'Top' if top else 'Bottom'} {inning}"
+            keywords = [{"name": "inning", "value": str(inning)}, {"name": "top", "value": str(top).lower()}]
+            milestones.append(self._milestone("INNING_START", edges[i], f"{name} INNING START", keywords))
+            milestones.append(self._milestone("INNING_END", edges[i + 1], f"{name} INNING END", keywords))
+        milestones.append(self._milestone("STREAM_STOP", c.segments, "Stream Stop"))
+        return milestones
+
+    def _milestone(self, milestone_type, segment, title, keywords=None):
+        seconds = segment * self.config.segment_duration
+        return {"milestoneType": milestone_type,
+                "relativeTime": seconds,
+                "absoluteTime": (self.start_time + timedelta(seconds=seconds)).isoformat().replace("+00:00", "Z"),
+                "title": title,
+                "keywords": keywords or []}
+
+def segment_payload(size):
+    return (TS_PACKET * (size // len(TS_PACKET) + 1))[:size]
+
+def schedule_games(date, config):
+    ''' The hydrated statsapi games for a YYYY-MM-DD date, the same on every call. '''
+    day = datetime.strptime(date, "%Y-%m-%d")
+    base_pk = 700000 + (day.toordinal() % 10000) * 20
+    rotation = day.toordinal() % len(TEAMS)
+    teams = TEAMS[rotation:] + TEAMS[:rotation]
+    state = "In Progress" if config.live else "Final"
+
+    games = []
+    for n in range(min(config.games_per_day, len(TEAMS) // 2)):
+        game_pk = base_pk + n
+        sides = {}
+        for side, (team_id, name, abbreviation, location) in (("away", teams[2 * n]), ("home", teams[2 * n + 1])):
+            wins = 40 + (team_id + day.day) % 20
+            sides[side] = {
+                "leagueRecord": {"wins": wins, "losses": 90 - wins, "pct": f"{wins / 90:.3f}"},
+                "team": {"id": team_id, "name": name, "abbreviation": abbreviation, "locationName": location},
+                "probablePitcher": {"id": 600000 + team_id, "fullName": f"Pitcher {abbreviation}"}
+            }
+        broadcasts = [broadcast(game_pk, 0, "home", "TV", "Local (In Market)", sides),
+                      broadcast(game_pk, 1, "away", "TV", "Local (Out of Market)", sides),
+                      broadcast(game_pk, 2, "home", "AM", "Local (In Market)", sides)]
+        if n % 5 == 0:
+            broadcasts.append(broadcast(game_pk, 3, "home", "TV", "National", sides))
+
+        games.append({
+            "gamePk": game_pk,
+            "gameDate": (day + timedelta(hours=17, minutes=30 * n)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "officialDate": date,
+            "status": {"abstractGameState": "Live" if config.live else "Final", "detailedState": state},
+            "teams": sides,
+            "linescore": {"currentInning": 5, "currentInningOrdinal": "5th", "inningHalf": "Bottom"},
+            "venue": {"id": sides["home"]["team"]["id"], "name": f"{sides['home']['team']['locationName']} Park"},
+            "broadcasts": broadcasts
+        })
+    return games
+
+def broadcast(game_pk, n, side, kind, availability, sides):
+    return {
+        "id": game_pk * 10 + n,
+        "name": f"{sides[side]['team']['abbreviation']} {kind}",
+        "type": kind,
+        "language": "en",
+        "homeAway": side,
+        "freeGame": False,
+        "availableForStreaming": True,
+        "mediaId": media_id(game_pk, n),
+        "mediaState": {"mediaStateText": "Media Archive"},
+        "availability": {"availabilityText": availability}
+    }
@@ -0,0 +1,346 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from datetime import datetime, timedelta, timezone
+import base64
+import hashlib
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+from .game import MockConfig, Game, schedule_games, segment_payload
+
+HOSTNAME = "127.0.0.1"
+PORT = 8082
+
+M3U8_TYPE = "application/vnd.apple.mpegurl"
+TS_TYPE = "video/mp2t"
+JSON_TYPE = "application/json"
+DEFAULT_SCOPE = "openid email"
+
+logger = logging.getLogger(__name__)
+
+def b64url(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def make_jwt(claims):
+    ''' An unsigned-looking JWT; the client only reads its claims. '''
+    header = b64url(json.dumps({"alg": "RS256", "kid": "mock"}).encode())
+    return f"{header}.{b64url(json.dumps(claims).encode())}.{b64url(secrets.token_bytes(32))}"
+
+class MockMLB:
+    ''' Local stand-in for the ids.mlb.com Okta flow, the media-gateway GraphQL API, the statsapi schedule
+        and the CDN, with the request and response shapes Account, Stream and mlb_stats use.
+        Point the client at it with the environment from env(), set before the client modules are imported. '''
+
+    def __init__(self, host=HOSTNAME, port=PORT, config=None):
+        self.host = host
+        self.port = port
+        self.config = config or MockConfig()
+
+        self.games = {} # media id -> Game
+        self.tokens = set() # access tokens issued
+        self.sessions = set() # initSession session ids issued
+        self.refresh_tokens = {} # refresh token -> identifier it was issued for
+        self.playback_tokens = {} # playback token -> time.time() it expires at
+        self.logins = {} # Okta interaction handle, state handle or interaction code -> (identifier, scope) of that login
+        self.stats = {} # route -> requests served
+        self._segment = segment_payload(self.config.segment_size)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def env(self):
+        ''' Environment variables that point mlbtv_account, mlbtv_stream and mlb_stats at this server. '''
+        return {"MLBTV_IDS_URL": self.base_url,
+                "MLBTV_MEDIA_GATEWAY_URL": self.base_url,
+                "MLBTV_STATSAPI_URL": self.base_url}
+
+    def start(self):
+        if self._server:
+            return
+        self._server = ThreadingHTTPServer((self.host, self.port), MockHandler)
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 256 # load tests open many connections at once
+        self._server.mock = self
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="mock-mlb", daemon=True).start()
+        logger.info(f"mock MLB services listening on {self.base_url}")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def get_game(self, media):
+        with self._lock:
+            if media not in self.games:
+                self.games[media] = Game(media, self.config)
+            return self.games[media]
+
+    def count(self, route):
+        with self._lock:
+            self.stats[route] = self.stats.get(route, 0) + 1
+
+    def inject(self, route):
+        ''' Sleeps for the configured latency, then returns an error status to send instead, or None. '''
+        c = self.config
+        if c.latency or c.jitter:
+            time.sleep(c.latency + random.uniform(0, c.jitter))
+        if c.error_rate and (c.error_routes is None or route in c.error_routes) and random.random() < c.error_rate:
+            return c.error_status
+        return None
+
+    def pass_login(self, handle, identifier=None):
+        ''' Issues the next handle of a login, carrying over the identifier and scope of the previous one. '''
+        issued = secrets.token_urlsafe(24)
+        with self._lock:
+            previous, scope = self.logins.pop(handle, (None, DEFAULT_SCOPE))
+            self.logins[issued] = (identifier or previous, scope)
+        return issued
+
+    def start_login(self, scope):
+        issued = secrets.token_urlsafe(24)
+        with self._lock:
+            self.logins[issued] = (None, scope)
+        return issued
+
+    def issue_token(self, identifier, scope=DEFAULT_SCOPE):
+        ''' A token response; with offline_access in scope it carries a refresh token, as Okta's does. '''
+        subject = "00u" + hashlib.sha256((identifier or "").encode("utf-8")).hexdigest()[:17]
+        access_token = secrets.token_urlsafe(32)
+        with self._lock:
+            self.tokens.add(access_token)
+        token = {
+            "token_type": "Bearer",
+            "expires_in": self.config.token_lifetime,
+            "access_token": access_token,
+            "scope": scope,
+            "id_token": make_jwt({"sub": subject, "iat": int(time.time()),
+                                  "exp": int(time.time()) + self.config.token_lifetime})
+        }
+        if "offline_access" in scope.split():
+            token["refresh_token"] = secrets.token_urlsafe(32)
+            with self._lock:
+                self.refresh_tokens[token["refresh_token"]] = identifier
+        return token
+
+    def refresh(self, refresh_token, scope):
+        ''' Exchanges a refresh token for a new token response, rotating the refresh token, or None if it is unknown. '''
+        with self._lock:
+            if refresh_token not in self.refresh_tokens:
+                return None
+            identifier = self.refresh_tokens.pop(refresh_token)
+        return self.issue_token(identifier, scope)
+
+    def playback_valid(self, token):
+        with self._lock:
+            return self.playback_tokens.get(token, 0) > time.time()
+
+    def authorized(self, header):
+        token_type, _, token = (header or "").partition(" ")
+        return token_type == "Bearer" and token in self.tokens
+
+    def graphql(self, body, authorization):
+        ''' Returns the response json for a media-gateway operation. '''
+        operation = body.get("operationName")
+        variables = body.get("variables") or {}
+
+        if operation == "mediaInfo":
+            media = (variables.get("ids") or [None])[0]
+            return {"data": {"mediaInfo": [{"contentId": media, "mediaId": media,
+                                            "milestones": self.get_game(media).milestones()}]}}
+
+        if not self.authorized(authorization):
+            return {"errors": [{"message": "unauthorized"}], "data": {operation: None}}
+
+        if operation == "initSession":
+            device_id = variables.get("device", {}).get("knownDeviceId") or secrets.token_hex(16)
+            session_id = secrets.token_hex(16)
+            with self._lock:
+                self.sessions.add(session_id)
+            return {"data": {"initSession": {"deviceId": device_id, "sessionId": session_id,
+                                             "entitlements": [{"code": "MLBALL"}], "location": {"countryCode": "US"}}}}
+
+        if operation == "initPlaybackSession":
+            if variables.get("sessionId") not in self.sessions:
+                return {"errors": [{"message": "invalid session"}], "data": {operation: None}}
+            media = variables.get("mediaId")
+            token = secrets.token_urlsafe(16)
+            expiration = datetime.now(timezone.utc) + timedelta(seconds=self.config.playback_lifetime)
+            with self._lock:
+                self.playback_tokens[token] = expiration.timestamp()
+            return {"data": {"initPlaybackSession": {
+                "playbackSessionId": secrets.token_hex(16),
+                "playback": {"url": f"{self.base_url}/hls/{media}/master.m3u8?token={token}", "token": token,
+                             "expiration": expiration.isoformat().replace("+00:00", "Z"), "cdn": "mock"},
+                "adScenarios": {}, "adExperience": {"adsEnabled": False},
+                "heartbeatInfo": {"url": f"{self.base_url}/heartbeat", "interval": 60},
+                "trackingObj": {}
+            }}}
+
+        return {"errors": [{"message": f"unknown operation {operation}"}], "data": None}
+
+    def schedule(self, query):
+        start = query.get("startDate", [None])[0]
+        end = query.get("endDate", [start])[0]
+        day = datetime.strptime(start, "%Y-%m-%d")
+        last = datetime.strptime(end, "%Y-%m-%d")
+
+        dates = []
+        while day <= last:
+            date = day.strftime("%Y-%m-%d")
+            games = schedule_games(date, self.config)
+            dates.append({"date": date, "totalGames": len(games), "games": games})
+            day += timedelta(days=1)
+        return {"totalGames": sum(d["totalGames"] for d in dates), "dates": dates}
+
+class MockHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def route(self, path):
+        if path.startswith("/oauth2/"):
+            return path.rsplit("/", 1)[-1] # interact or token
+        if path.startswith("/idp/idx/"):
+            return path[len("/idp/idx/"):].replace("/", "_") # introspect, identify, challenge, challenge_answer
+        if path.startswith("/hls/"):
+            name = path.rsplit("/", 1)[-1]
+            if name == "master.m3u8":
+                return "master"
+            return "media" if name == "playlist.m3u8" else "segment"
+        return path.strip("/").replace("/", "_") # graphql, api_v1_schedule, heartbeat, stats
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request()
+
+    def handle_request(self):
+        mock = self.server.mock
+        parts = urlsplit(self.path)
+        route = self.route(parts.path)
+        mock.count(route)
+
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        status = mock.inject(route)
+        if status:
+            return self.send_error(status, "injected error")
+
+        try:
+            handler = getattr(self, f"route_{route}", None)
+            if not handler:
+                return self.send_error(404)
+            handler(mock, parts, body)
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("client closed the connection")
+
+    def send_body(self, data, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, data, status=200):
+        self.send_body(json.dumps(data).encode("utf-8"), JSON_TYPE, status)
+
+    def read_json(self, body):
+        try:
+            return json.loads(body or b"{}")
+        except ValueError:
+            return {}
+
+    # Okta, in the order Account calls it
+
+    def route_interact(self, mock, parts, body):
+        scope = parse_qs(body.decode("utf-8")).get("scope", [DEFAULT_SCOPE])[0]
+        self.send_json({"interaction_handle": mock.start_login(scope)})
+
+    def route_introspect(self, mock, parts, body):
+        self.send_json({"stateHandle": mock.pass_login(self.read_json(body).get("interactionHandle"))})
+
+    def route_identify(self, mock, parts, body):
+        request = self.read_json(body)
+        identifier = request.get("identifier")
+        if not identifier:
+            return self.send_json({"messages": {"value": [{"message": "identifier required"}]}}, 400)
+        self.send_json({"stateHandle": mock.pass_login(request.get("stateHandle"), identifier),
+                        "authenticators": {"value": [{"type": "email", "id": "aut_email"},
+                                                     {"type": "password", "id": "aut_password"}]}})
+
+    def route_challenge(self, mock, parts, body):
+        self.send_json({"stateHandle": mock.pass_login(self.read_json(body).get("stateHandle"))})
+
+    def route_challenge_answer(self, mock, parts, body):
+        answer = self.read_json(body)
+        passcode = answer.get("credentials", {}).get("passcode")
+        if mock.config.password is not None and passcode != mock.config.password:
+            return self.send_json({"messages": {"value": [{"message": "Password is incorrect"}]}}, 401)
+        self.send_json({"stateHandle": secrets.token_urlsafe(24),
+                        "successWithInteractionCode": {"value": [{"name": "interaction_code",
+                                                                  "value": mock.pass_login(answer.get("stateHandle"))}]}})
+
+    def route_token(self, mock, parts, body):
+        form = parse_qs(body.decode("utf-8"))
+        grant_type = form.get("grant_type", [None])[0]
+        if grant_type == "refresh_token":
+            token = mock.refresh(form.get("refresh_token", [None])[0], form.get("scope", [DEFAULT_SCOPE])[0])
+            if not token:
+                return self.send_json({"error": "invalid_grant", "error_description": "The refresh token is invalid or expired."}, 400)
+            return self.send_json(token)
+        if grant_type != "interaction_code":
+            return self.send_json({"error": "invalid_request"}, 400)
+        code = form.get("interaction_code", [None])[0]
+        with mock._lock:
+            identifier, scope = mock.logins.pop(code, (None, DEFAULT_SCOPE))
+        self.send_json(mock.issue_token(identifier, scope))
+
+    # media gateway, statsapi and the CDN
+
+    def route_graphql(self, mock, parts, body):
+        self.send_json(mock.graphql(self.read_json(body), self.headers.get("Authorization")))
+
+    def route_api_v1_schedule(self, mock, parts, body):
+        query = parse_qs(parts.query)
+        if "startDate" not in query:
+            return self.send_json({"messageNumber": 1, "message": "startDate required"}, 400)
+        self.send_json(mock.schedule(query))
+
+    def route_heartbeat(self, mock, parts, body):
+        self.send_json({})
+
+    def route_stats(self, mock, parts, body):
+        with mock._lock:
+            self.send_json(dict(mock.stats))
+
+    def route_master(self, mock, parts, body):
+        media = parts.path.split("/")[2]
+        token = parse_qs(parts.query).get("token", [""])[0]
+        if not mock.playback_valid(token):
+            return self.send_error(403, "playback session expired")
+        self.send_body(mock.get_game(media).master_playlist(token).encode("utf-8"), M3U8_TYPE)
+
+    def route_media(self, mock, parts, body):
+        _, _, media, variant, _ = parts.path.split("/")
+        if not mock.playback_valid(parse_qs(parts.query).get("token", [""])[0]):
+            return self.send_error(403, "playback session expired")
+        self.send_body(mock.get_game(media).media_playlist(int(variant)).encode("utf-8"), M3U8_TYPE)
+
+    def route_segment(self, mock, parts, body):
+        _, _, media, variant, name = parts.path.split("/")
+        game = mock.get_game(media)
+        if int(name.split(".")[0]) >= game.available():
+            return self.send_error(404, "segment not published yet")
+        self.send_body(mock._segment, TS_TYPE)
@@ -0,0 +1,164 @@
+import json
+import logging
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from .skip_scheduler import AdSkipScheduler
+
+MPV_LOCATION = os.getenv("MPV_LOCATION", "mpv")
+CONNECT_TIMEOUT = 15 # seconds to wait for mpv to open its IPC socket
+FIRST_FRAME_TIMEOUT = 60 # seconds for playback to start once it has
+JUMP = 250 # ms a pushed position may differ from the extrapolated clock before the scheduler is told
+
+TIME_POS = "time-pos"
+PAUSE = "pause"
+SPEED = "speed"
+
+logger = logging.getLogger(__name__)
+
+class MPV_Handler():
+    ''' Plays a Stream in mpv and skips breaks over mpv's JSON IPC socket. time-pos, pause and speed are
+        observed, so mpv pushes their changes to a reader thread, and seeks go out over the same socket.
+        Only pushes that move the position away from where playback should be, a seek, a pause or a
+        rate change, reach the AdSkipScheduler; between them it extrapolates on its own. '''
+
+    def __init__(self, stream, args=[], url=None):
+        self.stream = stream
+        self.source = url
+        self.args = args
+        self.socket_path = os.path.join(tempfile.gettempdir(), f"mlbtv-pipe-mpv-{os.getpid()}-{id(self)}.sock")
+
+        self.handle = None
+        self.scheduler = None
+        self._socket = None
+        self._send_lock = threading.Lock()
+        self._request_id = 0
+        self._position = None
+        self._paused = False
+        self._speed = 1.0
+        self._closed = threading.Event()
+        self._first_frame = threading.Event()
+
+    def start(self):
+        self.launch()
+        self.wait_ready()
+        self.monitor()
+
+    def launch(self):
+        self.handle = subprocess.Popen([MPV_LOCATION, self.source or self.stream.get_master_playlist(),
+                                        f"--input-ipc-server={self.socket_path}", "--force-window=immediate"] + self.args)
+
+    def playback_renewed(self, url):
+        ''' Replaces the playing file with a renewed playback session's playlist, starting where playback was. '''
+        if self._position is not None:
+            self.send("set_property", "start", f"{self._position / 1000:.3f}")
+        self.send("loadfile", url, "replace")
+
+    def wait_ready(self, timeout=CONNECT_TIMEOUT):
+        ''' Connects to the IPC socket as soon as mpv has opened it. '''
+        deadline = time.monotonic() + timeout
+        delay = .01
+        while True:
+            if self.handle.poll() is not None:
+                raise Exception(f"mpv exited with {self.handle.returncode} before opening its IPC socket")
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(self.socket_path)
+                break
+            except OSError:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise Exception(f"mpv did not open {self.socket_path} within {timeout}s")
+                time.sleep(delay)
+                delay = min(delay * 2, .5)
+
+        self._socket = sock
+        threading.Thread(target=self._read, name="mpv-ipc", daemon=True).start()
+        for number, name in enumerate((TIME_POS, PAUSE, SPEED), 1):
+            self.send("observe_property", number, name)
+
+    def wait_first_frame(self, timeout=FIRST_FRAME_TIMEOUT):
+        ''' Returns once mpv reports a playback position, i.e. it has decoded the first frame. '''
+        if not self._first_frame.wait(timeout):
+            raise Exception(f"mpv did not start playing within {timeout}s")
+
+    def monitor(self):
+        self.scheduler = AdSkipScheduler.for_player(self.stream, self.source, self.seek)
+        if self.scheduler:
+            self.stream.add_playback_listener(self.playback_renewed)
+            if self._position is not None:
+                self.scheduler.update(self._position, self._speed, not self._paused)
+            self.scheduler.run(lambda: self.handle.poll() is None and not self._closed.is_set())
+        else:
+            self.handle.wait()
+        self.close()
+
+    def send(self, *command):
+        ''' Writes a command to mpv without waiting for its reply, which the reader thread logs if it failed. '''
+        with self._send_lock:
+            self._request_id += 1
+            message = json.dumps({"command": list(command), "request_id": self._request_id}) + "\n"
+            self._socket.sendall(message.encode("utf-8"))
+
+    def _read(self):
+        buffer = b""
+        try:
+            while True:
+                data = self._socket.recv(65536)
+                if not data:
+                    break
+                buffer += data
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if line:
+                        self._handle_message(json.loads(line))
+        except OSError as err:
+            logger.debug(f"mpv IPC socket closed: {err}")
+        finally:
+            self._closed.set()
+            if self.scheduler:
+                self.scheduler.stop()
+
+    def _handle_message(self, message):
+        event = message.get("event")
+        if event == "property-change":
+            self._property_changed(message.get("name"), message.get("data"))
+        elif event == "end-file" and message.get("reason") in ("eof", "error", "quit"):
+            logger.info(f"mpv stopped playing: {message.get('reason')}")
+            self._closed.set()
+            if self.scheduler:
+                self.scheduler.stop()
+        elif message.get("error", "success") != "success":
+            logger.warning(f"mpv request {message.get('request_id')} failed: {message['error']}")
+
+    def _property_changed(self, name, value):
+        if value is None:
+            return
+        if name == TIME_POS:
+            self._position = value * 1000
+            self._first_frame.set()
+        elif name == PAUSE:
+            self._paused = value
+        elif name == SPEED:
+            self._speed = value
+
+        if not self.scheduler or self._position is None:
+            return
+        clock = self.scheduler.clock
+        if (clock is None or clock.playing == self._paused or clock.rate != self._speed
+                or abs(clock.now() - self._position) > JUMP):
+            self.scheduler.update(self._position, self._speed, not self._paused)
+
+    def seek(self, seconds):
+        self.send("seek", seconds, "absolute")
+
+    def close(self):
+        if self._socket:
+            self._socket.close()
+        try:
+            os.remove(self.socket_path)
+        except OSError:
+            pass
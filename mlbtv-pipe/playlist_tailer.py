@@ -0,0 +1,128 @@
+import logging
+import threading
+from .segment_table import SegmentTable
+from . import transport
+from . import m3u8
+
+DEFAULT_TARGET_DURATION = 6 # seconds, used until the playlist states its own
+
+logger = logging.getLogger(__name__)
+
+def read_tag_int(text, tag, default=None):
+    ''' Returns the integer value of a header tag, searching only up to the first segment. '''
+    i = text.find(tag, 0, text.find("#EXTINF"))
+    if i < 0:
+        return default
+    end = text.find("\n", i)
+    return int(float(text[i + len(tag):end if end >= 0 else None].strip()))
+
+def is_uri(line):
+    return line and not line.startswith("#")
+
+class MediaPlaylistTailer:
+    ''' Follows a live media playlist, reloading it every target duration and appending only the
+        segments added since the previous reload to a SegmentTable, which pairs the cues the same way
+        it does for a VOD playlist. breaks is extended in place, so readers holding the list see new
+        breaks as they appear. '''
+
+    def __init__(self, stream, number=None):
+        self.number = number
+        self.url = stream.media_playlist_url(number) # replaced by Stream.renew_playback
+        self.table = SegmentTable()
+        self.breaks = []
+        self.target_duration = DEFAULT_TARGET_DURATION
+        self.last_sequence = None # media sequence number of the last parsed segment
+        self.last_uri = None
+        self.ended = False
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        ''' Loads the playlist once, then keeps tailing it in a daemon thread until ENDLIST or stop(). '''
+        self.reload()
+        if not self.ended:
+            self._thread = threading.Thread(target=self._run, name="playlist-tailer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        wait = self.target_duration
+        while not self.ended and not self._stop.wait(wait):
+            try:
+                added = self.reload()
+            except Exception as err:
+                logger.warning(f"playlist reload failed: {err}")
+                added = 0
+            # per the HLS spec, wait half a target duration after a reload that brought nothing new
+            wait = self.target_duration if added else self.target_duration / 2
+
+    def reload(self):
+        ''' Fetches the playlist and parses the new segments. Returns how many were added. '''
+        r = transport.get(self.url, transport.PLAYLIST)
+        if not r.ok:
+            raise Exception(f"playlist reload failed: {r.status_code} {r.text}")
+
+        text = r.text
+        self.target_duration = read_tag_int(text, m3u8.TARGET_DURATION, self.target_duration)
+        media_sequence = read_tag_int(text, m3u8.MEDIA_SEQUENCE, 0)
+        self.ended = m3u8.ENDLIST in text[-64:]
+
+        lines = self._new_lines(text, media_sequence)
+        if self.last_sequence is None:
+            first_sequence = media_sequence
+        else:
+            # after falling behind the live window, _new_lines starts over from the window's first segment
+            first_sequence = max(self.last_sequence + 1, media_sequence)
+
+        added = 0
+        for record in m3u8.parse(lines, first_sequence):
+            if isinstance(record, m3u8.Segment):
+                added += 1
+                self.last_uri = record.uri
+                self.last_sequence = record.sequence
+            self.table.append(record)
+
+        if added:
+            self._publish()
+            logger.debug(f"tailer added {added} segments, up to sequence {self.last_sequence}")
+
+        return added
+
+    def _publish(self):
+        ''' Brings breaks up to date with the table the way a Timeline reads it: new breaks are appended,
+            and of those already there only the end of the last, once its CUE-IN arrives, changes. '''
+        current = self.table.breaks()
+        if current and current[-1][0] >= self.table.end():
+            # its CUE-OUT comes after the last segment, and a CUE-IN before the next one would cancel it
+            current = current[:-1]
+        if self.breaks and not self.breaks[-1][1] and len(current) >= len(self.breaks):
+            self.breaks[-1][1] = current[len(self.breaks) - 1][1]
+        self.breaks.extend(current[len(self.breaks):])
+
+    def _new_lines(self, text, media_sequence):
+        ''' Returns the lines after the last segment parsed so far. '''
+        if self.last_uri:
+            # jump straight past the last known segment instead of walking the whole playlist
+            i = text.rfind("\n" + self.last_uri)
+            if i >= 0:
+                return text[i + 1 + len(self.last_uri):].split("\n")
+
+        lines = text.split("\n")
+        if self.last_sequence is None:
+            return lines
+
+        skip = self.last_sequence + 1 - media_sequence
+        if skip <= 0:
+            if skip < 0:
+                logger.warning(f"tailer fell behind the live window, {-skip} segments were missed")
+            return lines
+
+        for i, line in enumerate(lines):
+            if is_uri(line.strip()):
+                skip -= 1
+                if skip == 0:
+                    return lines[i + 1:]
+        return []
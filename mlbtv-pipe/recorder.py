@@ -0,0 +1,239 @@
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import json
+import logging
+import os
+import threading
+import time
+from . import transport
+from . import m3u8
+from .segment_table import SegmentTable
+from .timeline import Timeline
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError: # only needed for AES-128 encrypted variants
+    Cipher = None
+
+WORKERS = 8
+WINDOW = 16 # segments downloaded ahead of the one being written, the bound on memory held
+RETRIES = 3
+CHUNK_SIZE = 256 * 1024
+MANIFEST_SUFFIX = ".manifest.json"
+AES_128 = "AES-128"
+
+logger = logging.getLogger(__name__)
+
+def break_mask(table):
+    ''' True for each segment of a SegmentTable that starts inside a commercial break. '''
+    offsets = table.offsets()
+    breaks = table.breaks()
+    starts = [start for start, _ in breaks]
+    mask = []
+    for offset in offsets:
+        i = bisect_right(starts, offset) - 1
+        mask.append(i >= 0 and (breaks[i][1] == 0 or offset < breaks[i][1]))
+    return mask
+
+def inning_mask(table, timeline):
+    ''' True for each segment of a SegmentTable that overlaps none of a Timeline's half innings. '''
+    offsets = table.offsets()
+    halves = [(start, end) for _, _, start, end in timeline.half_innings()]
+    mask = []
+    h = 0
+    for offset, duration in zip(offsets, table.duration):
+        while h < len(halves) and halves[h][1] <= offset:
+            h += 1
+        mask.append(h == len(halves) or halves[h][0] >= offset + duration * 1000)
+    return mask
+
+def decrypt(data, key, iv):
+    if Cipher is None:
+        raise Exception("the variant is AES-128 encrypted; install the cryptography package to record it")
+    decryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).decryptor()
+    data = decryptor.update(data) + decryptor.finalize()
+    return data[:-data[-1]] if data else data # PKCS#7 padding
+
+class Recorder:
+    ''' Downloads one variant of a Stream into a single file. Segments are fetched by a pool of workers
+        at most window segments ahead of the writer, which appends them in playlist order, so memory
+        stays bounded however fast the link is.
+
+        A manifest next to the file records how many segments and bytes are complete. Recording the same
+        stream to the same path again truncates any partly written segment and carries on from there,
+        which also picks up the segments a live game has published since. '''
+
+    def __init__(self, stream, path, number=None, skip_breaks=False, workers=WORKERS, window=WINDOW):
+        self.stream = stream
+        self.path = path
+        self.number = stream.get_variant() if number is None else number
+        self.skip_breaks = skip_breaks
+        self.workers = workers
+        self.window = max(window, workers)
+
+        self.manifest_path = path + MANIFEST_SUFFIX
+        self.written = 0 # segments of the playlist done, whether written or skipped
+        self.bytes = 0
+        self.total = 0
+        self._keys = {} # key uri -> key bytes
+        self._key_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def mode(self):
+        ''' Which segments the recording keeps, stored in the manifest so a resume keeps the same ones. '''
+        return "no_breaks" if self.skip_breaks else "full"
+
+    def skipped(self, table):
+        ''' True for each segment of the playlist to leave out. '''
+        return break_mask(table) if self.skip_breaks else [False] * len(table)
+
+    def _load_manifest(self, url):
+        ''' Returns the segments and bytes already recorded, or (0, 0) for a new or mismatched recording. '''
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return 0, 0
+
+        expected = {"media_id": self.stream.media_id, "variant": url.split("?")[0], "mode": self.mode}
+        if any(manifest.get(k) != v for k, v in expected.items()):
+            logger.warning(f"{self.manifest_path} is for a different recording, starting over")
+            return 0, 0
+        return manifest["segments"], manifest["bytes"]
+
+    def _save_manifest(self, url):
+        manifest = {"media_id": self.stream.media_id, "variant": url.split("?")[0], "mode": self.mode,
+                    "segments": self.written, "bytes": self.bytes, "total": self.total, "updated": time.time()}
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def key_for(self, table, index, base):
+        ''' (key, iv) for segment index, or None if it is not encrypted. '''
+        entry = None
+        for first, key in table.keys:
+            if first > index:
+                break
+            if key.tag == m3u8.KEY:
+                entry = key
+        if not entry or entry.method == "NONE":
+            return None
+        if entry.method != AES_128:
+            raise Exception(f"cannot record {entry.method} encrypted segments")
+
+        uri = urljoin(base, entry.uri)
+        with self._key_lock:
+            if uri not in self._keys:
+                r = transport.get(uri, transport.PLAYLIST)
+                if not r.ok:
+                    raise Exception(f"key download failed: {r.status_code} {uri}")
+                self._keys[uri] = r.content
+        iv = entry.attributes.get("IV")
+        iv = bytes.fromhex(iv[2:]) if iv else table.sequence[index].to_bytes(16, "big")
+        return self._keys[uri], iv
+
+    def fetch(self, url):
+        ''' Returns the bytes of a segment, retrying transient failures. '''
+        for attempt in range(RETRIES):
+            try:
+                with transport.get(url, transport.PLAYLIST, stream=True) as r:
+                    if not r.ok:
+                        raise Exception(f"segment download failed: {r.status_code} {url}")
+                    return b"".join(r.iter_content(CHUNK_SIZE))
+            except Exception as err:
+                if attempt == RETRIES - 1 or self._stop.is_set():
+                    raise
+                logger.debug(f"retrying {url}: {err}")
+                time.sleep(2 ** attempt)
+
+    def _download(self, table, index, base):
+        data = self.fetch(urljoin(base, table.uri[index]))
+        key = self.key_for(table, index, base)
+        return decrypt(data, *key) if key else data
+
+    def record(self, progress=None):
+        ''' Records every segment published so far and returns the number of bytes in the file.
+            progress(done, total) is called after each segment. '''
+        url = self.stream.media_playlist_url(self.number)
+        table = self.stream.fetch_media_records(self.number, SegmentTable.from_records)
+        self.total = len(table)
+        skip = self.skipped(table)
+
+        self.written, self.bytes = self._load_manifest(url)
+        if self.written > self.total:
+            raise Exception(f"{self.path} holds more segments than the playlist; was it a different game?")
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True) # the manifest goes next to the file
+        file_mode = "r+b" if self.bytes and os.path.exists(self.path) else "wb"
+        with open(self.path, file_mode) as out, ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="recorder") as pool:
+            out.truncate(self.bytes)
+            out.seek(self.bytes)
+            if self.written == 0:
+                self._write_map(table, url, out)
+
+            pending = deque() # (index, future) in playlist order
+            todo = iter(i for i in range(self.written, self.total) if not skip[i])
+            try:
+                while True:
+                    while len(pending) < self.window and not self._stop.is_set():
+                        index = next(todo, None)
+                        if index is None:
+                            break
+                        pending.append((index, pool.submit(self._download, table, index, url)))
+                    if not pending:
+                        break
+
+                    index, future = pending.popleft()
+                    data = future.result()
+                    out.write(data)
+                    out.flush()
+                    self.bytes += len(data)
+                    # skipped segments right after this one count as done too
+                    self.written = pending[0][0] if pending else self._next_kept(skip, index + 1)
+                    self._save_manifest(url)
+                    if progress:
+                        progress(self.written, self.total)
+            finally:
+                for _, future in pending:
+                    future.cancel()
+
+        logger.info(f"recorded {self.written}/{self.total} segments, {self.bytes} bytes to {self.path}")
+        return self.bytes
+
+    def _next_kept(self, skip, index):
+        while index < len(skip) and skip[index]:
+            index += 1
+        return index
+
+    def _write_map(self, table, base, out):
+        ''' Writes the initialization section of a fragmented MP4 variant ahead of its first segment. '''
+        init = next((key for _, key in table.keys if key.tag == m3u8.MAP), None)
+        if init:
+            data = self.fetch(urljoin(base, init.uri))
+            out.write(data)
+            self.bytes += len(data)
+
+    def stop(self):
+        ''' Stops after the segments already downloading are written; record() then returns. '''
+        self._stop.set()
+
+class CondensedRecorder(Recorder):
+    ''' Records only the half innings, from each INNING START milestone to its INNING END, with the
+        commercial breaks inside them cut too. Segments between half innings are never downloaded. '''
+
+    def __init__(self, stream, path, number=None, **kwargs):
+        super().__init__(stream, path, number, skip_breaks=True, **kwargs)
+
+    @property
+    def mode(self):
+        return "condensed"
+
+    def skipped(self, table):
+        timeline = Timeline(milestones=self.stream.get_milestones())
+        if not timeline.half_innings_indexed():
+            raise Exception("the game has no inning milestones to condense it by")
+        return [outside or in_break for outside, in_break in zip(inning_mask(table, timeline), break_mask(table))]
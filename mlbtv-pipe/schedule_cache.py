@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import logging
+import math
+import threading
+import time
+
+TODAY_TTL = 60 # seconds, scores and states change during the day
+UPCOMING_TTL = 15 * 60
+UNFINISHED_TTL = 5 * 60 # past dates with suspended or late running games
+FINAL = "Final"
+
+logger = logging.getLogger(__name__)
+
+def get_ttl(date, games):
+    ''' How long the schedule for date (YYYY-MM-DD) stays fresh. Past dates whose games are all final never change. '''
+    today = datetime.now().strftime("%Y-%m-%d")
+    if date == today:
+        return TODAY_TTL
+    if date > today:
+        return UPCOMING_TTL
+    if all(g.get("status", {}).get("abstractGameState") == FINAL for g in games):
+        return math.inf
+    return UNFINISHED_TTL
+
+class ScheduleCache:
+    ''' Schedules by date, refetched with fetch(date) once their ttl has passed.
+        prefetch() loads dates in the background so a later get() finds them ready. '''
+
+    def __init__(self, fetch, workers=2):
+        self.fetch = fetch
+        self._entries = {} # date -> (expires, games)
+        self._pending = {} # date -> Future of a fetch in progress
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="schedule")
+
+    def _fresh(self, date):
+        entry = self._entries.get(date)
+        return entry and entry[0] > time.monotonic()
+
+    def put(self, date, games):
+        self._entries[date] = (time.monotonic() + get_ttl(date, games), games)
+
+    def get(self, date):
+        with self._lock:
+            if self._fresh(date):
+                return self._entries[date][1]
+            future = self._pending.get(date)
+
+        if future:
+            return future.result()
+        return self._load(date)
+
+    def prefetch(self, date):
+        with self._lock:
+            if self._fresh(date) or date in self._pending:
+                return
+            self._pending[date] = self._pool.submit(self._load, date)
+
+    def _load(self, date):
+        try:
+            games = self.fetch(date)
+            with self._lock:
+                self.put(date, games)
+            return games
+        finally:
+            with self._lock:
+                self._pending.pop(date, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,125 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+import logging
+import pytz
+from . import mlb_stats
+
+logger = logging.getLogger(__name__)
+
+HOME = "home"
+AWAY = "away"
+
+class ScheduleIndex:
+    ''' Schedule for a range of dates, loaded in one statsapi request and indexed by date, team,
+        gamePk and broadcast, so resolving games and media IDs is a dictionary lookup. '''
+
+    def __init__(self):
+        self.by_date = {} # YYYY-MM-DD -> [game]
+        self.by_pk = {} # gamePk -> game
+        self.by_team = {} # team id -> [game] sorted by gameDate
+        self.team_ids = {} # lowercased team name or abbreviation -> team id
+        self.by_broadcast = {} # (broadcast type, availability text) -> [(game, broadcast)]
+        self.preferred = {} # (gamePk, team id) -> media id of the preferred broadcast for that team
+
+        self._team_dates = {} # team id -> gameDates, parallel to by_team for bisect
+
+    def load(self, start_date, end_date):
+        ''' Loads every game from start_date to end_date, e.g. a week or a whole season, in one request.
+            The days loaded are also stored in mlb_stats.SCHEDULE for the menus. '''
+        dates = mlb_stats.fetch_schedule(start_date, end_date)
+        for entry in dates:
+            self._add_date(entry["date"], entry["games"])
+            mlb_stats.SCHEDULE.put(entry["date"], entry["games"])
+
+        for team_id, games in self.by_team.items():
+            games.sort(key=lambda g: g["gameDate"])
+            self._team_dates[team_id] = [g["gameDate"] for g in games]
+
+        logger.debug(f"indexed {len(self.by_pk)} games from {start_date} to {end_date}")
+        return self
+
+    def load_season(self, year=None):
+        year = year or datetime.now().year
+        return self.load(f"{year}-01-01", f"{year}-12-31")
+
+    def load_days(self, days=7, start=None):
+        start = start or datetime.now()
+        return self.load(start, start + timedelta(days=days))
+
+    def _add_date(self, date, games):
+        self.by_date[date] = games
+        for game in games:
+            pk = game["gamePk"]
+            if pk in self.by_pk:
+                # a rescheduled game is listed on both dates, keep the latest listing
+                self._remove(self.by_pk[pk])
+            self.by_pk[pk] = game
+
+            for side in (HOME, AWAY):
+                team = game["teams"][side]["team"]
+                self.by_team.setdefault(team["id"], []).append(game)
+                self.team_ids[team["name"].lower()] = team["id"]
+                if "abbreviation" in team:
+                    self.team_ids[team["abbreviation"].lower()] = team["id"]
+
+            for broadcast in game.get("broadcasts", []):
+                key = (broadcast.get("type"), broadcast.get("availability", {}).get("availabilityText"))
+                self.by_broadcast.setdefault(key, []).append((game, broadcast))
+
+                for side in (HOME, AWAY):
+                    team_id = game["teams"][side]["team"]["id"]
+                    if (pk, team_id) not in self.preferred and mlb_stats.is_preferred_broadcast(broadcast, side):
+                        self.preferred[(pk, team_id)] = broadcast["mediaId"]
+
+    def _remove(self, game):
+        pk = game["gamePk"]
+        for side in (HOME, AWAY):
+            team_id = game["teams"][side]["team"]["id"]
+            if team_id in self.by_team:
+                self.by_team[team_id] = [g for g in self.by_team[team_id] if g is not game]
+            self.preferred.pop((pk, team_id), None)
+        for key, entries in self.by_broadcast.items():
+            self.by_broadcast[key] = [e for e in entries if e[0] is not game]
+
+    def team_id(self, team):
+        ''' Accepts a team id, name or abbreviation. '''
+        if isinstance(team, int):
+            return team
+        try:
+            return self.team_ids[team.lower()]
+        except KeyError:
+            raise KeyError(f"unknown team: {team}") from None
+
+    def games_on(self, date):
+        return self.by_date.get(mlb_stats.format_date(date), [])
+
+    def game(self, game_pk):
+        return self.by_pk.get(int(game_pk))
+
+    def team_games(self, team):
+        return self.by_team.get(self.team_id(team), [])
+
+    def next_games(self, team, n=1, after=None):
+        ''' Returns the team's next n games starting at or after the given time, now by default. '''
+        team_id = self.team_id(team)
+        after = after or datetime.now(tz=pytz.UTC)
+        if isinstance(after, datetime):
+            after = after.astimezone(pytz.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        i = bisect_left(self._team_dates.get(team_id, []), after)
+        return self.by_team.get(team_id, [])[i:i + n]
+
+    def preferred_media_id(self, game, team):
+        ''' Returns the media id get_stream_from_game would pick, or None. '''
+        return self.preferred.get((game["gamePk"], self.team_id(team)))
+
+    def next_media_ids(self, team, n=1, after=None):
+        ''' Returns [(game, media id or None)] for the team's next n games. '''
+        return [(game, self.preferred_media_id(game, team)) for game in self.next_games(team, n, after)]
+
+    def broadcasts(self, broadcast_type=None, availability=None):
+        ''' Returns [(game, broadcast)] matching a broadcast type and/or availability text. '''
+        return [entry
+                for (b_type, b_avail), entries in self.by_broadcast.items()
+                if broadcast_type in (None, b_type) and availability in (None, b_avail)
+                for entry in entries]
@@ -0,0 +1,196 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from . import transport
+from . import utilities as u
+
+SEGMENT_DIR = "segments"
+MAX_BYTES = 4 * 1024 ** 3
+READ_AHEAD = 5 # segments fetched past the one the player asked for
+MAX_LINKS = 50_000 # segment urls remembered from playlists, several games' worth for one variant
+WORKERS = 4
+CHUNK_SIZE = 256 * 1024
+
+logger = logging.getLogger(__name__)
+
+def segment_key(url):
+    ''' Cache key for a segment url. The query is left out because it only carries per-session tokens. '''
+    parts = urlsplit(url)
+    return hashlib.sha256(f"{parts.netloc}{parts.path}".encode("utf-8")).hexdigest()
+
+class SegmentCache:
+    ''' Disk-backed cache of media segments keyed by uri, evicted least recently used once it grows
+        past max_bytes. Segments are linked in playlist order as playlists are read, so a request for
+        one segment can start downloading the next read_ahead in the background. The links of segments
+        evicted from disk, or that no playlist has listed in the last max_links, are dropped. '''
+
+    def __init__(self, directory=None, max_bytes=MAX_BYTES, read_ahead=READ_AHEAD, workers=WORKERS, max_links=MAX_LINKS):
+        self.directory = directory or os.path.join(u.get_cache_dir(), SEGMENT_DIR)
+        self.max_bytes = max_bytes
+        self.read_ahead = read_ahead
+        self.max_links = max_links
+
+        self._entries = OrderedDict() # key -> size, least recently used first
+        self._size = 0
+        self._links = OrderedDict() # segment url -> url of the segment after it, or None, least recently listed first
+        self._urls = {} # key -> url the cached segment was downloaded from
+        self._pins = {} # key -> number of requests sending it, which keeps it from eviction
+        self._inflight = {} # key -> Event set once the download finishes
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="segment-cache")
+
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(path)
+                continue
+            st = os.stat(path)
+            files.append((st.st_atime, name, st.st_size))
+
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._size += size
+        logger.debug(f"segment cache holds {len(self._entries)} segments, {self._size} bytes")
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def link(self, url, previous=None):
+        ''' Records that url follows previous in a playlist. Returns url. '''
+        with self._lock:
+            if previous:
+                self._links[previous] = url
+                self._links.move_to_end(previous)
+            self._links.setdefault(url, None)
+            self._links.move_to_end(url)
+            while len(self._links) > self.max_links:
+                self._links.popitem(last=False)
+        return url
+
+    def knows(self, url):
+        return url in self._links
+
+    def get(self, url):
+        ''' Returns the path of the cached segment, downloading it first on a miss,
+            and schedules the following segments for download. '''
+        path = self._fetch(url)
+        self._schedule_read_ahead(url)
+        return path
+
+    @contextmanager
+    def pinned(self, url):
+        ''' Like get(), but the segment is not evicted before the with block ends, e.g. while it is being sent. '''
+        key = segment_key(url)
+        path = self._fetch(url, pin=True)
+        try:
+            self._schedule_read_ahead(url)
+            yield path
+        finally:
+            with self._lock:
+                self._pins[key] -= 1
+                if not self._pins[key]:
+                    del self._pins[key]
+                    self._evict()
+
+    def _schedule_read_ahead(self, url):
+        nxt = self._links.get(url)
+        for _ in range(self.read_ahead):
+            if not nxt:
+                break
+            key = segment_key(nxt)
+            if key not in self._entries and key not in self._inflight:
+                self._pool.submit(self._fetch_quietly, nxt)
+            nxt = self._links.get(nxt)
+
+    def _fetch_quietly(self, url):
+        try:
+            self._fetch(url)
+        except Exception as err:
+            logger.warning(f"read ahead of {url} failed: {err}")
+
+    def _fetch(self, url, pin=False):
+        key = segment_key(url)
+        path = self._path(key)
+
+        while True:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    if pin:
+                        self._pins[key] = self._pins.get(key, 0) + 1
+                    return path
+                done = self._inflight.get(key)
+                if not done:
+                    done = self._inflight[key] = threading.Event()
+                    break
+            # someone else is downloading it
+            done.wait()
+
+        try:
+            size = self._download(url, path)
+            with self._lock:
+                self._entries[key] = size
+                self._size += size
+                self._urls[key] = url
+                if pin:
+                    self._pins[key] = self._pins.get(key, 0) + 1
+                self._evict()
+            return path
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def _download(self, url, path):
+        r = transport.get(url, transport.PLAYLIST, stream=True)
+        with r:
+            if not r.ok:
+                raise Exception(f"segment download failed: {r.status_code} {url}")
+
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            size = 0
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        size += len(chunk)
+                os.replace(tmp_path, path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+        return size
+
+    def _evict(self):
+        ''' Removes least recently used segments until the cache fits max_bytes again, passing over pinned ones. '''
+        victims = []
+        excess = self._size - self.max_bytes
+        for key, size in self._entries.items():
+            if excess <= 0 or len(self._entries) - len(victims) <= 1:
+                break
+            if key not in self._pins:
+                victims.append(key)
+                excess -= size
+
+        for key in victims:
+            self._size -= self._entries.pop(key)
+            url = self._urls.pop(key, None)
+            if url:
+                # a playlist that still lists it links it again
+                self._links.pop(url, None)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
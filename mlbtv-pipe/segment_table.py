@@ -0,0 +1,157 @@
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from itertools import accumulate
+import math
+from . import m3u8
+
+try:
+    import numpy as np
+except ImportError: # the pure python path gives the same results, just slower on long games
+    np = None
+
+NO_CUE = 0
+CUE_OUT = 1
+CUE_IN = 2
+CUE_BOTH = 3 # a CUE-IN and the next CUE-OUT before the same segment
+
+class SegmentTable:
+    ''' A media playlist's segments as columns: sequence, duration, program date time and cue state,
+        with start offsets and commercial breaks derived from them in bulk and kept for later queries. '''
+
+    def __init__(self):
+        self.sequence = array("q")
+        self.duration = array("d") # seconds
+        self.cue = array("b") # cue tags seen before the segment
+        self.uri = []
+        self.keys = [] # (index of the first segment it applies to, m3u8.Key)
+        self._pdt = [] # (segment index, program date time string)
+        self._pending_cue = NO_CUE
+        self._offsets = None
+        self._breaks = None
+
+    @classmethod
+    def from_records(cls, records):
+        table = cls()
+        for record in records:
+            table.append(record)
+        return table
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def append(self, record):
+        ''' Adds a m3u8 record. Only segments, cues and keys are kept. '''
+        if isinstance(record, m3u8.Segment):
+            i = len(self.sequence)
+            self.sequence.append(record.sequence)
+            self.duration.append(record.duration or 0)
+            self.uri.append(record.uri)
+            self.cue.append(self._pending_cue)
+            self._pending_cue = NO_CUE
+            if record.program_date_time:
+                self._pdt.append((i, record.program_date_time))
+            self._offsets = self._breaks = None
+
+        elif isinstance(record, m3u8.Cue):
+            if record.kind == m3u8.OUT:
+                self._pending_cue = CUE_BOTH if self._pending_cue == CUE_IN else CUE_OUT
+            elif record.kind == m3u8.IN:
+                if self._pending_cue & CUE_OUT:
+                    self._pending_cue &= ~CUE_OUT # a break with no segments in it is dropped
+                else:
+                    self._pending_cue |= CUE_IN
+            self._breaks = None
+
+        elif isinstance(record, m3u8.Key):
+            self.keys.append((len(self.sequence), record))
+
+    def _pdt_epochs(self):
+        ''' Program date times as epoch seconds, parsed in one pass. '''
+        stamps = [pdt for _, pdt in self._pdt]
+        if np is not None:
+            # numpy parses ISO 8601 in C, but warns on a zone suffix, and these are all UTC
+            stamps = np.array([s[:-1] if s.endswith("Z") else s for s in stamps], dtype="datetime64[us]")
+            return (stamps - np.datetime64(0, "us")).astype("float64") / 1e6
+        return [datetime.fromisoformat(s.replace("Z", "+00:00")).timestamp() for s in stamps]
+
+    def offsets(self):
+        ''' Start of each segment in ms from the first program date time. A segment with a program date
+            time starts there; others start where the previous one ended. Rounded once, at the end. '''
+        if self._offsets is not None:
+            return self._offsets
+
+        n = len(self.sequence)
+        anchors = [i for i, _ in self._pdt]
+        epochs = self._pdt_epochs()
+        first = epochs[0] if anchors else 0
+
+        if np is not None:
+            cum = np.zeros(n + 1)
+            np.cumsum(np.frombuffer(self.duration, dtype="float64"), out=cum[1:])
+            anchor_time = np.zeros(n)
+            anchor_cum = np.zeros(n)
+            if anchors:
+                idx = np.full(n, -1)
+                idx[anchors] = np.arange(len(anchors))
+                last = np.maximum.accumulate(idx) # which program date time each segment counts from
+                has = last >= 0
+                anchor_time[has] = np.asarray(epochs)[last[has]] - first
+                anchor_cum[has] = cum[np.asarray(anchors)[last[has]]]
+            offsets = np.rint((anchor_time + cum[:n] - anchor_cum) * 1000)
+            self._offsets = array("d", offsets.tobytes())
+        else:
+            cum = [0.0] + list(accumulate(self.duration))
+            offsets = array("d", bytes(8 * n))
+            pdt = dict(zip(anchors, epochs))
+            base_time, base_cum = 0.0, 0.0
+            for i in range(n):
+                if i in pdt:
+                    base_time, base_cum = pdt[i] - first, cum[i]
+                offsets[i] = round((base_time + cum[i] - base_cum) * 1000)
+            self._offsets = offsets
+
+        return self._offsets
+
+    def end(self):
+        ''' End of the last segment in ms. '''
+        if not self.sequence:
+            return 0
+        return self.offsets()[-1] + round(self.duration[-1] * 1000)
+
+    def breaks(self):
+        ''' [start, end] of each commercial break in ms. A break still open at the end of the playlist has end 0. '''
+        if self._breaks is not None:
+            return self._breaks
+
+        offsets = self.offsets()
+        if np is not None:
+            cue = np.frombuffer(self.cue, dtype="int8")
+            marked = np.flatnonzero(cue).tolist()
+        else:
+            marked = [i for i, c in enumerate(self.cue) if c]
+
+        events = [(i, self.cue[i]) for i in marked]
+        if self._pending_cue:
+            events.append((len(self.sequence), self._pending_cue))
+
+        breaks = []
+        in_break = False
+        for i, cue in events:
+            at = offsets[i] if i < len(offsets) else self.end()
+            if cue & CUE_IN and in_break:
+                breaks[-1][1] = at
+                in_break = False
+            if cue & CUE_OUT:
+                breaks.append([at, 0])
+                in_break = True
+
+        self._breaks = breaks
+        return breaks
+
+    def index_at(self, ms):
+        ''' Index of the segment playing at ms of stream time, or -1 before the first. '''
+        return bisect_right(self.offsets(), ms) - 1
+
+    def total_duration(self):
+        return math.fsum(self.duration)
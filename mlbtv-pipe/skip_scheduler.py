@@ -0,0 +1,128 @@
+from collections import deque
+import logging
+import math
+import threading
+import time
+from .timeline import OPEN
+
+RESYNC_INTERVAL = 5 # seconds between player clock reads while nothing is due
+SEEK_SETTLE = .5 # seconds to wait before checking that a seek landed
+MIN_WAIT = .01
+
+logger = logging.getLogger(__name__)
+
+class PlaybackClock:
+    ''' Last position sample from the player, extrapolated forward by the playback rate. '''
+
+    __slots__ = ("position", "rate", "playing", "sampled_at")
+
+    def __init__(self, position, rate=1.0, playing=True):
+        self.position = position # ms of stream time
+        self.rate = rate
+        self.playing = playing
+        self.sampled_at = time.monotonic()
+
+    def now(self):
+        if not self.playing:
+            return self.position
+        return self.position + (time.monotonic() - self.sampled_at) * 1000 * self.rate
+
+class AdSkipScheduler:
+    ''' Skips commercial breaks by arming a wait for the exact start of the next break instead of polling.
+
+        The player clock comes either from sample(), a callable returning (position_ms, rate, playing) that is
+        read every resync_interval and at each break, or from update() for players that push position changes.
+        seek is a callable taking a position in ms. '''
+
+    @classmethod
+    def for_player(cls, stream, source, seek_seconds, sample=None):
+        ''' The scheduler for a player opened on source, or on stream's master playlist when source is None.
+            Any other source, e.g. an ad-free playlist from hls_proxy, needs no skipping and gets None.
+            seek_seconds takes whole seconds; the end of a break is rounded up to them, so playback
+            never lands back inside it. '''
+        if source is not None:
+            return None
+        return cls(stream.get_timeline(), lambda ms: seek_seconds(math.ceil(ms / 1000)), sample)
+
+    def __init__(self, timeline, seek, sample=None, resync_interval=RESYNC_INTERVAL):
+        self.timeline = timeline
+        self.seek = seek
+        self.sample = sample
+        self.resync_interval = resync_interval
+
+        self.clock = None
+        self.skips = 0
+        self._due = True # read the player clock on the next poll
+        self._calls = deque() # callables for the thread in run(), see call_soon
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+    def update(self, position, rate=1.0, playing=True):
+        ''' Records a position pushed by the player, e.g. after the user seeks or pauses, and wakes run(). '''
+        self.clock = PlaybackClock(position, rate, playing)
+        self._wake.set()
+
+    def resync(self):
+        ''' Makes the next poll read the player clock again. '''
+        self._due = True
+        self._wake.set()
+
+    def call_soon(self, callback):
+        ''' Runs callback on the thread in run() before its next poll, for player work that must not block the caller. '''
+        self._calls.append(callback)
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def poll(self):
+        ''' Acts on the current playback position and returns how many seconds until it should run again. '''
+        if self.sample and (self._due or not self.clock or time.monotonic() - self.clock.sampled_at >= self.resync_interval):
+            self._due = False
+            sample = self.sample()
+            if sample:
+                self.clock = PlaybackClock(*sample)
+
+        if not self.clock:
+            return self.resync_interval
+
+        t = self.clock.now()
+        current = self.timeline.break_at(t)
+        if current:
+            start, end = current
+            if end == OPEN:
+                # a live break with no CUE-IN yet, check again once the tailer may have found it
+                return self.resync_interval
+
+            logger.info(f"skipping commercial break {start/1000:.1f}s-{end/1000:.1f}s")
+            self.seek(end)
+            self.skips += 1
+            self.clock = PlaybackClock(end, self.clock.rate, self.clock.playing)
+            self._due = True # confirm the seek landed
+            return SEEK_SETTLE
+
+        if not self.clock.playing or self.clock.rate <= 0:
+            return self.resync_interval
+
+        wait = self.resync_interval
+        upcoming = self.timeline.next_break(t)
+        if upcoming:
+            until = (upcoming[0] - t) / 1000 / self.clock.rate
+            if until < wait:
+                wait = until
+                self._due = True # read the real position once more when the break is reached
+
+        return max(wait, MIN_WAIT)
+
+    def run(self, is_alive=lambda: True):
+        ''' Polls until stop() is called or is_alive() turns false. '''
+        while is_alive() and not self._stop.is_set():
+            while self._calls:
+                try:
+                    self._calls.popleft()()
+                except Exception as err:
+                    logger.warning(f"player call failed: {err}")
+            wait = self.poll()
+            self._wake.wait(wait)
+            self._wake.clear()
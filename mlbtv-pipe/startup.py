@@ -0,0 +1,144 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import logging
+import threading
+import time
+
+WORKERS = 6
+
+logger = logging.getLogger(__name__)
+
+class Step:
+
+    __slots__ = ("name", "fn", "deps", "dependents", "future", "submitted", "started", "finished")
+
+    def __init__(self, name, fn, deps):
+        self.name = name
+        self.fn = fn
+        self.deps = deps
+        self.dependents = []
+        self.future = Future()
+        self.submitted = False
+        self.started = None
+        self.finished = None
+
+class Startup:
+    ''' Runs startup steps on a thread pool as soon as the steps they depend on have finished,
+        and records when each ran so the critical path to any step can be reported.
+
+        add("playback", fn, "session") runs fn(session_result) once "session" is done. A step whose
+        dependency failed fails with the same exception without running. '''
+
+    def __init__(self, workers=WORKERS):
+        self.t0 = time.monotonic()
+        self.steps = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="startup")
+
+    def add(self, name, fn, *deps):
+        ''' Registers a step and starts it right away if its dependencies are already done. '''
+        with self._lock:
+            step = self._register(name, fn, deps)
+            ready = self._claim(step)
+        if ready:
+            self._submit(step)
+        return step.future
+
+    def done(self, name, value=None, started=None):
+        ''' Records a step that ran outside the pool, e.g. a menu answered on the main thread, and starts
+            whatever was waiting on it. started is its time.monotonic() start, the orchestrator's by default. '''
+        with self._lock:
+            step = self._register(name, None, ())
+            step.submitted = True
+        step.started = self.t0 if started is None else started
+        self._finish(step, value)
+        return step.future
+
+    def _register(self, name, fn, deps):
+        if name in self.steps:
+            raise ValueError(f"duplicate startup step: {name}")
+        step = self.steps[name] = Step(name, fn, [self.steps[d] for d in deps])
+        for dep in step.deps:
+            dep.dependents.append(step)
+        return step
+
+    def _claim(self, step):
+        ''' Marks a step submitted if all its dependencies are done. Called with the lock held. '''
+        if step.submitted or not all(dep.future.done() for dep in step.deps):
+            return False
+        step.submitted = True
+        return True
+
+    def result(self, name, timeout=None):
+        return self.steps[name].future.result(timeout)
+
+    def _submit(self, step):
+        failed = next((dep.future.exception() for dep in step.deps if dep.future.exception()), None)
+        if failed:
+            self._finish(step, error=failed)
+        else:
+            self._pool.submit(self._run, step)
+
+    def _run(self, step):
+        step.started = time.monotonic()
+        try:
+            value = step.fn(*(dep.future.result() for dep in step.deps))
+        except BaseException as err:
+            logger.debug(f"startup step {step.name} failed: {err}")
+            self._finish(step, error=err)
+        else:
+            self._finish(step, value)
+
+    def _finish(self, step, value=None, error=None):
+        step.finished = time.monotonic()
+        if step.started is None:
+            step.started = step.finished
+        if error is not None:
+            step.future.set_exception(error)
+        else:
+            step.future.set_result(value)
+        logger.debug(f"startup step {step.name} took {step.finished - step.started:.3f}s")
+
+        with self._lock:
+            ready = [d for d in step.dependents if self._claim(d)]
+        for d in ready:
+            self._submit(d)
+
+    def critical_path(self, name):
+        ''' The chain of steps that decided when name finished, following the latest finishing dependency. '''
+        path = []
+        step = self.steps[name]
+        while step:
+            path.append(step)
+            finished = [dep for dep in step.deps if dep.finished is not None]
+            step = max(finished, key=lambda dep: dep.finished) if finished else None
+        return path[::-1]
+
+    def report(self, name):
+        ''' Timings of every step, with the critical path to name marked, as printable lines. '''
+        critical = {step.name for step in self.critical_path(name)}
+        lines = [f"{'step':<16}{'start':>9}{'end':>9}{'took':>9}"]
+        for step in sorted(self.steps.values(), key=lambda s: (s.started is None, s.started or 0)):
+            if step.finished is None:
+                lines.append(f"{step.name:<16}{'pending':>9}")
+                continue
+            mark = " *" if step.name in critical else ""
+            lines.append(f"{step.name:<16}{step.started - self.t0:9.3f}{step.finished - self.t0:9.3f}"
+                         f"{step.finished - step.started:9.3f}{mark}")
+        lines.append(f"* critical path to {name}")
+        return lines
+
+    def timings(self, name):
+        ''' The same timings as report(), as a dict that can be written out as json. '''
+        critical = {step.name for step in self.critical_path(name)}
+        steps = {}
+        for step in self.steps.values():
+            if step.finished is None:
+                continue
+            steps[step.name] = {"start": round(step.started - self.t0, 4), "end": round(step.finished - self.t0, 4),
+                                "took": round(step.finished - step.started, 4), "critical": step.name in critical,
+                                "failed": step.future.exception() is not None}
+        return {"target": name, "total": round(self.steps[name].finished - self.t0, 4) if self.steps[name].finished else None,
+                "steps": steps}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
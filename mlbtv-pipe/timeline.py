@@ -0,0 +1,111 @@
+from array import array
+from bisect import bisect_right
+import math
+from .milestones import TOP, BOT, START, END
+
+OPEN = math.inf # end of a break whose CUE-IN has not been seen yet
+
+class Timeline:
+    ''' Sorted index over a game's commercial breaks and milestones, all in milliseconds of stream time.
+        The break list is only read, never copied whole: each query first picks up breaks appended to it
+        since the last query, so a list a live tailer keeps extending stays indexed in O(new breaks). '''
+
+    __slots__ = ("_breaks", "_synced", "_starts", "_ends",
+                 "_halves", "_half_starts", "_half_ends", "_innings", "_milestones")
+
+    def __init__(self, breaks=None, milestones=None):
+        self._breaks = [] if breaks is None else breaks
+        self._synced = 0
+        self._starts = array("d")
+        self._ends = array("d")
+
+        self._halves = [] # (inning, half) in stream order
+        self._half_starts = array("d")
+        self._half_ends = array("d")
+        self._innings = {} # (inning, half) -> index into the arrays above
+        self._milestones = {}
+
+        if milestones:
+            self.set_milestones(milestones)
+
+    def _sync(self):
+        # only the newest break can still be open, so check whether its CUE-IN has arrived
+        if self._synced and self._ends[-1] == OPEN:
+            end = self._breaks[self._synced - 1][1]
+            if end:
+                self._ends[-1] = end
+
+        if len(self._breaks) > self._synced:
+            for start, end in self._breaks[self._synced:]:
+                self._starts.append(start)
+                self._ends.append(end or OPEN)
+            self._synced = len(self._starts)
+
+    def set_milestones(self, milestones):
+        ''' Indexes the half innings and other milestones of a Milestones object. '''
+        halves = []
+        for inning, sides in milestones.INNINGS.items():
+            for half in (TOP, BOT):
+                edges = sides.get(half)
+                if not edges or START not in edges:
+                    continue
+                start = edges[START].relative_time * 1000
+                end = edges[END].relative_time * 1000 if END in edges else OPEN
+                halves.append((start, end, inning, half))
+        halves.sort()
+
+        self._halves = [(inning, half) for _, _, inning, half in halves]
+        self._half_starts = array("d", (h[0] for h in halves))
+        self._half_ends = array("d", (h[1] for h in halves))
+        self._innings = {key: i for i, key in enumerate(self._halves)}
+        self._milestones = {ms.type: ms.relative_time * 1000 for ms in milestones.types() if ms.relative_time is not None}
+
+    def half_innings_indexed(self):
+        return bool(self._halves)
+
+    def __len__(self):
+        self._sync()
+        return len(self._starts)
+
+    def breaks(self):
+        self._sync()
+        return list(zip(self._starts, self._ends))
+
+    def break_at(self, t):
+        ''' Returns (start, end) of the break containing t, or None. end is OPEN for a break still running. '''
+        self._sync()
+        i = bisect_right(self._starts, t) - 1
+        if i >= 0 and t <= self._ends[i]:
+            return self._starts[i], self._ends[i]
+        return None
+
+    def next_break(self, t):
+        ''' Returns (start, end) of the first break starting after t, or None. '''
+        self._sync()
+        i = bisect_right(self._starts, t)
+        if i < len(self._starts):
+            return self._starts[i], self._ends[i]
+        return None
+
+    def inning_start(self, inning, half=TOP):
+        i = self._innings.get((int(inning), half))
+        return None if i is None else self._half_starts[i]
+
+    def inning_end(self, inning, half=TOP):
+        i = self._innings.get((int(inning), half))
+        return None if i is None else self._half_ends[i]
+
+    def half_inning_at(self, t):
+        ''' Returns (inning, half) being played at t, or None between half innings. '''
+        i = bisect_right(self._half_starts, t) - 1
+        if i >= 0 and t <= self._half_ends[i]:
+            return self._halves[i]
+        return None
+
+    def half_innings(self):
+        ''' Yields (inning, half, start, end) in stream order. '''
+        for (inning, half), start, end in zip(self._halves, self._half_starts, self._half_ends):
+            yield inning, half, start, end
+
+    def milestone_offset(self, milestone_type):
+        return self._milestones.get(milestone_type)
@@ -0,0 +1,45 @@
+import hashlib
+import logging
+import os
+from .mlbtv_token import Token
+from . import utilities as u
+
+logger = logging.getLogger(__name__)
+
+TOKEN_DIR = "tokens"
+
+class TokenStore:
+    ''' Keeps one token per username on disk, in files readable only by the current user. '''
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(u.get_cache_dir(), TOKEN_DIR)
+
+    def _path(self, username):
+        # hash the username so it does not appear in the file listing
+        key = hashlib.sha256(username.strip().lower().encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, username):
+        ''' Returns the stored Token for username, or None if there is none. '''
+        token_json = u.read_json(self._path(username))
+        if not token_json:
+            return None
+
+        try:
+            token = Token(token_json)
+        except (KeyError, TypeError, ValueError) as err:
+            logger.warning(f"discarding unreadable stored token: {err}")
+            self.delete(username)
+            return None
+
+        logger.debug(f"loaded stored token, expires in {token.secs_until_expired()}s")
+        return token
+
+    def save(self, username, token):
+        u.write_private_json(self._path(username), token.to_json())
+
+    def delete(self, username):
+        try:
+            os.remove(self._path(username))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,150 @@
+from urllib.parse import urlsplit
+import logging
+import threading
+
+# requests is imported lazily with the first session, so resolve-only runs, which read the schedule
+# through mlb_stats.get_json, never load it
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT = 5 # seconds
+READ_TIMEOUT = 20
+POOL_MAXSIZE = 8 # keep-alive connections kept per host
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36"
+
+_CHROME = {
+    "Accept-Encoding": "gzip, deflate, br, zstd",
+    "Sec-Ch-Ua": '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
+    "Sec-Ch-Ua-Mobile": "?0",
+    "sec-Ch-Ua-Platform": '"Windows"',
+    "User-Agent": USER_AGENT
+}
+
+_CORS = _CHROME | {
+    "Origin": "https://www.mlb.com",
+    "Priority": "u=1, i",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-site"
+}
+
+# header profiles, built once at import and shared by every request
+OKTA_FORM = _CORS | {
+    "Accept": "application/json",
+    "Accept-Language": "en",
+    "Content-Type": "application/x-www-form-urlencoded",
+    "Referer": "https://www.mlb.com/login?redirectUri=/"
+}
+
+OKTA_ION = OKTA_FORM | {
+    "Accept": "application/ion+json; okta-version=1.0.0",
+    "Content-Type": "application/ion+json; okta-version=1.0.0"
+}
+
+OKTA_JSON = OKTA_FORM | {
+    "Accept": "application/json; okta-version=1.0.0",
+    "Content-Type": "application/json"
+}
+
+GRAPHQL = _CORS | {
+    "Accept": "application/json, text/plain, */*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Content-Type": "application/json"
+}
+
+PLAYLIST = _CHROME | {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Priority": "u=0, i",
+    "Sec-Fetch-Dest": "document",
+    "Sec-Fetch-Mode": "navigate",
+    "Sec-Fetch-Site": "none"
+}
+
+MASTER_PLAYLIST = PLAYLIST | {"Priority": "u=1, i"}
+
+STATSAPI = {"User-Agent": USER_AGENT}
+
+LOCAL = {}
+
+_sessions = {}
+_lock = threading.Lock()
+
+def configure(connect_timeout=None, read_timeout=None, pool_maxsize=None):
+    ''' Overrides the default timeouts and pool size.
+        Pool size only applies to hosts contacted after the call. '''
+    global CONNECT_TIMEOUT, READ_TIMEOUT, POOL_MAXSIZE
+
+    if connect_timeout is not None:
+        CONNECT_TIMEOUT = connect_timeout
+    if read_timeout is not None:
+        READ_TIMEOUT = read_timeout
+    if pool_maxsize is not None:
+        POOL_MAXSIZE = pool_maxsize
+
+def get_session(url):
+    ''' Returns the keep-alive session for the host of the given url, creating it on first use. '''
+    parts = urlsplit(url)
+    host = f"{parts.scheme}://{parts.netloc}"
+
+    session = _sessions.get(host)
+    if session:
+        return session
+
+    with _lock:
+        if host not in _sessions:
+            import requests
+            from requests.adapters import HTTPAdapter
+            requests.packages.urllib3.disable_warnings()
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+            session.mount(host, adapter)
+            _sessions[host] = session
+            logger.debug(f"opened connection pool for {host}")
+        return _sessions[host]
+
+def request(method, url, profile=LOCAL, headers=None, timeout=None, **kwargs):
+    ''' Sends a request through the pooled session for the url's host.
+        headers are merged over the profile for values that vary per call. '''
+    if headers:
+        profile = profile | headers
+
+    if timeout is None:
+        timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+    return get_session(url).request(method, url, headers=profile, timeout=timeout, **kwargs)
+
+def get(url, profile=LOCAL, **kwargs):
+    return request("GET", url, profile, **kwargs)
+
+def post(url, profile=LOCAL, **kwargs):
+    return request("POST", url, profile, **kwargs)
+
+class Request:
+    ''' A request described without sending it, so the same flow can run on this transport or async_transport. '''
+
+    __slots__ = ("method", "url", "profile", "kwargs")
+
+    def __init__(self, method, url, profile=LOCAL, **kwargs):
+        self.method = method
+        self.url = url
+        self.profile = profile
+        self.kwargs = kwargs
+
+def run(flow):
+    ''' Drives a generator that yields Requests and receives their responses, returning its result. '''
+    try:
+        req = next(flow)
+        while True:
+            req = flow.send(request(req.method, req.url, req.profile, **req.kwargs))
+    except StopIteration as done:
+        return done.value
+
+def close():
+    ''' Closes every pooled connection. '''
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -1,7 +1,12 @@
 from datetime import datetime
+import json
 import os
+import sys
+import tempfile
 import pytz
 
+APP = "mlbtv-pipe"
+
 default_tz = "US/Arizona"
 
 def convert_to_timezone(iso_date, tzone=default_tz):
@@ -108,3 +113,42 @@ def clear_terminal():
         os.system('cls')
     else:  #Linux
         os.system('clear')
+
+
+def get_cache_dir():
+    """
+    Returns the per-user directory the app keeps its cached state in, creating it if needed.
+    Uses LOCALAPPDATA on Windows and XDG_CACHE_HOME (or ~/.cache) elsewhere.
+    """
+    if sys.platform == "win32" and os.getenv("LOCALAPPDATA"):
+        root = os.getenv("LOCALAPPDATA")
+    else:
+        root = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+
+    path = os.path.join(root, APP)
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+def read_json(path):
+    """Returns the parsed contents of a json file, or None if it is missing or unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_private_json(path, data):
+    """
+    Atomically writes data as json to a file only the current user can read.
+    The file is written beside its destination and renamed over it so readers never see a partial file.
+    """
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp") # created with mode 0600
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,160 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import logging
+import threading
+import time
+from . import transport
+from . import m3u8
+
+AVERAGE_BANDWIDTH = "AVERAGE-BANDWIDTH"
+BANDWIDTH = "BANDWIDTH"
+
+HEADROOM = 1.5 # the link must carry this many times a variant's bitrate to pick it
+PROBE_BYTES = 2 * 1024 * 1024 # stop timing a probe download after this much
+PROBE_VARIANTS = 3 # variants probed at once on the first selection
+INTERVAL = 30 # seconds between re-evaluations during playback
+SMOOTHING = .5 # weight of a higher throughput estimate against the running one
+CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+def variant_bandwidth(variant):
+    ''' Bits per second of a variant dict from Stream.get_media_playlists(). '''
+    return int(variant.get(AVERAGE_BANDWIDTH, variant.get(BANDWIDTH, 0)))
+
+def last_segment(records):
+    ''' The last m3u8.Segment among records, or None. '''
+    last = None
+    for record in records:
+        if isinstance(record, m3u8.Segment):
+            last = record
+    return last
+
+def probe(url, max_bytes=PROBE_BYTES):
+    ''' Downloads up to max_bytes of url and returns the throughput in bits per second. '''
+    start = time.monotonic()
+    received = 0
+    with transport.get(url, transport.PLAYLIST, stream=True) as r:
+        if not r.ok:
+            raise Exception(f"probe of {url} failed: {r.status_code}")
+        for chunk in r.iter_content(CHUNK_SIZE):
+            received += len(chunk)
+            if received >= max_bytes:
+                break
+    elapsed = max(time.monotonic() - start, 1e-3)
+    return received * 8 / elapsed
+
+class VariantSelector:
+    ''' Picks the highest variant of a Stream the link can sustain with headroom, by timing segment
+        downloads from several variants at once, then keeps re-checking the current variant and the
+        one above it while the game plays. Variant numbers index Stream.get_media_playlists(),
+        which is sorted from the lowest bandwidth up.
+
+        Parallel probes share the link, so their throughputs are summed into one estimate. '''
+
+    def __init__(self, stream, headroom=HEADROOM, interval=INTERVAL, probe_variants=PROBE_VARIANTS):
+        self.stream = stream
+        self.headroom = headroom
+        self.interval = interval
+        self.probe_variants = probe_variants
+
+        self.number = 0
+        self.throughput = None # bits per second, smoothed
+        self._listeners = []
+        self._pool = ThreadPoolExecutor(max_workers=max(probe_variants, 2), thread_name_prefix="variant-probe")
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def bandwidth(self):
+        ''' Bitrate of the selected variant, the most a player should be offered. '''
+        return variant_bandwidth(self.stream.get_media_playlists()[self.number])
+
+    def add_listener(self, callback):
+        ''' callback(number) is called whenever the selected variant changes. '''
+        self._listeners.append(callback)
+
+    def segment_url(self, number):
+        ''' URL of the newest segment of a variant, the one a CDN is most likely to have warm. '''
+        last = self.stream.fetch_media_records(number, last_segment)
+        if not last:
+            raise Exception(f"variant {number} has no segments")
+        return urljoin(self.stream.media_playlist_url(number), last.uri)
+
+    def measure(self, numbers):
+        ''' Probes the given variants concurrently and returns the link throughput estimate, or None. '''
+        futures = [self._pool.submit(lambda n: probe(self.segment_url(n)), n) for n in numbers]
+        rates = []
+        for number, future in zip(numbers, futures):
+            try:
+                rates.append(future.result())
+            except Exception as err:
+                logger.warning(f"throughput probe of variant {number} failed: {err}")
+        if not rates:
+            return None
+
+        estimate = sum(rates)
+        if self.throughput is None or estimate < self.throughput:
+            # drops count at once so playback does not stall, gains are smoothed so one fast probe does not
+            self.throughput = estimate
+        else:
+            self.throughput = SMOOTHING * estimate + (1 - SMOOTHING) * self.throughput
+        logger.debug(f"probed variants {numbers}: {estimate / 1e6:.1f} Mbps, smoothed {self.throughput / 1e6:.1f} Mbps")
+        return self.throughput
+
+    def pick(self, throughput):
+        ''' Highest variant whose bitrate times headroom fits in throughput; the lowest if none does. '''
+        best = 0
+        for number, variant in enumerate(self.stream.get_media_playlists()):
+            if variant_bandwidth(variant) * self.headroom <= throughput:
+                best = number
+        return best
+
+    def select(self):
+        ''' Probes the lowest, middle and highest variants and returns the chosen variant number. '''
+        count = len(self.stream.get_media_playlists())
+        numbers = sorted({round(i * (count - 1) / max(self.probe_variants - 1, 1)) for i in range(self.probe_variants)})
+        throughput = self.measure(numbers)
+        if throughput is not None:
+            self._set(self.pick(throughput))
+        return self.number
+
+    def reevaluate(self):
+        ''' Probes the current variant and the next one up, moving down at once if the link got worse. '''
+        count = len(self.stream.get_media_playlists())
+        numbers = [self.number] + ([self.number + 1] if self.number + 1 < count else [])
+        throughput = self.measure(numbers)
+        if throughput is not None:
+            self._set(self.pick(throughput))
+        return self.number
+
+    def _set(self, number):
+        if number == self.number:
+            return
+        logger.info(f"switching to variant {number} ({self.stream.get_media_playlists()[number].get('RESOLUTION', '?')}, "
+                    f"{variant_bandwidth(self.stream.get_media_playlists()[number]) / 1e6:.1f} Mbps)")
+        self.number = number
+        for callback in self._listeners:
+            callback(number)
+
+    def start(self):
+        ''' Selects once, then keeps re-evaluating in a daemon thread until stop(). '''
+        self.select()
+        self.start_reevaluating()
+
+    def start_reevaluating(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="variant-selector", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reevaluate()
+            except Exception as err:
+                logger.warning(f"variant re-evaluation failed: {err}")
+
+    def stop(self):
+        self._stop.set()
+        self._pool.shutdown(wait=False)
@@ -1,41 +1,98 @@
+import logging
 import subprocess
-import requests
 import time
 import xml.etree.ElementTree as ET
+from . import transport
+from urllib.parse import quote
+from .skip_scheduler import AdSkipScheduler
 
 VLC_LOCATION = "C:/Program Files/VideoLAN/VLC/vlc.exe"
 HOSTNAME = "localhost"
 PORT = 8080
 PASSWORD = "mlbtv"
+READY_TIMEOUT = 30 # seconds for VLC to answer on its control interface
+FIRST_FRAME_TIMEOUT = 60 # seconds for playback to start once it does
+PROBE_DELAY = .05 # first wait between probes, doubled after each miss
+MAX_PROBE_DELAY = .5
+FILENAME = "information/category[@name='meta']/info[@name='filename']"
+
+logger = logging.getLogger(__name__)
 
 class VLC_Handler():
 
-    def __init__(self, stream, args=[]):
+    def __init__(self, stream, args=[], url=None):
         self.stream = stream
+        self.source = url
         self.args = args + ["--extraintf=http", f"--http-host={HOSTNAME}", f"--http-port={PORT}", f"--http-password={PASSWORD}"]
         self.url = f"http://{HOSTNAME}:{PORT}/requests/status.xml"
 
         self.handle = None
-    
+        self.scheduler = None
+
 
     def start(self):
-        self.handle = subprocess.Popen([VLC_LOCATION, self.stream.get_master_playlist()] + self.args)
-        time.sleep(10)  # Wait for VLC to start and be ready to accept commands
+        self.launch()
+        self.wait_ready()
         self.monitor()
 
-    def monitor(self):
-        skip = True
-        if skip:
-            commercials = self.stream.get_commercial_breaks()
-            while self.handle.poll() is None:
-                t = int(self.get_status("time")) * 1000  # Convert to milliseconds
-                commercial_break = next((end for start, end in commercials if start <= t <= end), None)
-                if commercial_break:
-                    self.set_time(round(commercial_break/1000))
-                    time.sleep(5)
+    def launch(self):
+        self.handle = subprocess.Popen([VLC_LOCATION, self.source or self.stream.get_master_playlist()] + self.args)
+
+    def playback_renewed(self, url):
+        ''' Hands the switch to a renewed playback session's playlist to the thread in monitor(), since
+            opening it takes VLC a while and this is called from the heartbeat thread all streams share. '''
+        self.scheduler.call_soon(lambda: self.reload(url))
+
+    def reload(self, url):
+        ''' Switches the running VLC to url and seeks it to the position the old input had reached. '''
+        old = self.get_status()
+        position = self.get_clock(old)[0]
+        old_name = old.findtext(FILENAME)
+        self.send("in_play", {"input": quote(url, safe="")})
+
+        def switched():
+            res = self.get_status()
+            t, _, playing = self.get_clock(res)
+            # the old input reports playing until the new one is open, which starts again from the top
+            return playing and t > 0 and (t < position or res.findtext(FILENAME) != old_name)
+        self.probe(switched, FIRST_FRAME_TIMEOUT, "playing the renewed playlist")
+        self.scheduler.seek(position)
+        self.scheduler.resync()
 
-                time.sleep(.25)
+    def probe(self, check, timeout, what):
+        ''' Calls check() with a short backoff until it returns something true, and returns that. '''
+        deadline = time.monotonic() + timeout
+        delay = PROBE_DELAY
+        while True:
+            if self.handle.poll() is not None:
+                raise Exception(f"VLC exited with {self.handle.returncode} before {what}")
+            try:
+                result = check()
+                if result:
+                    return result
+            except Exception as err:
+                logger.debug(f"VLC not {what} yet: {err}")
+            if time.monotonic() >= deadline:
+                raise Exception(f"VLC was not {what} within {timeout}s")
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_PROBE_DELAY)
 
+    def wait_ready(self, timeout=READY_TIMEOUT):
+        ''' Returns as soon as the control interface answers a status request. '''
+        self.probe(self.get_status, timeout, "ready")
+
+    def wait_first_frame(self, timeout=FIRST_FRAME_TIMEOUT):
+        ''' Returns once VLC reports it is playing and its clock has moved past the start. '''
+        def playing():
+            t, _, playing = self.get_clock()
+            return playing and t > 0
+        self.probe(playing, timeout, "playing")
+
+    def monitor(self):
+        self.scheduler = AdSkipScheduler.for_player(self.stream, self.source, self.set_time, self.get_clock)
+        if self.scheduler:
+            self.stream.add_playback_listener(self.playback_renewed)
+            self.scheduler.run(lambda: self.handle.poll() is None)
 
     def send(self, cmd=None, params=None):
         if not self.handle:
@@ -48,7 +105,7 @@ class VLC_Handler():
             for k, v in params.items():
                 target += f"&{k}={v}"
 
-        response = requests.get(target, auth=("", PASSWORD))
+        response = transport.get(target, auth=("", PASSWORD))
         
         if response.ok:
             return ET.fromstring(response.text)
@@ -61,6 +118,20 @@ class VLC_Handler():
             return res.find(target).text
         return res
 
+    def get_clock(self, res=None):
+        ''' Returns (position in ms, rate, playing) from a single status read, or from res if given. '''
+        if res is None:
+            res = self.get_status()
+        length = float(res.findtext("length") or 0)
+        position = float(res.findtext("position") or 0)
+        if length > 0:
+            t = position * length # position is a fraction of length and finer grained than time
+        else:
+            t = float(res.findtext("time") or 0)
+        rate = float(res.findtext("rate") or 1)
+        playing = res.findtext("state") == "playing"
+        return t * 1000, rate, playing
+
     def set_time(self, time):
         cmd = "seek"
         params = {"val": str(time)}